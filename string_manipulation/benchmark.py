@@ -0,0 +1,197 @@
+"""Benchmarks for StringManipulator.
+
+Run from this directory:
+
+    python benchmark.py            # every benchmark
+    python benchmark.py csv        # a single benchmark
+"""
+
+import argparse
+import csv
+import io
+import random
+import time
+import tracemalloc
+
+from solution import _CSV_BLOCK, StringManipulator
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _csv_text(rows, quoted_share):
+    """Build ``rows`` CSV records; ``quoted_share`` of them quote commas, quotes and newlines."""
+    rng = random.Random(0)
+    lines = []
+    for i in range(rows):
+        fields = [str(i), f'user{rng.randrange(10_000)}', f'{rng.random():.6f}', 'status=ok']
+        if rng.random() < quoted_share:
+            fields[3] = '"note, with ""quotes""\nand a second line"'
+        lines.append(','.join(fields))
+    return '\n'.join(lines) + '\n'
+
+
+def bench_csv(rows=200_000):
+    manipulator = StringManipulator()
+    print(f'csv: {rows} records read from a text file in {_CSV_BLOCK // 1024} KiB blocks')
+    print(f'{"quoted":>8} {"MiB":>6} {"csv module (s)":>15} {"parse_csv_stream (s)":>21} {"vs csv":>7}')
+    for quoted_share in (0.0, 0.1, 1.0):
+        text = _csv_text(rows, quoted_share)
+        stdlib_time, want = _timed(lambda: list(csv.reader(io.StringIO(text, newline=''))))
+        stream_time, got = _timed(lambda: list(manipulator.parse_csv_stream(io.StringIO(text, newline=''))))
+        assert got == want
+        print(f'{quoted_share:>8.0%} {len(text) / 2 ** 20:>6.1f} {stdlib_time:>15.4f} '
+              f'{stream_time:>21.4f} {stream_time / stdlib_time:>6.1f}x')
+
+
+def _looped(split, texts, *args):
+    """Flatten per-row lists into (values, offsets) the way a caller would without *_many."""
+    values = []
+    offsets = [0]
+    for text in texts:
+        values.extend(split(text, *args))
+        offsets.append(len(values))
+    return values, offsets
+
+
+def bench_batch(rows=500_000):
+    manipulator = StringManipulator()
+    rng = random.Random(0)
+    words = ['alpha', 'beta', '  gamma', '\tdelta ', 'x', '[id=42]', 'status=ok']
+    spaced = [' '.join(rng.choices(words, k=rng.randrange(1, 6))) for _ in range(rows)]
+    commas = [','.join(rng.choices(words, k=rng.randrange(1, 6))) for _ in range(rows)]
+    cases = [
+        ('normalize_whitespace', lambda: [manipulator.normalize_whitespace(t) for t in spaced],
+         lambda: manipulator.normalize_whitespace_many(spaced)),
+        ('strip_chars', lambda: [manipulator.strip_chars(t, ' \t') for t in spaced],
+         lambda: manipulator.strip_chars_many(spaced, ' \t')),
+        ('extract_between', lambda: [manipulator.extract_between(t, '[', ']') for t in spaced],
+         lambda: manipulator.extract_between_many(spaced, '[', ']')),
+        ('split_words', lambda: _looped(manipulator.split_words, spaced),
+         lambda: manipulator.split_words_many(spaced)),
+        ('split_by_delimiter', lambda: _looped(manipulator.split_by_delimiter, commas, ','),
+         lambda: manipulator.split_by_delimiter_many(commas, ',')),
+        ('chunk_string', lambda: _looped(manipulator.chunk_string, spaced, 4),
+         lambda: manipulator.chunk_string_many(spaced, 4)),
+    ]
+    print(f'batch: {rows} short rows, one call per row vs one *_many call')
+    print(f'{"method":<20} {"loop (s)":>9} {"_many (s)":>10} {"speedup":>8}')
+    for name, loop, batch in cases:
+        loop_time, want = _timed(loop)
+        batch_time, got = _timed(batch)
+        assert got == want
+        print(f'{name:<20} {loop_time:>9.4f} {batch_time:>10.4f} {loop_time / batch_time:>7.1f}x')
+
+
+def _peak(fn):
+    """Return the peak MiB traced while fn runs."""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return peak
+
+
+def bench_iter(words=2_000_000):
+    manipulator = StringManipulator()
+    rng = random.Random(0)
+    text = ' '.join(rng.choices(['alpha', 'beta', 'gamma', 'x', 'status=ok'], k=words))
+    commas = text.replace(' ', ',')
+    print(f'iter: consuming every token of a {len(text) / 2 ** 20:.1f} MiB string')
+    print(f'{"method":<18} {"variant":<14} {"time (s)":>9} {"peak MiB":>9}')
+    cases = [
+        ('split_words', lambda: manipulator.split_words(text),
+         lambda: manipulator.iter_split_words(text),
+         lambda: manipulator.iter_split_words(text, spans=True)),
+        ('split_by_delimiter', lambda: manipulator.split_by_delimiter(commas, ','),
+         lambda: manipulator.iter_split_by_delimiter(commas, ','),
+         lambda: manipulator.iter_split_by_delimiter(commas, ',', spans=True)),
+        ('chunk_string', lambda: manipulator.chunk_string(text, 8),
+         lambda: manipulator.iter_chunk_string(text, 8),
+         lambda: manipulator.iter_chunk_string(text, 8, spans=True)),
+    ]
+    for name, listed, lazy, spans in cases:
+        want = sum(map(len, listed()))
+        for variant, consume in (('list', lambda: sum(map(len, listed()))),
+                                 ('iter', lambda: sum(map(len, lazy()))),
+                                 ('iter spans', lambda: sum(end - start for start, end in spans()))):
+            elapsed, got = _timed(consume)
+            assert got == want
+            print(f'{name:<18} {variant:<14} {elapsed:>9.4f} {_peak(consume):>9.2f}')
+
+
+def bench_spans(lines=300_000):
+    manipulator = StringManipulator()
+    rng = random.Random(0)
+    log = ''.join(f'2024-05-01T12:00:{i % 60:02d} [req-{rng.randrange(10 ** 6)}] GET /api/items '
+                  f'status={rng.choice((200, 404, 500))}\n' for i in range(lines))
+    raw = log.encode()
+    rows = log.splitlines()
+    print(f'spans: request ids from {lines} log lines ({len(raw) / 2 ** 20:.1f} MiB)')
+    print(f'{"variant":<36} {"time (s)":>9} {"peak MiB":>9}')
+    cases = [
+        ('extract_between per line', lambda: [manipulator.extract_between(row, '[', ']') for row in rows]),
+        ('extract_all_between str', lambda: manipulator.extract_all_between(log, '[', ']')),
+        ('extract_all_between str spans', lambda: manipulator.extract_all_between(log, '[', ']', spans=True)),
+        ('extract_all_between bytes spans', lambda: manipulator.extract_all_between(raw, b'[', b']', spans=True)),
+        ('extract_all_between memoryview', lambda: manipulator.extract_all_between(memoryview(raw), b'[', b']')),
+    ]
+    for variant, run in cases:
+        elapsed, found = _timed(run)
+        assert len(found) == lines
+        print(f'{variant:<36} {elapsed:>9.4f} {_peak(run):>9.2f}')
+
+
+def bench_splitter(calls=300_000):
+    manipulator = StringManipulator()
+    rng = random.Random(0)
+    sets = ['+-', ',;', ' \t|']
+    pieces = ['ab', 'cd', 'x', 'efg', '+', '-', ',', ';', ' ', '|']
+    work = [(''.join(rng.choices(pieces, k=rng.randrange(2, 10))), rng.choice(sets)) for _ in range(calls)]
+    splitters = {delimiters: manipulator.compile_splitter(delimiters) for delimiters in sets}
+    # Count the tokens rather than keep them, so the timings are of splitting
+    cases = [
+        ('split_preserve_delimiters', lambda: sum(len(manipulator.split_preserve_delimiters(text, delimiters))
+                                                  for text, delimiters in work)),
+        ('iter_split_preserve_delimiters', lambda: sum(len(list(manipulator.iter_split_preserve_delimiters(
+            text, delimiters))) for text, delimiters in work)),
+        ('compiled once', lambda: sum(len(splitters[delimiters].split(text)) for text, delimiters in work)),
+    ]
+    print(f'splitter: {calls} short texts over {len(sets)} delimiter sets')
+    print(f'{"variant":<32} {"time (s)":>9} {"speedup":>8}')
+    baseline = want = None
+    for variant, run in cases:
+        elapsed, got = _timed(run)
+        if baseline is None:
+            baseline, want = elapsed, got
+        assert got == want
+        print(f'{variant:<32} {elapsed:>9.4f} {baseline / elapsed:>7.1f}x')
+
+
+BENCHMARKS = {
+    'csv': bench_csv,
+    'batch': bench_batch,
+    'iter': bench_iter,
+    'spans': bench_spans,
+    'splitter': bench_splitter,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+                        help=f'one of: {", ".join(BENCHMARKS)} (default: all)')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmark: {", ".join(unknown)}')
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,15 @@ This module contains the StringManipulator class with various string manipulatio
 methods using Python's built-in string methods like split, rsplit, join, partition, etc.
 """
 
+import functools
+import itertools
+import re
+
+try:
+    import numpy
+except ImportError:  # numpy is optional; the batch methods also take lists
+    numpy = None
+
 
 class StringManipulator:
     """A class providing various string manipulation methods."""
@@ -19,7 +28,7 @@ class StringManipulator:
         Returns:
             A list of words
         """
-        pass
+        return text.split()
 
     def split_by_delimiter(self, text: str, delimiter: str) -> list:
         """Split text by a custom delimiter.
@@ -30,8 +39,11 @@ class StringManipulator:
 
         Returns:
             A list of substrings
+
+        Raises:
+            ValueError: If the delimiter is empty
         """
-        pass
+        return text.split(delimiter)
 
     def split_max(self, text: str, delimiter: str, max_splits: int) -> list:
         """Split text by delimiter with a maximum number of splits.
@@ -82,8 +94,11 @@ class StringManipulator:
 
         Returns:
             A tuple of (before, separator, after)
+
+        Raises:
+            ValueError: If the separator is empty
         """
-        pass
+        return tuple(text[begin:stop] for begin, stop in self.partition_spans(text, separator))
 
     def rpartition_text(self, text: str, separator: str) -> tuple:
         """Partition text from the right into three parts: before, separator, after.
@@ -94,8 +109,11 @@ class StringManipulator:
 
         Returns:
             A tuple of (before, separator, after)
+
+        Raises:
+            ValueError: If the separator is empty
         """
-        pass
+        return tuple(text[begin:stop] for begin, stop in self.rpartition_spans(text, separator))
 
     def strip_chars(self, text: str, chars: str) -> str:
         """Strip specific characters from both ends of text.
@@ -107,7 +125,7 @@ class StringManipulator:
         Returns:
             The stripped string
         """
-        pass
+        return text.strip(chars)
 
     def normalize_whitespace(self, text: str) -> str:
         """Normalize whitespace: collapse multiple spaces to single, trim ends.
@@ -118,7 +136,7 @@ class StringManipulator:
         Returns:
             String with normalized whitespace
         """
-        pass
+        return " ".join(text.split())
 
     def extract_between(self, text: str, start: str, end: str) -> str:
         """Extract text between start and end delimiters.
@@ -131,20 +149,58 @@ class StringManipulator:
         Returns:
             The text between delimiters, or empty string if not found
         """
-        pass
+        found = self.find_between_spans(text, start, end)
+        return "" if found is None else text[found[0]:found[1]]
 
     # ==================== HARD METHODS ====================
 
     def parse_csv_line(self, line: str) -> list:
         """Parse a CSV line, handling quoted fields with commas.
 
+        The line goes through the parser behind ``parse_csv_stream``, so
+        fields are read the same way; a trailing line break is allowed.
+
         Args:
             line: A single CSV line
 
         Returns:
             A list of field values
+
+        Raises:
+            ValueError: If the line holds more than one record
         """
-        pass
+        parser = _CsvParser(",", '"')
+        records = parser.feed(line) + parser.close()
+        if len(records) > 1:
+            raise ValueError(f"expected one CSV record, got {len(records)}")
+        return records[0] if records else []
+
+    def parse_csv_stream(self, source, delimiter: str = ",", quote: str = '"'):
+        """Parse CSV records incrementally from a file or an iterable of chunks.
+
+        Chunks may break anywhere, even inside a quoted field or between
+        the ``\\r`` and ``\\n`` of a line break, and a quoted field may span
+        lines.  Only the record being parsed is held in memory.  Fields are
+        read like the ``csv`` module's default dialect: a doubled quote
+        inside a quoted field is a literal quote, and a blank line is an
+        empty record.
+
+        Args:
+            source: A text file (read in blocks) or an iterable of strings
+            delimiter: The single character separating fields
+            quote: The single character quoting fields
+
+        Yields:
+            A list of field values per record
+        """
+        if hasattr(source, "read"):
+            source = iter(functools.partial(source.read, _CSV_BLOCK), "")
+        elif isinstance(source, str):
+            source = (source,)
+        parser = _CsvParser(delimiter, quote)
+        for chunk in source:
+            yield from parser.feed(chunk)
+        yield from parser.close()
 
     def split_preserve_delimiters(self, text: str, delimiters: str) -> list:
         """Split text on any delimiter character but keep the delimiters in result.
@@ -154,20 +210,40 @@ class StringManipulator:
             delimiters: A string of delimiter characters
 
         Returns:
-            A list of substrings including delimiters as separate items
+            A list of substrings including delimiters as separate items;
+            empty runs between adjacent delimiters are skipped
         """
-        pass
+        return _compiled_splitter(delimiters).split(text)
+
+    def compile_splitter(self, delimiters: str) -> "Splitter":
+        """Compile a delimiter set once into a reusable ``split_preserve_delimiters``.
+
+        Compiled splitters are cached, most recently used first, so asking
+        again for the same set returns the same splitter;
+        ``split_preserve_delimiters`` goes through the same cache.  Holding
+        on to the splitter also skips the cache lookup per call.
+
+        Args:
+            delimiters: A string of delimiter characters
+
+        Returns:
+            A Splitter for the delimiters
+        """
+        return _compiled_splitter(delimiters)
 
     def smart_split(self, text: str) -> list:
         """Split on whitespace but keep quoted substrings together.
 
+        A token starting with a double quote runs to the next double quote
+        and is returned without the quotes.
+
         Args:
             text: The input string to split
 
         Returns:
             A list of tokens, with quoted strings preserved as single items
         """
-        pass
+        return [quoted or bare for quoted, bare in _SMART_TOKEN.findall(text)]
 
     def interleave_join(self, list1: list, list2: list) -> str:
         """Interleave two lists and join with spaces.
@@ -190,5 +266,605 @@ class StringManipulator:
 
         Returns:
             A list of string chunks
+
+        Raises:
+            ValueError: If size is less than 1
         """
-        pass
+        if size < 1:
+            raise ValueError(f"chunk size must be at least 1, got {size}")
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    # ==================== BATCH METHODS ====================
+
+    # Each batch method takes a list (or any iterable) of strings, or a 1-D
+    # NumPy string/object array, and does the work of one call per row with
+    # the row loop kept inside C where the standard library allows it.
+    # Split-style methods return columnar results: one flat list of values
+    # plus offsets, where row ``i`` is ``values[offsets[i]:offsets[i + 1]]``.
+    # Given an array, the results are arrays too.
+
+    def normalize_whitespace_many(self, texts):
+        """Normalize the whitespace of every string, as ``normalize_whitespace``.
+
+        Args:
+            texts: The input strings
+
+        Returns:
+            The normalized strings, in input order
+        """
+        rows = _rows(texts)
+        return _column(list(map(" ".join, map(str.split, rows))), texts)
+
+    def strip_chars_many(self, texts, chars: str):
+        """Strip characters from both ends of every string, as ``strip_chars``.
+
+        Args:
+            texts: The input strings
+            chars: Characters to strip from both ends
+
+        Returns:
+            The stripped strings, in input order
+        """
+        rows = _rows(texts)
+        return _column([row.strip(chars) for row in rows], texts)
+
+    def extract_between_many(self, texts, start: str, end: str):
+        """Extract the text between two delimiters in every string, as ``extract_between``.
+
+        The delimiters are compiled into one cached pattern, so each row is
+        a single search instead of two ``find`` calls and a slice.
+
+        Args:
+            texts: The input strings
+            start: The starting delimiter
+            end: The ending delimiter
+
+        Returns:
+            The text between the delimiters per string, or an empty string
+            where they are not found
+        """
+        rows = _rows(texts)
+        search = _between(start, end).search
+        return _column([found[1] if found else "" for found in map(search, rows)], texts)
+
+    def split_words_many(self, texts):
+        """Split every string on whitespace, as ``split_words``.
+
+        Args:
+            texts: The input strings
+
+        Returns:
+            A ``(values, offsets)`` pair: every word, and where each row's words start
+        """
+        values = []
+        offsets = [0]
+        extend, mark = values.extend, offsets.append
+        for row in _rows(texts):
+            extend(row.split())
+            mark(len(values))
+        return _column(values, texts), _offsets(offsets, texts)
+
+    def split_by_delimiter_many(self, texts, delimiter: str):
+        """Split every string on a delimiter, as ``split_by_delimiter``.
+
+        A single-character delimiter cannot match across the boundary of
+        two joined rows, so the rows are joined on it and split once; the
+        offsets come from counting the delimiter per row.  Longer delimiters
+        are split row by row.
+
+        Args:
+            texts: The input strings
+            delimiter: The delimiter to split on
+
+        Returns:
+            A ``(values, offsets)`` pair: every substring, and where each row's substrings start
+
+        Raises:
+            ValueError: If the delimiter is empty
+        """
+        rows = _rows(texts)
+        offsets = [0]
+        if len(delimiter) == 1 and rows:
+            values = delimiter.join(rows).split(delimiter)
+            offsets += itertools.accumulate([row.count(delimiter) + 1 for row in rows])
+        else:
+            values = []
+            extend, mark = values.extend, offsets.append
+            for row in rows:
+                extend(row.split(delimiter))
+                mark(len(values))
+        return _column(values, texts), _offsets(offsets, texts)
+
+    def chunk_string_many(self, texts, size: int):
+        """Split every string into chunks of fixed size, as ``chunk_string``.
+
+        Args:
+            texts: The input strings
+            size: The size of each chunk
+
+        Returns:
+            A ``(values, offsets)`` pair: every chunk, and where each row's chunks start
+
+        Raises:
+            ValueError: If size is less than 1
+        """
+        if size < 1:
+            raise ValueError(f"chunk size must be at least 1, got {size}")
+        rows = _rows(texts)
+        offsets = [0]
+        values = [row[i:i + size] for row in rows for i in range(0, len(row), size)]
+        offsets += itertools.accumulate([-(-len(row) // size) for row in rows])
+        return _column(values, texts), _offsets(offsets, texts)
+
+    # ==================== ITERATOR METHODS ====================
+
+    # Lazy versions of the split-family methods: tokens are produced while
+    # the caller consumes them, at most a block's worth ahead where a block
+    # can be split in C, so a huge input never has its whole token list in
+    # memory at once.  With ``spans=True`` they yield ``(start, end)`` pairs
+    # instead, with ``text[start:end]`` the token, and allocate no substrings.
+
+    def iter_split_words(self, text: str, spans: bool = False):
+        """Iterate over the words of text (split on whitespace).
+
+        Args:
+            text: The input string to split
+            spans: Yield ``(start, end)`` offsets instead of words
+
+        Yields:
+            Each word, or its span
+        """
+        if spans:
+            yield from map(re.Match.span, _WORD.finditer(text))
+            return
+        start = 0
+        while start < len(text):
+            space = _SPACE.search(text, start + _SPLIT_BLOCK)
+            end = space.start() if space else len(text)
+            yield from text[start:end].split()
+            start = end
+
+    def iter_split_by_delimiter(self, text: str, delimiter: str, spans: bool = False):
+        """Iterate over the substrings of text between delimiters.
+
+        Args:
+            text: The input string to split
+            delimiter: The delimiter to split on
+            spans: Yield ``(start, end)`` offsets instead of substrings
+
+        Yields:
+            Each substring, or its span, as ``split_by_delimiter`` lists them
+
+        Raises:
+            ValueError: If the delimiter is empty
+        """
+        if not delimiter:
+            raise ValueError("empty separator")
+        find = text.find
+        start = 0
+        if len(delimiter) == 1 and not spans:
+            # A single character cannot overlap another match, so splitting
+            # a block at a time finds the same delimiters
+            end = find(delimiter, _SPLIT_BLOCK)
+            while end != -1:
+                yield from text[start:end].split(delimiter)
+                start = end + 1
+                end = find(delimiter, start + _SPLIT_BLOCK)
+            yield from text[start:].split(delimiter)
+            return
+        end = find(delimiter)
+        while end != -1:
+            yield (start, end) if spans else text[start:end]
+            start = end + len(delimiter)
+            end = find(delimiter, start)
+        yield (start, len(text)) if spans else text[start:]
+
+    def iter_split_preserve_delimiters(self, text: str, delimiters: str, spans: bool = False):
+        """Iterate over the pieces of text split on delimiter characters, delimiters included.
+
+        Each delimiter character is its own token; the runs of text between
+        them are tokens too, and empty runs are skipped.
+
+        Args:
+            text: The input string to split
+            delimiters: A string of delimiter characters
+            spans: Yield ``(start, end)`` offsets instead of tokens
+
+        Yields:
+            Each token, or its span
+        """
+        yield from map(_span_or_text(spans), _delimiter_tokens(delimiters).finditer(text))
+
+    def iter_smart_split(self, text: str, spans: bool = False):
+        """Iterate over the whitespace-separated tokens of text, keeping quoted substrings together.
+
+        Tokens are those ``smart_split`` returns.
+
+        Args:
+            text: The input string to split
+            spans: Yield ``(start, end)`` offsets instead of tokens
+
+        Yields:
+            Each token, or its span (inside the quotes for a quoted token)
+        """
+        for match in _SMART_TOKEN.finditer(text):
+            yield match.span(match.lastindex) if spans else match[match.lastindex]
+
+    def iter_chunk_string(self, text: str, size: int, spans: bool = False):
+        """Iterate over fixed-size chunks of text.
+
+        Args:
+            text: The input string to chunk
+            size: The size of each chunk
+            spans: Yield ``(start, end)`` offsets instead of chunks
+
+        Yields:
+            Each chunk, or its span; the last one may be shorter
+
+        Raises:
+            ValueError: If size is less than 1
+        """
+        if size < 1:
+            raise ValueError(f"chunk size must be at least 1, got {size}")
+        if spans:
+            for start in range(0, len(text), size):
+                yield start, min(start + size, len(text))
+            return
+        step = size * max(1, _SPLIT_BLOCK // size)
+        for offset in range(0, len(text), step):
+            block = text[offset:offset + step]
+            yield from [block[start:start + size] for start in range(0, len(block), size)]
+
+    # ==================== SPAN METHODS ====================
+
+    # Position-returning versions of the extract and partition methods.  They
+    # take a str, or bytes, a bytearray or a byte memoryview with bytes
+    # delimiters, and only search it: a memoryview has no find method, so it
+    # is searched with a compiled pattern, which reads the buffer in place.
+
+    def find_between_spans(self, text, start, end):
+        """Find where the text between start and end delimiters lies.
+
+        Args:
+            text: The input to search
+            start: The starting delimiter
+            end: The ending delimiter
+
+        Returns:
+            A ``(begin, stop)`` tuple with ``text[begin:stop]`` what
+            ``extract_between`` returns, or None if not found
+        """
+        find = _finder(text)
+        begin = find(start, 0)
+        if begin == -1:
+            return None
+        begin += len(start)
+        stop = find(end, begin)
+        return None if stop == -1 else (begin, stop)
+
+    def extract_all_between(self, text, start, end, spans: bool = False) -> list:
+        """Extract the text between every start delimiter and the end delimiter after it.
+
+        The input is scanned once, left to right; each search resumes after
+        the previous end delimiter.  For a memoryview the values are
+        memoryview slices, not copies.
+
+        Args:
+            text: The input to search
+            start: The starting delimiter
+            end: The ending delimiter
+            spans: Return ``(begin, stop)`` tuples instead of the text
+
+        Returns:
+            A list of the text between each pair of delimiters, or its span
+
+        Raises:
+            ValueError: If either delimiter is empty
+        """
+        if not start or not end:
+            raise ValueError("empty delimiter")
+        find = _finder(text)
+        found = []
+        begin = find(start, 0)
+        while begin != -1:
+            begin += len(start)
+            stop = find(end, begin)
+            if stop == -1:
+                break
+            found.append((begin, stop) if spans else text[begin:stop])
+            begin = find(start, stop + len(end))
+        return found
+
+    def partition_spans(self, text, separator) -> tuple:
+        """Partition text at the first separator, as ``partition_text``, returning spans.
+
+        Args:
+            text: The input to partition
+            separator: The separator to partition on (first occurrence)
+
+        Returns:
+            A tuple of the ``(begin, stop)`` spans of before, separator and
+            after; if the separator is not found, before spans all of text
+
+        Raises:
+            ValueError: If the separator is empty
+        """
+        if not separator:
+            raise ValueError("empty separator")
+        size = len(text)
+        begin = _finder(text)(separator, 0)
+        if begin == -1:
+            return (0, size), (size, size), (size, size)
+        stop = begin + len(separator)
+        return (0, begin), (begin, stop), (stop, size)
+
+    def rpartition_spans(self, text, separator) -> tuple:
+        """Partition text at the last separator, as ``rpartition_text``, returning spans.
+
+        Args:
+            text: The input to partition
+            separator: The separator to partition on (last occurrence)
+
+        Returns:
+            A tuple of the ``(begin, stop)`` spans of before, separator and
+            after; if the separator is not found, after spans all of text
+
+        Raises:
+            ValueError: If the separator is empty
+        """
+        if not separator:
+            raise ValueError("empty separator")
+        size = len(text)
+        if isinstance(text, memoryview):
+            last = _last_occurrence(bytes(separator)).match(text)
+            begin = -1 if last is None else last.start(1)
+        else:
+            begin = text.rfind(separator)
+        if begin == -1:
+            return (0, 0), (0, 0), (0, size)
+        stop = begin + len(separator)
+        return (0, begin), (begin, stop), (stop, size)
+
+
+# Characters read from a file per block by parse_csv_stream
+_CSV_BLOCK = 64 * 1024
+
+# _CsvParser states
+_RECORD, _FIELD, _UNQUOTED, _QUOTED, _CLOSING = range(5)
+
+
+class _CsvParser:
+    """The state machine behind ``parse_csv_stream``, fed one chunk at a time.
+
+    Complete lines without quotes are split with ``str.split``, a run of
+    them at a time.  Anything else is scanned field by field, jumping to
+    the next delimiter, line break or quote with ``find`` or a compiled
+    pattern, so a field is never walked character by character.
+    ``pieces`` collects the field being read, ``fields`` the finished
+    fields of the record being read.
+    """
+
+    def __init__(self, delimiter: str, quote: str):
+        if len(delimiter) != 1 or len(quote) != 1 or delimiter == quote:
+            raise ValueError("delimiter and quote must be two different characters")
+        if delimiter in "\r\n" or quote in "\r\n":
+            raise ValueError("delimiter and quote cannot be line breaks")
+        self.delimiter = delimiter
+        self.quote = quote
+        self.field_end = re.compile(f"[{re.escape(delimiter)}\r\n]")
+        self.fields = []
+        self.pieces = []
+        self.state = _RECORD
+        # A record ended on \r, so a \n opening the next chunk belongs to it
+        self.after_cr = False
+
+    def feed(self, chunk: str) -> list:
+        """Parse ``chunk`` and return the records it completes."""
+        records = []
+        pos, size = 0, len(chunk)
+        while pos < size:
+            if self.state == _RECORD:
+                if self.after_cr:
+                    self.after_cr = False
+                    if chunk[pos] == "\n":
+                        pos += 1
+                        continue
+                # Complete lines before the next quote are split all at once
+                quote = chunk.find(self.quote, pos)
+                end = chunk.rfind("\n", pos, size if quote < 0 else quote)
+                if end >= 0:
+                    block = chunk[pos:end + 1]
+                    if "\r" in block:
+                        block = block.replace("\r\n", "\n")
+                    if "\r" not in block:
+                        delimiter = self.delimiter
+                        records.extend([line.split(delimiter) if line else []
+                                        for line in block[:-1].split("\n")])
+                        pos = end + 1
+                        continue
+            pos = self._step(chunk, pos, records)
+        return records
+
+    def close(self) -> list:
+        """Return the last record if the input did not end with a line break."""
+        if self.state == _RECORD:
+            return []
+        self.fields.append("".join(self.pieces))
+        record, self.fields, self.pieces = self.fields, [], []
+        self.state = _RECORD
+        return [record]
+
+    def _step(self, chunk: str, pos: int, records: list) -> int:
+        """Make one transition from ``chunk[pos]`` and return the next position."""
+        state = self.state
+        if state == _RECORD or state == _FIELD:
+            char = chunk[pos]
+            if char == self.quote:
+                self.state = _QUOTED
+                return pos + 1
+            if state == _RECORD and char in "\r\n":
+                records.append([])
+                self.after_cr = char == "\r"
+                return pos + 1
+            self.state = _UNQUOTED
+            return pos
+
+        if state == _UNQUOTED:
+            found = self.field_end.search(chunk, pos)
+            if found is None:
+                self.pieces.append(chunk[pos:])
+                return len(chunk)
+            end = found.start()
+            self.pieces.append(chunk[pos:end])
+            self.fields.append("".join(self.pieces))
+            self.pieces = []
+            char = chunk[end]
+            if char == self.delimiter:
+                self.state = _FIELD
+            else:
+                records.append(self.fields)
+                self.fields = []
+                self.state = _RECORD
+                self.after_cr = char == "\r"
+            return end + 1
+
+        if state == _QUOTED:
+            end = chunk.find(self.quote, pos)
+            if end < 0:
+                self.pieces.append(chunk[pos:])
+                return len(chunk)
+            self.pieces.append(chunk[pos:end])
+            self.state = _CLOSING
+            return end + 1
+
+        # A quote inside a quoted field: doubled, or closing the quotes.
+        # Like csv, text between a closing quote and the delimiter is kept.
+        if chunk[pos] == self.quote:
+            self.pieces.append(self.quote)
+            self.state = _QUOTED
+            return pos + 1
+        self.state = _UNQUOTED
+        return pos
+
+
+def _rows(texts) -> list:
+    """Return batch input as a list of strings, converting a NumPy array."""
+    if numpy is not None and isinstance(texts, numpy.ndarray):
+        return texts.tolist()
+    return texts if isinstance(texts, list) else list(texts)
+
+
+def _column(values: list, texts):
+    """Return batch results as an array if the input was one."""
+    if numpy is not None and isinstance(texts, numpy.ndarray):
+        return numpy.array(values, dtype=object if texts.dtype == object else str)
+    return values
+
+
+def _offsets(offsets: list, texts):
+    """Return batch row offsets as an int64 array if the input was one."""
+    if numpy is not None and isinstance(texts, numpy.ndarray):
+        return numpy.array(offsets, dtype=numpy.int64)
+    return offsets
+
+
+@functools.lru_cache(maxsize=64)
+def _between(start: str, end: str):
+    """Compile the pattern extract_between_many searches for a pair of delimiters."""
+    return re.compile(re.escape(start) + "(.*?)" + re.escape(end), re.DOTALL)
+
+
+# Characters the iterator methods split at a time when yielding text
+_SPLIT_BLOCK = 64 * 1024
+
+# A word and a whitespace character for iter_split_words, and a quoted or
+# bare token for smart_split and iter_smart_split
+_WORD = re.compile(r"\S+")
+_SPACE = re.compile(r"\s")
+_SMART_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _span_or_text(spans: bool):
+    """Return what the iterator methods yield per match: its span or its text."""
+    return re.Match.span if spans else re.Match.group
+
+
+@functools.lru_cache(maxsize=64)
+def _delimiter_tokens(delimiters: str):
+    """Compile the pattern matching one delimiter or a run of anything else."""
+    if not delimiters:
+        return re.compile(r".+", re.DOTALL)
+    escaped = re.escape(delimiters)
+    return re.compile(f"[{escaped}]|[^{escaped}]+")
+
+
+def _finder(text):
+    """Return a ``find(sub, start)`` for text, searching a memoryview in place."""
+    if not isinstance(text, memoryview):
+        return text.find
+
+    def find(sub, start):
+        found = _occurrence(bytes(sub)).search(text, start)
+        return -1 if found is None else found.start()
+    return find
+
+
+@functools.lru_cache(maxsize=64)
+def _occurrence(sub: bytes):
+    """Compile the pattern matching sub literally."""
+    return re.compile(re.escape(sub))
+
+
+@functools.lru_cache(maxsize=64)
+def _last_occurrence(sub: bytes):
+    """Compile the pattern whose group 1 is the last occurrence of sub."""
+    return re.compile(b"(?s).*(" + re.escape(sub) + b")")
+
+
+class Splitter:
+    """Splits text on a fixed set of delimiter characters, keeping the delimiters.
+
+    Returned by ``StringManipulator.compile_splitter``.  The delimiter set
+    is compiled into a character-class pattern once, so each split is a
+    single pass in C with nothing re-interpreted per call.
+    """
+
+    __slots__ = ("delimiters", "_tokens", "_findall")
+
+    def __init__(self, delimiters: str):
+        self.delimiters = delimiters
+        self._tokens = _delimiter_tokens(delimiters)
+        self._findall = self._tokens.findall
+
+    def __repr__(self):
+        return f"Splitter({self.delimiters!r})"
+
+    def split(self, text: str) -> list:
+        """Split text on any delimiter character but keep the delimiters in result.
+
+        Args:
+            text: The input string to split
+
+        Returns:
+            A list of substrings including delimiters as separate items;
+            empty runs between adjacent delimiters are skipped
+        """
+        return self._findall(text)
+
+    def iter_split(self, text: str, spans: bool = False):
+        """Iterate over the pieces ``split`` returns.
+
+        Args:
+            text: The input string to split
+            spans: Yield ``(start, end)`` offsets instead of tokens
+
+        Yields:
+            Each token, or its span
+        """
+        yield from map(_span_or_text(spans), self._tokens.finditer(text))
+
+
+@functools.lru_cache(maxsize=128)
+def _compiled_splitter(delimiters: str) -> Splitter:
+    """Return the cached Splitter for a delimiter set."""
+    return Splitter(delimiters)
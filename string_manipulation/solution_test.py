@@ -1,5 +1,8 @@
 """Tests for StringManipulator class."""
 
+import io
+import itertools
+
 import pytest
 from solution import StringManipulator
 
@@ -203,6 +206,65 @@ class TestParseCsvLine:
     def test_all_quoted(self, manipulator):
         assert manipulator.parse_csv_line('"hello","world"') == ["hello", "world"]
 
+    def test_escaped_quote_and_empty_fields(self, manipulator):
+        assert manipulator.parse_csv_line('"say ""hi""",,x,') == ['say "hi"', "", "x", ""]
+
+    def test_trailing_line_break(self, manipulator):
+        assert manipulator.parse_csv_line("a,b\r\n") == ["a", "b"]
+        assert manipulator.parse_csv_line("") == []
+
+    def test_matches_stream(self, manipulator):
+        line = 'x,"a\nb",y'
+        assert [manipulator.parse_csv_line(line)] == list(manipulator.parse_csv_stream(line))
+
+    def test_more_than_one_record(self, manipulator):
+        with pytest.raises(ValueError):
+            manipulator.parse_csv_line("a\nb")
+
+
+class TestParseCsvStream:
+    """Tests for parse_csv_stream method."""
+
+    def test_lines(self, manipulator):
+        rows = manipulator.parse_csv_stream(["a,b\n", "c,d\n"])
+        assert list(rows) == [["a", "b"], ["c", "d"]]
+
+    def test_quoted_field_across_chunks(self, manipulator):
+        rows = manipulator.parse_csv_stream(['a,"b', ',c",d\ne', ",f"])
+        assert list(rows) == [["a", "b,c", "d"], ["e", "f"]]
+
+    def test_quoted_newline(self, manipulator):
+        rows = manipulator.parse_csv_stream(['1,"line one\n', 'line two"\n2,x\n'])
+        assert list(rows) == [["1", "line one\nline two"], ["2", "x"]]
+
+    def test_escaped_quote_across_chunks(self, manipulator):
+        rows = manipulator.parse_csv_stream(['"say ""hi"', '""\n'])
+        assert list(rows) == [['say "hi"']]
+
+    def test_crlf_across_chunks(self, manipulator):
+        rows = manipulator.parse_csv_stream(["a,b\r", "\nc\r\n"])
+        assert list(rows) == [["a", "b"], ["c"]]
+
+    def test_blank_lines_and_empty_fields(self, manipulator):
+        rows = manipulator.parse_csv_stream("a,\n\n,b")
+        assert list(rows) == [["a", ""], [], ["", "b"]]
+
+    def test_custom_delimiter_and_quote(self, manipulator):
+        rows = manipulator.parse_csv_stream(["x;'a;b';'it''s'\n"], delimiter=";", quote="'")
+        assert list(rows) == [["x", "a;b", "it's"]]
+
+    def test_file_object(self, manipulator):
+        source = io.StringIO('id,name\n1,"Smith, J"\n')
+        assert list(manipulator.parse_csv_stream(source)) == [["id", "name"], ["1", "Smith, J"]]
+
+    def test_lazy(self, manipulator):
+        rows = manipulator.parse_csv_stream(itertools.repeat("a,b\n"))
+        assert list(itertools.islice(rows, 3)) == [["a", "b"]] * 3
+
+    def test_invalid_delimiter(self, manipulator):
+        with pytest.raises(ValueError):
+            list(manipulator.parse_csv_stream(["a"], delimiter="\n"))
+
 
 class TestSplitPreserveDelimiters:
     """Tests for split_preserve_delimiters method."""
@@ -216,6 +278,10 @@ class TestSplitPreserveDelimiters:
     def test_no_delimiters_found(self, manipulator):
         assert manipulator.split_preserve_delimiters("abc", ",") == ["abc"]
 
+    def test_matches_compiled_splitter(self, manipulator):
+        text = ",a,,b-"
+        assert manipulator.split_preserve_delimiters(text, ",-") == manipulator.compile_splitter(",-").split(text)
+
 
 class TestSmartSplit:
     """Tests for smart_split method."""
@@ -254,3 +320,352 @@ class TestChunkString:
 
     def test_chunk_larger_than_string(self, manipulator):
         assert manipulator.chunk_string("abc", 10) == ["abc"]
+
+
+# ==================== BATCH METHOD TESTS ====================
+
+class TestNormalizeWhitespaceMany:
+    """Tests for normalize_whitespace_many method."""
+
+    def test_each_row_normalized(self, manipulator):
+        assert manipulator.normalize_whitespace_many(["  a   b ", "c\t\td", ""]) == ["a b", "c d", ""]
+
+    def test_accepts_iterable(self, manipulator):
+        assert manipulator.normalize_whitespace_many(iter([" x "])) == ["x"]
+
+    def test_numpy_array(self, manipulator):
+        numpy = pytest.importorskip("numpy")
+        result = manipulator.normalize_whitespace_many(numpy.array(["  a   b ", "c"]))
+        assert result.tolist() == ["a b", "c"]
+
+
+class TestStripCharsMany:
+    """Tests for strip_chars_many method."""
+
+    def test_each_row_stripped(self, manipulator):
+        assert manipulator.strip_chars_many(["..a..", "xb", "..."], ".x") == ["a", "b", ""]
+
+
+class TestExtractBetweenMany:
+    """Tests for extract_between_many method."""
+
+    def test_each_row_extracted(self, manipulator):
+        texts = ["a [b] c", "<x>", "[no end", "[first] [second]"]
+        assert manipulator.extract_between_many(texts, "[", "]") == ["b", "", "", "first"]
+
+    def test_multichar_delimiters(self, manipulator):
+        assert manipulator.extract_between_many(["<div>x\ny</div>"], "<div>", "</div>") == ["x\ny"]
+
+    def test_delimiters_taken_literally(self, manipulator):
+        assert manipulator.extract_between_many(["a.*b(c)d"], ".*", "d") == ["b(c)"]
+
+
+class TestSplitWordsMany:
+    """Tests for split_words_many method."""
+
+    def test_values_and_offsets(self, manipulator):
+        assert manipulator.split_words_many(["a b", "", "  c  "]) == (["a", "b", "c"], [0, 2, 2, 3])
+
+    def test_empty_batch(self, manipulator):
+        assert manipulator.split_words_many([]) == ([], [0])
+
+
+class TestSplitByDelimiterMany:
+    """Tests for split_by_delimiter_many method."""
+
+    def test_values_and_offsets(self, manipulator):
+        values, offsets = manipulator.split_by_delimiter_many(["a,b", "", "c,,d"], ",")
+        assert (values, offsets) == (["a", "b", "", "c", "", "d"], [0, 2, 3, 6])
+
+    def test_rows_match_split(self, manipulator):
+        texts = ["x::y", ":", "::z::", "plain"]
+        values, offsets = manipulator.split_by_delimiter_many(texts, ":")
+        assert [values[i:j] for i, j in itertools.pairwise(offsets)] == [t.split(":") for t in texts]
+
+    def test_multichar_delimiter_not_matched_across_rows(self, manipulator):
+        values, offsets = manipulator.split_by_delimiter_many(["a:", ":b"], "::")
+        assert (values, offsets) == (["a:", ":b"], [0, 1, 2])
+
+    def test_empty_batch(self, manipulator):
+        assert manipulator.split_by_delimiter_many([], ",") == ([], [0])
+
+    def test_empty_delimiter(self, manipulator):
+        with pytest.raises(ValueError):
+            manipulator.split_by_delimiter_many(["a"], "")
+
+    def test_numpy_array(self, manipulator):
+        numpy = pytest.importorskip("numpy")
+        values, offsets = manipulator.split_by_delimiter_many(numpy.array(["a,b", "c"], dtype=object), ",")
+        assert values.tolist() == ["a", "b", "c"]
+        assert offsets.dtype == numpy.int64 and offsets.tolist() == [0, 2, 3]
+
+
+class TestChunkStringMany:
+    """Tests for chunk_string_many method."""
+
+    def test_values_and_offsets(self, manipulator):
+        assert manipulator.chunk_string_many(["abcde", "", "xy"], 2) == (["ab", "cd", "e", "xy"], [0, 3, 3, 4])
+
+    def test_size_below_one(self, manipulator):
+        with pytest.raises(ValueError):
+            manipulator.chunk_string_many(["abc"], 0)
+
+
+BATCH_ROWS = ["", "  a \t b\n", "x\u3000y\x0bz", "[a] [b]", "[[x]]", "a]b[c", "<<x>>", ",,a,,",
+              "a,b,,c", "no delimiters", " ".join("abc" * 50)]
+
+
+class TestManyMatchesRowMethods:
+    """Each *_many row is what the row method returns."""
+
+    @staticmethod
+    def _rows(values, offsets):
+        return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def test_normalize_whitespace(self, manipulator):
+        assert manipulator.normalize_whitespace_many(BATCH_ROWS) == [
+            manipulator.normalize_whitespace(row) for row in BATCH_ROWS]
+
+    @pytest.mark.parametrize("chars", [" \t\n", "[]", "<>,", "a"])
+    def test_strip_chars(self, manipulator, chars):
+        assert manipulator.strip_chars_many(BATCH_ROWS, chars) == [
+            manipulator.strip_chars(row, chars) for row in BATCH_ROWS]
+
+    @pytest.mark.parametrize("start, end", [("[", "]"), ("<<", ">>"), ("<", ">"), ("a", "a"), (",", ",")])
+    def test_extract_between(self, manipulator, start, end):
+        assert manipulator.extract_between_many(BATCH_ROWS, start, end) == [
+            manipulator.extract_between(row, start, end) for row in BATCH_ROWS]
+
+    def test_split_words(self, manipulator):
+        assert self._rows(*manipulator.split_words_many(BATCH_ROWS)) == [
+            manipulator.split_words(row) for row in BATCH_ROWS]
+
+    @pytest.mark.parametrize("delimiter", [",", ",,", " ", "]["])
+    def test_split_by_delimiter(self, manipulator, delimiter):
+        assert self._rows(*manipulator.split_by_delimiter_many(BATCH_ROWS, delimiter)) == [
+            manipulator.split_by_delimiter(row, delimiter) for row in BATCH_ROWS]
+
+    @pytest.mark.parametrize("size", [1, 2, 7, 1000])
+    def test_chunk_string(self, manipulator, size):
+        assert self._rows(*manipulator.chunk_string_many(BATCH_ROWS, size)) == [
+            manipulator.chunk_string(row, size) for row in BATCH_ROWS]
+
+
+# ==================== ITERATOR METHOD TESTS ====================
+
+class TestIterSplitWords:
+    """Tests for iter_split_words method."""
+
+    def test_is_lazy(self, manipulator):
+        tokens = manipulator.iter_split_words("hello world")
+        assert next(tokens) == "hello"
+
+    def test_words(self, manipulator):
+        assert list(manipulator.iter_split_words("  hello \t world  ")) == ["hello", "world"]
+
+    def test_spans(self, manipulator):
+        assert list(manipulator.iter_split_words(" ab  c", spans=True)) == [(1, 3), (5, 6)]
+
+    def test_empty_string(self, manipulator):
+        assert list(manipulator.iter_split_words("")) == []
+
+
+class TestIterSplitByDelimiter:
+    """Tests for iter_split_by_delimiter method."""
+
+    def test_matches_split(self, manipulator):
+        assert list(manipulator.iter_split_by_delimiter("a::b::::c::", "::")) == "a::b::::c::".split("::")
+
+    def test_spans(self, manipulator):
+        assert list(manipulator.iter_split_by_delimiter("a,,bc", ",", spans=True)) == [(0, 1), (2, 2), (3, 5)]
+
+    def test_no_delimiter_found(self, manipulator):
+        assert list(manipulator.iter_split_by_delimiter("abc", ",")) == ["abc"]
+
+    def test_empty_delimiter(self, manipulator):
+        with pytest.raises(ValueError):
+            list(manipulator.iter_split_by_delimiter("abc", ""))
+
+
+class TestIterSplitPreserveDelimiters:
+    """Tests for iter_split_preserve_delimiters method."""
+
+    def test_delimiters_kept(self, manipulator):
+        assert list(manipulator.iter_split_preserve_delimiters("a+b-c", "+-")) == ["a", "+", "b", "-", "c"]
+
+    def test_adjacent_delimiters(self, manipulator):
+        assert list(manipulator.iter_split_preserve_delimiters("-a,,b", ",-")) == ["-", "a", ",", ",", "b"]
+
+    def test_regex_characters_taken_literally(self, manipulator):
+        assert list(manipulator.iter_split_preserve_delimiters("a]b^c", "]^")) == ["a", "]", "b", "^", "c"]
+
+    def test_spans(self, manipulator):
+        assert list(manipulator.iter_split_preserve_delimiters("ab,c", ",", spans=True)) == [(0, 2), (2, 3), (3, 4)]
+
+
+class TestIterSmartSplit:
+    """Tests for iter_smart_split method."""
+
+    def test_quoted_string(self, manipulator):
+        assert list(manipulator.iter_smart_split('hello "big world" there')) == ["hello", "big world", "there"]
+
+    def test_spans_exclude_quotes(self, manipulator):
+        assert list(manipulator.iter_smart_split('a "b c"', spans=True)) == [(0, 1), (3, 6)]
+
+
+class TestIterChunkString:
+    """Tests for iter_chunk_string method."""
+
+    def test_uneven_chunks(self, manipulator):
+        assert list(manipulator.iter_chunk_string("abcdefg", 3)) == ["abc", "def", "g"]
+
+    def test_spans(self, manipulator):
+        assert list(manipulator.iter_chunk_string("abcde", 2, spans=True)) == [(0, 2), (2, 4), (4, 5)]
+
+    def test_size_below_one(self, manipulator):
+        with pytest.raises(ValueError):
+            list(manipulator.iter_chunk_string("abc", 0))
+
+
+# Long enough to cross the blocks the iterators split at a time
+ITER_TEXTS = ["", "   ", "one", '  a "b c" d\t"e" ""  f"g h" ', "x,,y,", " ".join(map(str, range(40_000))),
+              ",".join(["ab", "", "c d"] * 20_000)]
+
+
+class TestIterMatchesListMethods:
+    """Each iter_* generator yields what the list method returns."""
+
+    @pytest.mark.parametrize("text", ITER_TEXTS)
+    def test_split_words(self, manipulator, text):
+        assert list(manipulator.iter_split_words(text)) == manipulator.split_words(text)
+
+    @pytest.mark.parametrize("text", ITER_TEXTS)
+    @pytest.mark.parametrize("delimiter", [",", " ", ",,"])
+    def test_split_by_delimiter(self, manipulator, text, delimiter):
+        assert list(manipulator.iter_split_by_delimiter(text, delimiter)) == manipulator.split_by_delimiter(
+            text, delimiter)
+
+    @pytest.mark.parametrize("text", ITER_TEXTS)
+    def test_split_preserve_delimiters(self, manipulator, text):
+        assert list(manipulator.iter_split_preserve_delimiters(text, ", ")) == (
+            manipulator.split_preserve_delimiters(text, ", "))
+
+    @pytest.mark.parametrize("text", ITER_TEXTS)
+    def test_smart_split(self, manipulator, text):
+        assert list(manipulator.iter_smart_split(text)) == manipulator.smart_split(text)
+
+    @pytest.mark.parametrize("text", ITER_TEXTS)
+    @pytest.mark.parametrize("size", [1, 3, 4096])
+    def test_chunk_string(self, manipulator, text, size):
+        assert list(manipulator.iter_chunk_string(text, size)) == manipulator.chunk_string(text, size)
+
+
+# ==================== SPAN METHOD TESTS ====================
+
+class TestFindBetweenSpans:
+    """Tests for find_between_spans method."""
+
+    def test_span_of_extracted_text(self, manipulator):
+        assert manipulator.find_between_spans("hello [world] there", "[", "]") == (7, 12)
+
+    def test_not_found(self, manipulator):
+        assert manipulator.find_between_spans("hello [world", "[", "]") is None
+
+    def test_bytes(self, manipulator):
+        assert manipulator.find_between_spans(b"<div>x</div>", b"<div>", b"</div>") == (5, 6)
+
+    def test_memoryview_slice(self, manipulator):
+        view = memoryview(b"[skip] [keep]")[6:]
+        assert manipulator.find_between_spans(view, b"[", b"]") == (2, 6)
+
+    @pytest.mark.parametrize("text", ["a [b] [c]", "[[x]]", "]a[", "[", "<<>>"])
+    def test_matches_extract_between(self, manipulator, text):
+        found = manipulator.find_between_spans(text, "[", "]")
+        assert manipulator.extract_between(text, "[", "]") == ("" if found is None else text[found[0]:found[1]])
+
+
+class TestExtractAllBetween:
+    """Tests for extract_all_between method."""
+
+    def test_every_occurrence(self, manipulator):
+        assert manipulator.extract_all_between("[a] b [c] [d", "[", "]") == ["a", "c"]
+
+    def test_spans(self, manipulator):
+        assert manipulator.extract_all_between("[a] [bc]", "[", "]", spans=True) == [(1, 2), (5, 7)]
+
+    def test_resumes_after_end_delimiter(self, manipulator):
+        assert manipulator.extract_all_between("<a<b>c>", "<", ">") == ["a<b"]
+
+    def test_memoryview_values_are_views(self, manipulator):
+        found = manipulator.extract_all_between(memoryview(b"k=[1] v=[22]"), b"[", b"]")
+        assert [bytes(view) for view in found] == [b"1", b"22"]
+        assert all(isinstance(view, memoryview) for view in found)
+
+    def test_empty_delimiter(self, manipulator):
+        with pytest.raises(ValueError):
+            manipulator.extract_all_between("abc", "", "]")
+
+
+class TestPartitionSpans:
+    """Tests for partition_spans method."""
+
+    def test_first_separator(self, manipulator):
+        assert manipulator.partition_spans("a=b=c", "=") == ((0, 1), (1, 2), (2, 5))
+
+    def test_separator_not_found(self, manipulator):
+        assert manipulator.partition_spans("abc", "=") == ((0, 3), (3, 3), (3, 3))
+
+    def test_memoryview(self, manipulator):
+        assert manipulator.partition_spans(memoryview(b"key: value"), b": ") == ((0, 3), (3, 5), (5, 10))
+
+    @pytest.mark.parametrize("text", ["a=b=c", "abc", "=", "", "a==b"])
+    def test_matches_partition_text(self, manipulator, text):
+        spans = manipulator.partition_spans(text, "==")
+        assert manipulator.partition_text(text, "==") == tuple(text[begin:stop] for begin, stop in spans)
+        assert manipulator.partition_text(text, "=") == text.partition("=")
+
+
+class TestRpartitionSpans:
+    """Tests for rpartition_spans method."""
+
+    def test_last_separator(self, manipulator):
+        assert manipulator.rpartition_spans("a=b=c", "=") == ((0, 3), (3, 4), (4, 5))
+
+    def test_separator_not_found(self, manipulator):
+        assert manipulator.rpartition_spans("abc", "=") == ((0, 0), (0, 0), (0, 3))
+
+    def test_memoryview(self, manipulator):
+        assert manipulator.rpartition_spans(memoryview(b"a/b/c"), b"/") == ((0, 3), (3, 4), (4, 5))
+
+    @pytest.mark.parametrize("text", ["a=b=c", "abc", "=", "", "a==b"])
+    def test_matches_rpartition_text(self, manipulator, text):
+        spans = manipulator.rpartition_spans(text, "==")
+        assert manipulator.rpartition_text(text, "==") == tuple(text[begin:stop] for begin, stop in spans)
+        assert manipulator.rpartition_text(text, "=") == text.rpartition("=")
+
+
+# ==================== COMPILED SPLITTER TESTS ====================
+
+class TestCompileSplitter:
+    """Tests for compile_splitter method."""
+
+    def test_split(self, manipulator):
+        assert manipulator.compile_splitter("+-").split("a+b-c") == ["a", "+", "b", "-", "c"]
+
+    def test_reusable(self, manipulator):
+        splitter = manipulator.compile_splitter(",")
+        assert [splitter.split(text) for text in ("a,b", "c")] == [["a", ",", "b"], ["c"]]
+
+    def test_cached(self, manipulator):
+        assert manipulator.compile_splitter(";:") is StringManipulator().compile_splitter(";:")
+
+    def test_regex_characters_taken_literally(self, manipulator):
+        assert manipulator.compile_splitter("]\\").split("a]b\\c") == ["a", "]", "b", "\\", "c"]
+
+    def test_matches_iter_split_preserve_delimiters(self, manipulator):
+        text = ",a,,b-"
+        want = list(manipulator.iter_split_preserve_delimiters(text, ",-"))
+        assert manipulator.compile_splitter(",-").split(text) == want
+
+    def test_iter_split_spans(self, manipulator):
+        assert list(manipulator.compile_splitter(",").iter_split("ab,c", spans=True)) == [(0, 2), (2, 3), (3, 4)]
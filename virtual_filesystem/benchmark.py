@@ -0,0 +1,326 @@
+"""Benchmarks for VirtualFileSystem.
+
+Run from this directory:
+
+    python benchmark.py            # every benchmark
+    python benchmark.py move       # a single benchmark
+"""
+
+import argparse
+import copy
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from solution import VirtualFileSystem
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _populate(fs, root, count, width=100):
+    """Create ``count`` small files below ``root`` spread over ``width`` dirs."""
+    fs.mkdir_p(root)
+    for d in range(width):
+        fs.mkdir(f'{root}/d{d}')
+    for i in range(count):
+        fs.create_file(f'{root}/d{i % width}/f{i}.txt', 'x')
+
+
+class _FlatDictMove:
+    """The flat-dict layout VirtualFileSystem used before the node tree.
+
+    Only what ``move`` needs is kept: every descendant key is rebuilt by
+    string concatenation, so a rename costs O(total entries).
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.directory = {'': {'parent': '', 'name': ''}}
+
+    def populate(self, root, count, width=100):
+        self.directory[root] = {}
+        for d in range(width):
+            self.directory[f'{root}/d{d}'] = {}
+        for i in range(count):
+            self.files[f'{root}/d{i % width}/f{i}.txt'] = {'content': 'x'}
+
+    def move(self, source, dest):
+        files_to_move = [f for f in self.files if f == source or f.startswith(source + '/')]
+        for f in files_to_move:
+            self.files[dest + f[len(source):]] = self.files.pop(f)
+        dirs_to_move = [d for d in self.directory if d == source or d.startswith(source + '/')]
+        for d in dirs_to_move:
+            self.directory[dest + d[len(source):]] = self.directory.pop(d)
+        return True
+
+
+def bench_move(sizes=(1_000, 10_000, 100_000)):
+    print('move: rename a directory holding N files')
+    print(f'{"N":>10} {"flat dict (s)":>15} {"node tree (s)":>15} {"speedup":>10}')
+    for n in sizes:
+        flat = _FlatDictMove()
+        flat.populate('/src', n)
+        flat_time, _ = _timed(flat.move, '/src', '/dest')
+
+        fs = VirtualFileSystem()
+        fs.set_quota(n)
+        _populate(fs, '/src', n)
+        tree_time, moved = _timed(fs.move, '/src', '/dest')
+        assert moved and fs.exists('/dest/d0/f0.txt')
+
+        print(f'{n:>10} {flat_time:>15.6f} {tree_time:>15.6f} {flat_time / tree_time:>9.0f}x')
+
+
+def bench_grep(files=400, file_size=64 * 1024, workers=(1, 2, 4, 8)):
+    print(f'grep: {files} files of {file_size // 1024} KiB, {os.cpu_count()} CPUs available')
+    rng = random.Random(0)
+    words = ['alpha', 'beta', 'gamma', 'delta', 'status=ok', 'latency', 'request']
+    fs = VirtualFileSystem()
+    fs.set_quota(files * file_size * 2)
+    fs.mkdir('/logs')
+    for i in range(files):
+        body = ' '.join(rng.choice(words) for _ in range(file_size // 6))[:file_size]
+        if i % 50 == 0:
+            body += ' error 5031'
+        fs.create_file(f'/logs/{i}.log', body)
+
+    searches = [('substring', 'error 5031', False), ('regex', r'error\s+5\d{3}', True)]
+    print(f'{"workers":>8}' + ''.join(f'{name + " (s)":>16}' for name, _, _ in searches))
+    expected = [fs.grep('/logs', pattern, regex=regex) for _, pattern, regex in searches]
+    for count in workers:
+        row = f'{count:>8}'
+        for (_, pattern, regex), want in zip(searches, expected):
+            elapsed, found = _timed(lambda: fs.grep('/logs', pattern, workers=count, regex=regex))
+            assert found == want
+            row += f'{elapsed:>16.4f}'
+        print(row)
+
+
+def bench_metrics(ops=200_000):
+    print(f'metrics: {ops} read_file calls on a 1 KiB file')
+    print(f'{"mode":>10} {"time (s)":>10} {"per call (us)":>15}')
+    for mode in ('off', 'metrics', 'tracer'):
+        fs = VirtualFileSystem(metrics=mode == 'metrics',
+                               tracer=(lambda *event: None) if mode == 'tracer' else None)
+        fs.create_file('/a.txt', 'x' * 1024)
+        elapsed, _ = _timed(lambda: [fs.read_file('/a.txt') for _ in range(ops)])
+        print(f'{mode:>10} {elapsed:>10.4f} {elapsed / ops * 1e6:>15.3f}')
+
+
+def bench_batch(sizes=(10_000, 100_000), width=100):
+    print(f'batch: mkdir_p + create_file for N files spread over {width} dirs')
+    layouts = {
+        'shallow': lambda j: f'/ingest/d{j}',
+        'deep': lambda j: f'/ingest/2024/{j % 12:02}/{j % 28:02}/host{j}',
+    }
+    print(f'{"layout":>8} {"N":>10} {"loop (s)":>12} {"apply_ops (s)":>15} {"speedup":>10}')
+    for layout, directory in layouts.items():
+        for n in sizes:
+            ops = []
+            for i in range(n):
+                ops.append(('mkdir_p', directory(i % width)))
+                ops.append(('create_file', f'{directory(i % width)}/f{i}.txt', 'x'))
+
+            looped = VirtualFileSystem()
+            looped.set_quota(n)
+            loop_time, _ = _timed(lambda: [getattr(looped, op[0])(*op[1:]) for op in ops])
+
+            batched = VirtualFileSystem()
+            batched.set_quota(n)
+            batch_time, results = _timed(batched.apply_ops, ops)
+            assert all(results) and batched.disk_usage() == looped.disk_usage() == n
+
+            print(f'{layout:>8} {n:>10} {loop_time:>12.4f} {batch_time:>15.4f} '
+                  f'{loop_time / batch_time:>9.1f}x')
+
+
+def bench_snapshot(sizes=(1_000, 10_000, 100_000), changes=10):
+    print(f'snapshot: save a tree of N files, change {changes} of them, restore')
+    print(f'{"N":>10} {"deepcopy (s)":>14} {"snapshot (s)":>14} {"begin (s)":>12} {"rollback (s)":>14}')
+    for n in sizes:
+        fs = VirtualFileSystem()
+        fs.set_quota(n * 2)
+        _populate(fs, '/data', n)
+
+        deep_time, _ = _timed(copy.deepcopy, fs.root)
+        snap_time, snap = _timed(fs.snapshot)
+        begin_time, _ = _timed(fs.begin)
+        for i in range(changes):
+            fs.write_file(f'/data/d{i % 100}/f{i}.txt', 'changed')
+        rollback_time, _ = _timed(fs.rollback)
+        assert fs.read_file('/data/d0/f0.txt') == snap.read_file('/data/d0/f0.txt') == 'x'
+        snap.close()
+
+        print(f'{n:>10} {deep_time:>14.6f} {snap_time:>14.6f} {begin_time:>12.6f} {rollback_time:>14.6f}')
+
+
+def bench_threads(ops=20_000, threads=(1, 2, 4, 8), write_ratio=0.1, scanned=20_000):
+    print(f'threads: {ops} ops per thread, {write_ratio:.0%} writes, each thread in its own subtree, '
+          f'{os.cpu_count()} CPUs available; "scanned" also greps {scanned} files in /big '
+          f'back to back meanwhile; "longest" is the slowest single op')
+    print(f'{"threads":>8} {"mode":>12} {"time (s)":>10} {"ops/s":>12} {"greps":>6} '
+          f'{"longest (ms)":>13}')
+
+    def worker(fs, t, longest):
+        rng = random.Random(t)
+        worst = 0.0
+        for i in range(ops):
+            path = f'/t{t}/d{i % 10}/f{i % 100}.txt'
+            start = time.perf_counter()
+            if rng.random() < write_ratio:
+                fs.write_file(path, str(i))
+            else:
+                fs.read_file(path)
+            worst = max(worst, time.perf_counter() - start)
+        longest.append(worst)
+
+    for count in threads:
+        for mode in ('plain', 'threadsafe', 'scanned'):
+            if mode == 'plain' and count > 1:
+                continue
+            fs = VirtualFileSystem(threadsafe=mode != 'plain')
+            fs.set_quota(10 ** 9)
+            for t in range(count):
+                _populate(fs, f'/t{t}', 100, width=10)
+            if mode == 'scanned':
+                _populate(fs, '/big', scanned)
+            longest = []
+            workers = [threading.Thread(target=worker, args=(fs, t, longest))
+                       for t in range(count)]
+            greps = []
+
+            def scan():
+                while any(thread.is_alive() for thread in workers):
+                    fs.grep('/big', 'needle')
+                    greps.append(1)
+
+            def run():
+                for thread in workers:
+                    thread.start()
+                scanner = threading.Thread(target=scan)
+                if mode == 'scanned':
+                    scanner.start()
+                for thread in workers:
+                    thread.join()
+                if mode == 'scanned':
+                    scanner.join()
+            elapsed, _ = _timed(run)
+            print(f'{count:>8} {mode:>12} {elapsed:>10.4f} {count * ops / elapsed:>12.0f} '
+                  f'{len(greps):>6} {max(longest) * 1000:>13.1f}')
+
+
+def bench_image(files=1_000, sizes=(1024, 16 * 1024, 128 * 1024)):
+    print(f'image: save and load {files} files of each size; pickle loads the node tree eagerly')
+    print(f'{"file size":>10} {"image (MiB)":>12} {"save (s)":>10} {"load (s)":>10} '
+          f'{"first read (s)":>15} {"pickle load (s)":>16}')
+    for size in sizes:
+        fs = VirtualFileSystem(binary=True)
+        fs.set_quota(files * size)
+        _populate(fs, '/data', 0)
+        for i in range(files):
+            fs.create_file(f'/data/d{i % 100}/f{i}.bin', os.urandom(size))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, 'vfs.img')
+            save_time, _ = _timed(fs.save, image)
+            loaded = VirtualFileSystem(binary=True)
+            load_time, _ = _timed(loaded.load, image)
+            read_time, data = _timed(loaded.read_file, '/data/d7/f7.bin')
+            assert data == fs.read_file('/data/d7/f7.bin')
+            assert loaded.disk_usage() == fs.disk_usage()
+            mib = os.path.getsize(image) / 2 ** 20
+            pickled = pickle.dumps(fs.root, pickle.HIGHEST_PROTOCOL)
+            pickle_time, _ = _timed(pickle.loads, pickled)
+            del loaded
+
+        print(f'{size // 1024:>7} KiB {mib:>12.1f} {save_time:>10.4f} {load_time:>10.4f} '
+              f'{read_time:>15.6f} {pickle_time:>16.4f}')
+
+
+def bench_journal(ops=5_000):
+    print(f'journal: {ops} create_file calls, then recovery from the journal')
+    print(f'{"fsync":>8} {"time (s)":>10} {"per call (us)":>15} {"journal (KiB)":>14} {"recover (s)":>12}')
+    for policy in ('off', 'never', 'group', 'always'):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'vfs.journal')
+            fs = VirtualFileSystem()
+            if policy != 'off':
+                fs.open_journal(path, fsync=policy)
+            fs.set_quota(ops)
+            _populate(fs, '/data', 0)
+            elapsed, _ = _timed(lambda: [fs.create_file(f'/data/d{i % 100}/f{i}.txt', 'x')
+                                         for i in range(ops)])
+            if policy == 'off':
+                print(f'{policy:>8} {elapsed:>10.4f} {elapsed / ops * 1e6:>15.1f}')
+                continue
+            fs.flush_journal()
+            kib = os.path.getsize(path) / 1024
+            recovered = VirtualFileSystem()
+            recover_time, _ = _timed(recovered.open_journal, path)
+            assert recovered.disk_usage() == ops
+            fs.close_journal()
+            recovered.close_journal()
+            print(f'{policy:>8} {elapsed:>10.4f} {elapsed / ops * 1e6:>15.1f} {kib:>14.1f} {recover_time:>12.4f}')
+
+
+def bench_dedupe(files=10_000, templates=10, size=4096):
+    print(f'dedupe: {files} files written from {templates} templates of {size // 1024} KiB, '
+          f'each a separate but equal string')
+    print(f'{"dedupe":>8} {"time (s)":>10} {"logical (MiB)":>14} {"physical (MiB)":>15} {"memory (MiB)":>13}')
+    bodies = [(f'template {t}\n' * size)[:size] for t in range(templates)]
+
+    def write(fs):
+        for i in range(files):
+            body = bodies[i % templates]
+            fs.create_file(f'/data/d{i % 100}/f{i}.conf', body[:1] + body[1:])
+
+    for dedupe in (False, True):
+        tracemalloc.start()
+        fs = VirtualFileSystem(dedupe=dedupe)
+        fs.set_quota(files * size)
+        _populate(fs, '/data', 0)
+        elapsed, _ = _timed(write, fs)
+        memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+        physical = fs.disk_usage(physical=True)
+        physical = '-' if physical is None else f'{physical / 2 ** 20:.2f}'
+        print(f'{str(dedupe):>8} {elapsed:>10.4f} {fs.disk_usage() / 2 ** 20:>14.2f} '
+              f'{physical:>15} {memory:>13.2f}')
+
+
+BENCHMARKS = {
+    'move': bench_move,
+    'grep': bench_grep,
+    'metrics': bench_metrics,
+    'batch': bench_batch,
+    'snapshot': bench_snapshot,
+    'threads': bench_threads,
+    'image': bench_image,
+    'journal': bench_journal,
+    'dedupe': bench_dedupe,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+                        help=f'one of: {", ".join(BENCHMARKS)} (default: all)')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'unknown benchmark: {", ".join(unknown)}')
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == '__main__':
+    main()
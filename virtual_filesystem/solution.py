@@ -1,4 +1,22 @@
-import copy
+import asyncio
+import bisect
+import concurrent.futures
+import contextlib
+import fnmatch
+import functools
+import gc
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import weakref
+import zlib
 
 
 class VirtualFileSystem:
@@ -7,7 +25,7 @@ class VirtualFileSystem:
 
     Basic File Operations:
     - create_file(path, content) -> bool
-    - read_file(path) -> str | None
+    - read_file(path, offset, length) -> str | None
     - write_file(path, content) -> bool
     - delete(path) -> bool
 
@@ -16,6 +34,7 @@ class VirtualFileSystem:
     - mkdir_p(path) -> bool  (creates parent directories)
     - ls(path) -> list | None
     - delete_recursive(path) -> bool
+    - walk(path, topdown) -> iterator of (dirpath, dirnames, filenames)
 
     Path Utilities:
     - exists(path) -> bool
@@ -36,7 +55,7 @@ class VirtualFileSystem:
 
     Size/Quota:
     - get_size(path) -> int
-    - disk_usage() -> int
+    - disk_usage(physical) -> int  (logical, or deduplicated bytes)
     - set_quota(bytes) -> bool
 
     Permissions:
@@ -52,312 +71,2886 @@ class VirtualFileSystem:
     - diff(path1, path2) -> str
     - append(path, content) -> bool
     - truncate(path, length) -> bool
+
+    Batch:
+    - apply_ops(ops) -> list  (all-or-nothing, per-op results)
+    - batch() -> context manager collecting ops for apply_ops
+
+    Snapshots and Transactions:
+    - snapshot() -> VirtualFileSystem  (O(1) copy-on-write fork)
+    - begin() / commit() / rollback() -> bool
+    - close() -> bool  (drop this instance's tree)
+
+    Persistence:
+    - save(host_path) -> bool  (write a binary image of the tree)
+    - load(host_path) -> bool  (replace the tree, reading contents lazily)
+    - open_journal(host_path, fsync) -> bool  (recover, then log every mutation)
+    - checkpoint() / flush_journal() / close_journal() -> bool
+
+    Storage is a tree of nodes rooted at ``self.root``.  Every directory
+    keeps a ``children`` map from entry name to node, so a lookup costs one
+    dict access per path component and directory operations only touch the
+    entries they are about.  Nodes never store their own name or parent;
+    the name lives in the parent's ``children`` map.
+
+    Nodes are shared copy-on-write: ``copy`` links the source node under the
+    destination and bumps its ``refs`` count instead of duplicating it.  Any
+    mutation first walks its path with ``_own``, which replaces every shared
+    node on the way with a private clone, so the other owners never see the
+    change.
+
+    Each directory keeps ``size``, the total content bytes below it.  A
+    mutation adds its byte delta to every directory on the owned chain, so
+    ``get_size``, ``disk_usage`` and the quota checks never scan.
+
+    With ``index_content=True`` every file is also entered in a trigram
+    index that ``grep`` uses to skip files which cannot contain the pattern.
+    With ``index_names=True`` every entry name is indexed by the directories
+    holding it, and directories remember their parents, so ``find`` reaches
+    matches without walking the subtree.  All changes to a ``children`` map
+    go through ``_link`` and ``_unlink`` to keep that index current.
+
+    With ``dedupe=True`` file contents go through a content-addressed blob
+    store: files written with equal contents share one stored object, and
+    ``disk_usage(physical=True)`` counts each distinct content once.
+
+    With ``binary=True`` contents are stored as ``bytes``: the write methods
+    take ``str`` (encoded as UTF-8) or any buffer-protocol object, reads
+    return ``bytes``, ``read_file_bytes`` returns zero-copy ``memoryview``
+    slices, and sizes and the quota count bytes.
+
+    ``save`` writes the tree to a binary image on the host: the file
+    contents back to back, then a fixed-size entry per node.  ``load``
+    maps an image into memory and reads only its entries; each content is
+    read from the mapping when the file is first used.  ``open_journal``
+    adds a write-ahead journal: every successful mutation appends a record,
+    and after a crash the last checkpoint image plus the journal records
+    written since restore the tree.
+
+    With ``threadsafe=True`` one instance can be shared between threads.
+    Each operation locks the paths it works on, shared to read or
+    exclusively to change them, and announces that on their ancestors, so a
+    reader waits for a writer only when their subtrees overlap.  Paths
+    through a symlink or ``..`` lock the whole tree instead, as do the
+    operations that change all of it (``cd``, ``apply_ops``, snapshots,
+    transactions, loading and the journal).  Writers still take turns on
+    one mutex, even in disjoint subtrees, since they share the reference
+    counts, the byte totals up to ``/`` and the indexes; only their journal
+    writes overlap, and ``save`` writes outside it too.  ``walk`` holds a reference to its directory instead of a
+    lock and ``save`` one to the root instead of the mutex, so neither holds
+    up writers; path copying keeps the tree they read unchanged underneath
+    them.
+
+    ``tracer`` (or ``set_tracer``) installs a callback that is called as
+    ``tracer(op, path, seconds, nbytes)`` after every public operation.
+    With ``metrics=True`` (or ``enable_metrics``) the same hook feeds
+    per-operation counters and latency histograms read with ``stats``.
+    With neither the methods run unwrapped and pay nothing.
     """
 
-    def __init__(self):
-        self.files ={}
-        self.directory ={}
-        self.directory[""] =  {'parent':"",'name':""}
+    def __init__(self, index_content:bool=False, index_names:bool=False,
+                 binary:bool=False, tracer=None, metrics:bool=False,
+                 threadsafe:bool=False, dedupe:bool=False):
+        self.root = _Dir()
         self.quota= 100
-        self.links ={}
-
-  
-
+        self.index = _TrigramIndex() if index_content else None
+        self.names = _NameIndex() if index_names else None
+        self.blobs = _BlobStore() if dedupe else None
+        self.binary = binary
+        self.cwd = []
+        self.generation = 0
+        # Roots saved by begin(), innermost last
+        self._savepoints = []
+        self._resolve = functools.lru_cache(maxsize=_RESOLVE_CACHE_SIZE)(self._resolve_path)
+        self._lock = _TreeLock() if threadsafe else None
+        self.tracer = None
+        self.metrics = _Metrics() if metrics else None
+        self.journal = None
+        self._trace_local = threading.local()
+        self.set_tracer(tracer)
 
     def create_file(self, file_path:str, Content:str)->bool:
 
-        lst = file_path.split('/')
-        if self.quota < len(Content):
+        Content = self._encode(Content)
+        if self.root.size + len(Content) > self.quota:
             return False
 
-        self.files[file_path] = {'content':Content,'parent':lst[-2],'filename':lst[-1],'permission':'rw'}
-
+        found = self._lookup(file_path)
+        if found is None or found[1] is not None:
+            return False
+        parts, _ = found
+
+        chain = self._own(parts)
+        node = _File(Content)
+        self._link(chain[-1], parts[-1], node)
+        _grow(chain, len(Content))
+        if self.index is not None:
+            self.index.add(node)
+        if self.blobs is not None:
+            self.blobs.add(node)
         return True
-    
-    def read_file(self,file_path:str)->str:
-        
-        if file_path not in self.files:
-            if file_path not in self.links:
-                dir,_,filename = file_path.rpartition('/')
-                if dir not in self.links:
-                    return None
-                else:
-                    dir = self.links[dir]
-                    file_path = f'{dir}/{filename}'
-            else:
-                if self.links[file_path] not in self.files:
-                    file_path = self.getfilefromlink(self.links[file_path])
-                else:
-                    file_path = self.links[file_path]
 
-        if file_path not in self.files:
+    def read_file(self,file_path:str, offset:int=0, length:int=None)->str:
+
+        node = self._node(file_path)
+        if not isinstance(node, _File) or 'r' not in node.permission:
+            return None
+        if offset < 0 or length is not None and length < 0:
             return None
 
-        if self.files[file_path]['permission'] not in ['r','rw'] or self.files[file_path]['permission'] =='':
+        # Joining the chunks in place would race with concurrent readers
+        if offset == 0 and length is None and self._lock is None:
+            return node.content
+        return node.data.read(offset, length)
+
+    def read_file_bytes(self, file_path:str, offset:int=0, length:int=None) -> memoryview:
+        """Return a read-only ``memoryview`` of a binary file's content.
+
+        The view shares memory with the stored chunk, so nothing is copied
+        unless the range spans chunks, in which case the chunks are joined
+        once and stay joined.
+        """
+        if not self.binary:
+            return None
+        node = self._node(file_path)
+        if not isinstance(node, _File) or 'r' not in node.permission:
             return None
-        print(self.files)
+        if offset < 0 or length is not None and length < 0:
+            return None
+
+        return node.data.view(offset, length, join=self._lock is None)
+
+    def write_file_bytes(self, file_path:str, data) -> bool:
+        """Replace a binary file's content with any buffer-protocol object."""
+        if not self.binary:
+            return False
+        return self.write_file(file_path, data)
 
-        return self.files[file_path]['content']
-    
     def getfilefromlink(self,filepath:str)->str:
 
-        if filepath not in self.files:
-            if filepath not in self.links:
-                return ''
-            else:
-                if self.links[filepath] in self.files:
-                    return self.links[filepath]
-                else:
-                    filepath = self.getfilefromlink(filepath)
-                    return filepath
-        else:
-            return filepath
-                
+        found = self._lookup(filepath)
+        if found is None or not isinstance(found[1], _File):
+            return ''
+        return _join(found[0])
 
-    
-    def delete(self,file_path:str) -> str:
-       
-        
-        if file_path not in self.files and file_path not in self.directory:
+    def delete(self,file_path:str) -> bool:
+
+        found = self._lookup(file_path, follow_last=False)
+        if found is None or found[1] is None or not found[0]:
             return False
-        
-     
-        
-        if file_path in self.files:
+        parts, node = found
 
-            if self.files[file_path]['permission'] =='r':
-                    return False
-            del self.files[file_path]
-        else:
-            for f in self.files:
-                if file_path in f:
-                    return False
+        if isinstance(node, _File) and 'w' not in node.permission:
+            return False
+        if isinstance(node, _Dir) and node.children:
+            return False
 
+        chain = self._own(parts)
+        self._release(self._unlink(chain[-1], parts[-1]))
+        _grow(chain, -_size(node))
+        if not isinstance(node, _File):
+            self._invalidate()
+        return True
 
-            for f in self.directory:
-                if file_path in f and file_path !=f:
-                    return False
+    def write_file(self,file_path:str,content:str) ->bool:
 
-                           
-            del self.directory[file_path]
+        content = self._encode(content)
+        found = self._lookup(file_path)
+        if found is None or not isinstance(found[1], _File):
+            return False
+        parts, node = found
 
+        if 'w' not in node.permission:
+            return False
+        delta = len(content) - node.data.size
+        if self.root.size + delta > self.quota:
+            return False
+
+        chain = self._own(parts)
+        node = self._own_child(chain[-1], parts[-1])
+        if self.index is not None:
+            self.index.discard(node)
+        if self.blobs is not None:
+            self.blobs.discard(node)
+        node.content = content
+        _grow(chain, delta)
+        if self.index is not None:
+            self.index.add(node)
+        if self.blobs is not None:
+            self.blobs.add(node)
         return True
-    
-    def write_file(self,file_path:str,content:str) ->bool:
-       
-        if file_path not in self.files:
-            if file_path not in self.links:
-                return None
-            else:
-                if self.links[file_path] not in self.files:
-                    file_path = self.getfilefromlink(file_path)
-                else:
-                    file_path = self.links[file_path]
 
-        if self.files[file_path]['permission'] not in ['w','rw']:
+    def append(self, file_path:str, content:str) -> bool:
+
+        content = self._encode(content)
+        found = self._lookup(file_path)
+        if found is None or not isinstance(found[1], _File):
+            return False
+        parts, node = found
+
+        if 'w' not in node.permission:
             return False
-        if self.quota < len(content):
+        if self.root.size + len(content) > self.quota:
             return False
-        
-        self.files[file_path]['content'] =content
+
+        chain = self._own(parts)
+        node = self._own_child(chain[-1], parts[-1])
+        if self.index is not None:
+            # Only trigrams that end inside the appended text are new
+            self.index.add(node, node.data.read(max(node.data.size - 2, 0)) + content)
+        if self.blobs is not None:
+            self.blobs.discard(node)
+        node.data.append(content)
+        _grow(chain, len(content))
+        if self.blobs is not None:
+            self.blobs.add(node)
         return True
-    
-    def mkdir(self,path:str)->bool:
-        
 
-        parent,_,cur = path.rpartition('/')
+    def truncate(self, file_path:str, length:int) -> bool:
 
-        
+        found = self._lookup(file_path)
+        if found is None or not isinstance(found[1], _File) or length < 0:
+            return False
+        parts, node = found
 
-        if parent not in self.directory:
+        if 'w' not in node.permission:
             return False
-        self.directory[path] = {'parent':parent,'name':cur}
+        if length >= node.data.size:
+            return True
 
+        chain = self._own(parts)
+        node = self._own_child(chain[-1], parts[-1])
+        if self.index is not None:
+            self.index.discard(node)
+        if self.blobs is not None:
+            self.blobs.discard(node)
+        _grow(chain, length - node.data.size)
+        node.data.truncate(length)
+        if self.index is not None:
+            self.index.add(node)
+        if self.blobs is not None:
+            self.blobs.add(node)
         return True
 
+    def mkdir(self,path:str)->bool:
 
+        found = self._lookup(path, follow_last=False)
+        if found is None or found[1] is not None:
+            return False
+        parts, _ = found
+
+        self._link(self._own(parts)[-1], parts[-1], _Dir())
+        self._invalidate()
+        return True
 
     def mkdir_p(self,dir_path:str)->bool:
 
-        parent,_,cur = dir_path.rpartition('/')
+        if not dir_path.startswith('/'):
+            dir_path = f'{_prefix(self.cwd)}/{dir_path}'
 
-        dir_list =copy.deepcopy(self.directory)
+        found = self._lookup(dir_path)
+        if found is not None and found[1] is not None:
+            return isinstance(found[1], _Dir)
 
-        if parent not in dir_list:
-            self.mkdir_p(parent)
-        self.directory[dir_path] = {'parent':parent,'name':cur}
+        if found is None:
+            parent,_,_ = dir_path.rstrip('/').rpartition('/')
+            if not self.mkdir_p(parent or '/'):
+                return False
 
-        return True
-        
-    
-    def ls(self,dir:str)->list:
-        lst =[]
+        return self.mkdir(dir_path)
 
-        for f in self.files:
-            if dir in f and dir !=f:
+    def ls(self,dir:str)->list:
 
-                _,_,name = f.rpartition('/')
-                lst.append(name)
+        node = self._node(dir)
+        if not isinstance(node, _Dir):
+            return None
 
-        for f in self.directory:
-            if dir in f and dir !=f:
+        return list(node.children)
 
-                _,_,name = f.rpartition('/')
-                lst.append(name)
+    def walk(self, path:str='/', topdown:bool=True):
+        """Lazily yield ``(dirpath, dirnames, filenames)`` like ``os.walk``.
 
-        if lst == []:
+        Only subdirectories go in ``dirnames``; files and symlinks go in
+        ``filenames`` and links are never descended into.  With
+        ``topdown=True`` the caller may prune ``dirnames`` in place.
+        """
+        lock = self._lock
+        if lock is None:
+            found = self._lookup(path)
+        else:
+            # Locked like ls, but only while the directory is pinned
+            request = None if lock.held() else self._acquire('ls', (path,))
+            try:
+                with lock.mutex:
+                    found = self._lookup(path)
+                    if found is not None and isinstance(found[1], _Dir):
+                        found[1].refs += 1
+            finally:
+                if request is not None:
+                    lock.release(request)
+        if found is None or not isinstance(found[1], _Dir):
+            return
+        try:
+            for prefix, _, dirnames, filenames in _walk(found[1], _prefix(found[0]), topdown):
+                yield prefix or '/', dirnames, filenames
+        finally:
+            if lock is not None:
+                # A generator collected inside another operation must not
+                # wait for the mutex; the next writer unpins it instead
+                lock.unpinned.append(found[1])
+                if not lock.held() and lock.mutex.acquire(blocking=False):
+                    try:
+                        self._unpin()
+                    finally:
+                        lock.mutex.release()
+
+    def tree(self, path:str) -> dict:
+
+        found = self._lookup(path)
+        if found is None or found[1] is None:
             return None
+        parts, node = found
+
+        name = parts[-1] if parts else '/'
+        if not isinstance(node, _Dir):
+            return _leaf(name, node)
+
+        # Bottom-up, so every subdirectory's dict is finished before its parent's
+        subtrees = {}
+        for prefix, directory, dirnames, filenames in _walk(node, _prefix(parts), topdown=False):
+            children = [subtrees.pop(f'{prefix}/{d}') for d in dirnames]
+            children += [_leaf(f, directory.children[f]) for f in filenames]
+            children.sort(key=lambda child: child['name'])
+            subtrees[prefix] = {'name': prefix.rpartition('/')[2] or '/',
+                                'type': 'directory', 'children': children}
+
+        return subtrees[_prefix(parts)]
 
-        return lst
     def delete_recursive(self,dir:str)->bool:
-        
-        delfiles =[]
-        for f in self.files:
-            if dir in f:
-                delfiles.append(f)
-        for x in delfiles:
-            del self.files[x]
-        delfiles =[]
 
-        for f in self.directory:
-            if dir in f:
-                delfiles.append(f)
-        for x in delfiles:
-            del self.directory[x]
+        found = self._lookup(dir, follow_last=False)
+        if found is None or found[1] is None:
+            return False
+        parts, _ = found
+
+        if not parts:
+            root = self._own(parts)[0]
+            for name in list(root.children):
+                self._release(self._unlink(root, name))
+            root.size = 0
+            self._invalidate()
+            return True
 
+        chain = self._own(parts)
+        node = self._unlink(chain[-1], parts[-1])
+        self._release(node)
+        _grow(chain, -_size(node))
+        self._invalidate()
         return True
 
+    def get_parent(self, path:str) -> str:
+
+        path = self.get_absolute_path(path)
+        if path == '/':
+            return None
+        return path.rpartition('/')[0] or '/'
+
+    def get_absolute_path(self, relative_path:str) -> str:
+        """Join ``relative_path`` to the working directory and normalize
+        ``.`` and ``..`` lexically, without following symlinks.
+        """
+        parts = [] if relative_path.startswith('/') else list(self.cwd)
+        for name in _split(relative_path):
+            if name == '..':
+                if parts:
+                    parts.pop()
+            elif name != '.':
+                parts.append(name)
+        return _join(parts)
+
+    def pwd(self) -> str:
+        return _join(self.cwd)
+
+    def cd(self, path:str) -> bool:
+
+        found = self._lookup(path)
+        if found is None or not isinstance(found[1], _Dir):
+            return False
+
+        self.cwd = found[0]
+        return True
 
-        
-    
- 
-    
     def exists(self,filename:str)->bool:
 
-       
-        if filename in self.files:
-            return True
-        
-        if filename in self.directory:
-            return True
-        
-        return False
-    
+        return self._node(filename) is not None
+
     def is_file(self,filename:str)->bool:
 
-        
-       
-        if filename in self.files:
-            return True
-        return False
-        
-        return False
+        return isinstance(self._node(filename), _File)
+
     def is_directory(self,dirname:str) ->bool:
-        
-        if dirname in self.directory:
-            return True
-        return False
-    def move(self,source:str,dest:str)->bool:
 
-        if source not in self.files and source not in self.directory:
-            return False
+        return isinstance(self._node(dirname), _Dir)
 
-        # Moving a file
-        if source in self.files:
-            self.create_file(dest,self.files[source]['content'])
-            del self.files[source]
-            return True
+    def move(self,source:str,dest:str)->bool:
 
-        # Moving a directory — check for move-into-self
-        if dest.startswith(source + "/"):
+        src = self._lookup(source, follow_last=False)
+        if src is None or src[1] is None or not src[0]:
+            return False
+        dst = self._lookup(dest, follow_last=False)
+        if dst is None or dst[1] is not None:
             return False
 
-        # Move all files under source
-        files_to_move = [f for f in self.files if f == source or f.startswith(source + "/")]
-        for f in files_to_move:
-            new_path = dest + f[len(source):]
-            self.files[new_path] = self.files[f]
-            del self.files[f]
+        # Moving a directory into itself would detach it from the tree
+        if dst[0][:len(src[0])] == src[0]:
+            return False
 
-        # Move all directories under source (including source itself)
-        dirs_to_move = [d for d in self.directory if d == source or d.startswith(source + "/")]
-        for d in dirs_to_move:
-            new_path = dest + d[len(source):]
-            self.directory[new_path] = self.directory[d]
-            del self.directory[d]
+        chain = self._own(src[0])
+        node = self._unlink(chain[-1], src[0][-1])
+        _grow(chain, -_size(node))
 
+        chain = self._own(dst[0])
+        self._link(chain[-1], dst[0][-1], node)
+        _grow(chain, _size(node))
+        self._invalidate()
         return True
+
     def copy(self,source:str,dest:str)->bool:
-       count=0
-       if dest.startswith(source + "/"):
-            return False
 
-       if source in self.files:
-        if  len(self.files[source]['content'])*2 > self.quota:
+        src = self._lookup(source)
+        if src is None or src[1] is None or not src[0]:
+            return False
+        dst = self._lookup(dest)
+        if dst is None or dst[1] is not None:
+            return False
+        if dst[0][:len(src[0])] == src[0]:
             return False
 
-        return self.create_file(dest,self.files[source]['content'])
-       
-       copylist = [f for f in self.files if f.startswith(source)]
-       for f in copylist:
-            count += len(self.files[f]['content'])
-       if count*2 > self.quota:
-           return False 
-       for f in copylist:
-            new_path = dest + f[len(source):]
-            self.files[new_path] = self.files[f]
-           
-
-       dirlist = [d for d in self.directory if d.startswith(source)]
+        node = src[1]
+        if self.root.size + _size(node) > self.quota:
+            return False
 
-       for d in dirlist:
-           new_path = dest+ d[len(source):]
-           self.directory[new_path] = self.directory[d]
+        node.refs += 1
+        chain = self._own(dst[0])
+        self._link(chain[-1], dst[0][-1], node)
+        _grow(chain, _size(node))
+        self._invalidate()
+        return True
 
-       return True
-    
     def find (self,start:str,end:str)->list:
 
-        lst = [x for x in self.files if x.startswith(start)and x.endswith(end)]
+        if self.names is None:
+            return list(self._find(start, end))
+        # Writers of other subtrees change the name index too
+        with self._guarded():
+            return list(self._find(start, end))
+
+    def find_iter(self, start:str, pattern:str):
+        """Lazily yield the paths of entries below ``start`` whose name
+        matches ``pattern``, a literal name or a glob such as ``*.log``.
+
+        In thread-safe mode the matches are collected under the lock first.
+        """
+        if self._lock is not None:
+            return iter(self.find(start, pattern))
+        return self._find(start, pattern)
+
+    def _find(self, start:str, pattern:str):
+        found = self._lookup(start)
+        if found is None or found[1] is None:
+            return
+        parts, node = found
+
+        if not isinstance(node, _Dir):
+            if parts and fnmatch.fnmatchcase(parts[-1], pattern):
+                yield _join(parts)
+            return
+
+        if self.names is None:
+            for prefix, _, dirnames, filenames in _walk(node, _prefix(parts)):
+                for name in dirnames + filenames:
+                    if fnmatch.fnmatchcase(name, pattern):
+                        yield f'{prefix}/{name}'
+            return
+
+        for parent, name in self.names.match(pattern):
+            for prefix in self._paths(parent):
+                if prefix[:len(parts)] == parts:
+                    yield _join(prefix + [name])
+
+    def grep(self,dest:str,cont:str, workers:int=1, regex:bool=False,
+             max_results:int=None, threads:bool=False) ->list:
+        """Return the files below ``dest`` whose content contains ``cont``.
+
+        ``regex=True`` treats ``cont`` as a regular expression.  With
+        ``workers > 1`` the files are split into batches of similar size and
+        searched on a process pool, or a thread pool with ``threads=True``;
+        the result order is the same as a serial search.  ``max_results``
+        stops the search once that many files have matched; it must be
+        ``None`` or at least 1.
+        """
+        _check_limit(max_results)
+        found = self._lookup(dest)
+        if found is None or found[1] is None:
+            return []
+
+        cont = self._encode(cont)
+        candidates = None
+        if self.index is not None and not regex:
+            with self._guarded():
+                candidates = self.index.candidates(cont)
+        content = _File.content.fget if self._lock is None else lambda f: f.data.read(0)
+        files = ((path, content(f)) for path, f in _files(found[1], _prefix(found[0]))
+                 if candidates is None or f in candidates)
+
+        if workers <= 1:
+            return _grep_batch(files, cont, regex, max_results)
+
+        pool = (concurrent.futures.ThreadPoolExecutor if threads
+                else concurrent.futures.ProcessPoolExecutor)
+        matches = []
+        with pool(max_workers=workers) as executor:
+            futures = [executor.submit(_grep_batch, batch, cont, regex, max_results)
+                       for batch in _batches(list(files), workers * 4)]
+            for future in futures:
+                matches.extend(future.result())
+                if max_results is not None and len(matches) >= max_results:
+                    executor.shutdown(cancel_futures=True)
+                    break
+
+        return matches[:max_results]
 
-        return lst
-    def grep(self,dest:str,cont:str) ->list:
+    def get_size(self,filename:str)->int:
 
-        filelist = [x for x in self.files if cont in self.files[x]['content'] and x.startswith(dest) ]
+        node = self._node(filename)
+        if node is None:
+            return 0
 
-        return filelist
-        
-    def get_size(self,filename:str)->int:
+        return _size(node)
 
-        if filename in self.files:
+    def disk_usage(self, physical:bool=False) -> int:
+        """Return the content bytes below ``/``, counted once per path.
 
-            return len(self.files[filename]['content'])
-        else:
+        With ``physical=True`` count what is actually stored instead: each
+        distinct content in the blob store once, plus every file the store
+        keeps apart once.  ``None`` when the store is off.
+        """
+        if not physical:
+            return self.root.size
+        if self.blobs is None:
+            return None
+        with self._guarded():
+            return self.blobs.shared + self.blobs.private
 
-            count =0
-            for x in self.files:
-                if x.startswith(filename):
-                    count += len(self.files[x]['content'])
-            return count
-    def disk_usage(self)->int:
-        count=0
-        for x in self.files:
-            count += len(self.files[x]['content'])
-        return count
     def set_quota(self,quota:int)->bool:
-        self.quota = quota
+        # Sizes are whole bytes, so a fractional quota admits the same
+        # writes as its floor; an int also fits the image header
+        self.quota = math.floor(quota)
         return True
-    
+
     def chmod(self,filename:str, permission:str)->bool:
 
-        self.files[filename]['permission'] = permission
-        return  True
-    
+        found = self._lookup(filename)
+        if found is None or not isinstance(found[1], _File):
+            return False
+        parts, _ = found
+
+        self._own_child(self._own(parts)[-1], parts[-1]).permission = permission
+        return True
+
     def symlink(self,source:str,dest:str)->bool:
 
-        self.links[dest] = source
+        found = self._lookup(dest, follow_last=False)
+        if found is None or found[1] is not None:
+            return False
+        parts, _ = found
+
+        self._link(self._own(parts)[-1], parts[-1], _Link(source))
+        self._invalidate()
+        return True
+
+    def is_symlink(self, path:str) -> bool:
+
+        return isinstance(self._node(path, follow_last=False), _Link)
+
+    def readlink(self, path:str) -> str:
+
+        node = self._node(path, follow_last=False)
+        return node.target if isinstance(node, _Link) else None
+
+    # ==================== BATCH ====================
+
+    def apply_ops(self, ops:list) -> list:
+        """Apply a list of operations all-or-nothing and return their results.
+
+        Each op is a tuple naming a method and its arguments, e.g.
+        ``('mkdir_p', '/logs')`` or ``('create_file', '/logs/a.txt', 'x')``;
+        ``mkdir``, ``mkdir_p``, ``create_file``, ``write_file`` and
+        ``append`` are supported.  The results are what calling the methods
+        one by one would have returned.  If any of them is ``False`` the
+        filesystem is left untouched.
+
+        The whole batch is first planned against an overlay without
+        mutating anything, so paths are checked once, parent directories
+        are resolved once per batch rather than once per call, and the
+        quota is checked against a running total.  Only then is each
+        directory owned once and every byte total updated once.
+        """
+        plan = _BatchPlan(self)
+        # A batch allocates nodes by the thousand and frees none of them,
+        # so collection passes in between would only rescan them.  The
+        # switch is process-wide, so a thread-safe instance, whose other
+        # threads would lose collection too, leaves it alone
+        enabled = gc.isenabled() and self._lock is None
+        if enabled:
+            gc.disable()
+        try:
+            results = plan.run(ops)
+            if all(results):
+                plan.apply()
+        finally:
+            if enabled:
+                gc.enable()
+        return results
+
+    def batch(self):
+        """Collect calls in a ``with`` block and run them with ``apply_ops`` on exit.
+
+        The returned object has the methods ``apply_ops`` accepts; after
+        the block its ``results`` hold the per-op results.  Nothing is
+        applied if the block raises.
+        """
+        return _Batch(self)
+
+    # ==================== SNAPSHOTS ====================
+
+    def snapshot(self) -> 'VirtualFileSystem':
+        """Return a copy-on-write fork of the tree in O(1).
+
+        The fork shares the root, and through it every node, by taking a
+        reference; whichever side writes first copies only the path it
+        touches, so a long ``grep`` or ``walk`` on the fork sees one
+        consistent state while this instance keeps changing.  Both share
+        the content and name indexes, which then cover the nodes of either
+        tree; lookups already ignore entries outside their own root.
+        ``close`` a snapshot that is no longer needed to free what only it
+        keeps alive.
+        """
+        fork = VirtualFileSystem(binary=self.binary)
+        self.root.refs += 1
+        fork.root = self.root
+        fork.quota = self.quota
+        fork.index = self.index
+        fork.names = self.names
+        fork.blobs = self.blobs
+        fork.cwd = list(self.cwd)
+        if self._lock is not None:
+            # The trees share nodes and indexes, so they share one lock too
+            fork._lock = self._lock
+            fork._instrument()
+        return fork
+
+    def begin(self) -> bool:
+        """Start a transaction: save the current root to return to.
+
+        Transactions nest; each ``commit`` or ``rollback`` ends the
+        innermost one.  They cover the whole instance, so threads sharing
+        one should each work in a ``snapshot`` to get their own.
+        """
+        self.root.refs += 1
+        self._savepoints.append(self.root)
+        return True
+
+    def commit(self) -> bool:
+        """Keep the changes made since the matching ``begin``.
+
+        Frees the nodes that only the saved root still referenced, i.e.
+        the ones replaced since.
+        """
+        if not self._savepoints:
+            return False
+        self._release(self._savepoints.pop())
+        return True
+
+    def rollback(self) -> bool:
+        """Return the tree to its state at the matching ``begin``.
+
+        The saved root becomes current again and the nodes created since
+        are released; nodes still shared with the saved tree are only
+        decremented, so the cost follows the size of the change.
+        """
+        if not self._savepoints:
+            return False
+        saved = self._savepoints.pop()
+        if saved is self.root:
+            saved.refs -= 1
+            return True
+        self._release(self.root)
+        self.root = saved
+        self._invalidate()
+        return True
+
+    def close(self) -> bool:
+        """Drop this instance's tree and savepoints, leaving it empty."""
+        for saved in self._savepoints:
+            self._release(saved)
+        self._savepoints.clear()
+        self._release(self.root)
+        self.root = _Dir()
+        self._invalidate()
+        return True
+
+    # ==================== PERSISTENCE ====================
+
+    def save(self, file_path:str) -> bool:
+        """Write the tree and quota to the host file ``file_path`` as an image.
 
+        Nodes shared by copy-on-write are written once and referenced from
+        their other places, so ``load`` shares them again.  The image is
+        written to a temporary file that replaces ``file_path`` only once it
+        is complete and flushed to disk, so a crash never leaves half an
+        image and an image that is still mapped by ``load`` stays intact.
+        """
+        self._save(file_path, 0)
+        return True
+
+    def load(self, file_path:str) -> bool:
+        """Replace the tree with the image ``save`` wrote to the host file ``file_path``.
+
+        The image is mapped read-only and only its entry table is read, so
+        loading costs time per node rather than per byte; a file's content
+        is read from the mapping the first time it is used.  With
+        ``index_content`` every content is read at once to index it.
+
+        Savepoints are dropped and the working directory returns to ``/``.
+        Returns ``False`` for an image saved in the other ``binary`` mode
+        and raises ``ValueError`` for a file that is not an image.
+        """
+        return self._load(file_path) is not None
+
+    def _save(self, file_path:str, sequence:int):
+        # The pinned root makes writers copy whatever they change, so the
+        # image is written outside the mutex while they carry on
+        with self._guarded():
+            root = self.root
+            root.refs += 1
+            quota = self.quota
+        # Each save gets a temporary file of its own next to the target, so
+        # saves running at once never write into each other's
+        directory, name = os.path.split(os.path.abspath(file_path))
+        handle, temporary = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+        try:
+            if hasattr(os, 'fchmod'):
+                # mkstemp creates the file 0600; give it the mode open() would
+                os.fchmod(handle, 0o666 & ~_umask())
+            with os.fdopen(handle, 'wb') as out:
+                _write_image(out, root, quota, self.binary, sequence)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temporary, file_path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temporary)
+            raise
+        finally:
+            with self._guarded():
+                self._release(root)
+
+    def _load(self, file_path:str):
+        """Load the image at ``file_path`` and return it, or ``None`` on a mode mismatch."""
+        image = _Image(file_path)
+        if image.binary != self.binary:
+            return None
+        root = image.tree(self)
+        self.close()
+        self.root = root
+        self.quota = image.quota
+        self.cwd = []
+        return image
+
+    # ==================== JOURNAL ====================
+
+    def open_journal(self, file_path:str, fsync:str='group', group_size:int=64,
+                     group_seconds:float=0.01, max_bytes:int=64 * 2 ** 20) -> bool:
+        """Log every later mutation to a write-ahead journal at host path ``file_path``.
+
+        The journal's checkpoint image is kept next to it as
+        ``file_path + '.img'``.  If either file exists the tree is first
+        recovered from them: the checkpoint is loaded, the records written
+        after it are replayed, a torn record at the end is cut off and
+        transactions left open are rolled back.  Otherwise the current tree
+        becomes the first checkpoint.
+
+        Each successful call of a method in ``_JOURNALED`` appends one
+        record holding its arguments, with relative paths made absolute;
+        ``apply_ops`` is one record, so a batch is recovered whole or not
+        at all.  Records are written in groups of up to ``group_size``, or
+        whatever has gathered once the oldest is ``group_seconds`` old.
+        ``fsync`` decides when they are durable:
+
+        - ``'always'``: every record is written and fsynced before its call returns
+        - ``'group'``: each group is written and fsynced together
+        - ``'never'``: groups are written and left to the OS to persist
+
+        Once the journal grows past ``max_bytes`` it is compacted into a
+        new checkpoint.  A journal still open when the instance is collected
+        or the interpreter exits is flushed and closed then.  Returns ``False`` if a journal is already open or
+        the checkpoint was saved in the other ``binary`` mode.
+        """
+        if fsync not in _FSYNC_POLICIES:
+            raise ValueError(f'unknown fsync policy: {fsync!r}')
+        if self.journal is not None:
+            return False
+
+        checkpoint = f'{file_path}.img'
+        recovering = os.path.exists(checkpoint) or os.path.exists(file_path)
+        sequence = 0
+        if os.path.exists(checkpoint):
+            image = self._load(checkpoint)
+            if image is None:
+                return False
+            sequence = image.sequence
+        elif recovering:
+            self.close()
+        if os.path.exists(file_path):
+            sequence = self._replay(file_path, sequence)
+        # Records of a transaction left open are dropped by a fresh checkpoint
+        stale = not recovering or bool(self._savepoints)
+        while self._savepoints:
+            self.rollback()
+
+        self.journal = _Journal(file_path, sequence, fsync, group_size, group_seconds, max_bytes)
+        self.journal.finalizer = weakref.finalize(self, self.journal.close)
+        self._instrument()
+        if stale:
+            self.checkpoint()
+        return True
+
+    def checkpoint(self) -> bool:
+        """Save the tree as the journal's checkpoint and empty the journal.
+
+        The image records the sequence number of the last journal record it
+        includes, so a crash after saving it but before the journal is
+        emptied only leaves records that recovery skips.  Not possible while
+        a transaction is open, since the image cannot hold savepoints.
+        """
+        journal = self.journal
+        if journal is None or self._savepoints:
+            return False
+        journal.flush()
+        self._save(f'{journal.path}.img', journal.sequence)
+        journal.reset()
+        return True
+
+    def flush_journal(self) -> bool:
+        """Write, and fsync unless the policy is ``'never'``, the records still gathering."""
+        if self.journal is None:
+            return False
+        self.journal.flush()
+        return True
+
+    def close_journal(self) -> bool:
+        """Flush and close the journal; later mutations are no longer logged."""
+        if self.journal is None:
+            return False
+        self.journal.finalizer()
+        self.journal = None
+        self._instrument()
+        return True
+
+    def _replay(self, file_path:str, sequence:int) -> int:
+        """Apply the journal's records numbered above ``sequence`` and return the last number.
+
+        The journal is cut back to its last intact record.
+        """
+        with open(file_path, 'rb') as source:
+            data = source.read()
+        intact = 0
+        for number, op, args, intact in _records(data):
+            if number > sequence:
+                getattr(self, op)(*args)
+                sequence = number
+        if intact < len(data):
+            os.truncate(file_path, intact)
+        return sequence
+
+    def _journaled(self, op:str, method):
+        journal = self.journal
+        paths = _JOURNALED[op]
+        code = method.__func__.__code__
+        names = code.co_varnames[1:code.co_argcount]
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Operations implemented with other operations are recorded once
+            if journal.depth:
+                return method(*args, **kwargs)
+            # The record is packed before the call, so arguments it cannot
+            # hold are refused before anything changes
+            record = None
+            if op != 'load':
+                try:
+                    logged = args + tuple(kwargs[name] for name in names[len(args):])
+                except KeyError:
+                    # A missing argument fails in the method itself
+                    return method(*args, **kwargs)
+                if paths:
+                    logged = list(logged)
+                    for i in paths:
+                        logged[i] = _absolute(self.cwd, logged[i])
+                elif op == 'apply_ops':
+                    logged = ([(entry[0], _absolute(self.cwd, entry[1])) + tuple(entry[2:])
+                               for entry in logged[0]],)
+                record = _Journal.encode(op, logged)
+
+            journal.depth += 1
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                journal.depth -= 1
+
+            if op == 'load':
+                if result:
+                    self.checkpoint()
+                return result
+            if result is not True and not (op == 'apply_ops' and all(result)):
+                return result
+
+            journal.record(record)
+            # In thread-safe mode the locking wrapper flushes, outside the mutex
+            if journal.due and self._lock is None:
+                journal.flush()
+            if journal.size > journal.max_bytes and not self._savepoints:
+                self.checkpoint()
+            return result
+        return wrapper
+
+    def _encode(self, content):
+        """Convert ``content`` to the stored type: ``bytes`` in binary mode.
+
+        ``bytes`` are kept as they are; other buffers are copied exactly
+        once so later changes by the caller cannot reach the stored data.
+        """
+        if not self.binary or isinstance(content, bytes):
+            return content
+        if isinstance(content, str):
+            return content.encode()
+        return bytes(memoryview(content))
+
+    # ==================== PATH RESOLUTION ====================
+
+    def _lookup(self, path:str, follow_last:bool=True):
+        """Resolve ``path`` to ``(parts, node)``.
+
+        ``parts`` are the canonical components after following symlinks and
+        ``node`` is the entry itself, or ``None`` when only the final
+        component is missing.  Returns ``None`` when an intermediate
+        component is missing, is not a directory, or the path takes more
+        than ``_MAX_HOPS`` symlinks to resolve.
+
+        Relative paths start from the working directory.  The canonical
+        parts come from the memoized ``_resolve``; only the plain walk down
+        those parts, which never meets a symlink, is repeated per call.
+        """
+        if not path.startswith('/'):
+            path = f'{_prefix(self.cwd)}/{path}'
+        parts = self._resolve(path, follow_last, self.generation)
+        if parts is None:
+            return None
+
+        node = self.root
+        for depth, name in enumerate(parts, 1):
+            if not isinstance(node, _Dir):
+                return None
+            child = node.children.get(name)
+            if child is None:
+                return (list(parts), None) if depth == len(parts) else None
+            node = child
+
+        return list(parts), node
+
+    def _resolve_path(self, path:str, follow_last:bool, generation:int):
+        """Return the canonical parts of absolute ``path`` as a tuple.
+
+        Wrapped in a per-instance LRU cache by ``__init__``.  ``generation``
+        only takes part in the cache key: ``_invalidate`` bumps it whenever a
+        directory or symlink changes, which retires every older entry.
+        """
+        todo = _split(path)[::-1]
+        parts = []
+        nodes = [self.root]
+        hops = 0
+
+        while todo:
+            name = todo.pop()
+            node = nodes[-1]
+            if not isinstance(node, _Dir):
+                return None
+            if name == '.':
+                continue
+            if name == '..':
+                if parts:
+                    parts.pop()
+                    nodes.pop()
+                continue
+            child = node.children.get(name)
+            if child is None:
+                if todo:
+                    return None
+                return tuple(parts + [name])
+            if isinstance(child, _Link) and (todo or follow_last):
+                hops += 1
+                if hops > _MAX_HOPS:
+                    return None
+                if child.target.startswith('/'):
+                    parts, nodes = [], [self.root]
+                todo.extend(_split(child.target)[::-1])
+                continue
+            parts.append(name)
+            nodes.append(child)
+
+        return tuple(parts)
+
+    def _invalidate(self):
+        """Retire cached path resolutions after a directory or symlink change."""
+        self.generation += 1
+
+    def _node(self, path:str, follow_last:bool=True):
+        found = self._lookup(path, follow_last)
+        return None if found is None else found[1]
+
+    def _own(self, parts:list) -> list:
+        """Privatize the directories from the root down to ``parts[:-1]``.
+
+        ``parts`` must be canonical (as returned by ``_lookup``).  Returns
+        those directories, root first, each safe to mutate in place.
+        """
+        if self.root.refs > 1:
+            self.root.refs -= 1
+            self.root = self.root.clone()
+            if self.names is not None:
+                self.names.add_dir(self.root)
+        chain = [self.root]
+        for name in parts[:-1]:
+            chain.append(self._own_child(chain[-1], name))
+        return chain
+
+    def _own_child(self, parent, name:str):
+        """Return ``parent.children[name]``, cloning it first if it is shared."""
+        child = parent.children[name]
+        if child.refs > 1:
+            child.refs -= 1
+            shared, child = child, child.clone()
+            # Swapped in one step, so readers below ``parent`` never miss it
+            parent.children[name] = child
+            if self.names is not None:
+                self.names.discard(parent, name, shared)
+                self.names.add(parent, name, child)
+            if self.index is not None and isinstance(child, _File):
+                self.index.add(child)
+            if self.blobs is not None and isinstance(child, _File):
+                self.blobs.add(child)
+            if self.names is not None and isinstance(child, _Dir):
+                self.names.add_dir(child)
+        return child
+
+    def _link(self, parent, name:str, node):
+        parent.children[name] = node
+        if self.names is not None:
+            self.names.add(parent, name, node)
+
+    def _unlink(self, parent, name:str):
+        node = parent.children.pop(name)
+        if self.names is not None:
+            self.names.discard(parent, name, node)
+        return node
+
+    def _release(self, node):
+        """Drop one reference to ``node`` and to anything it alone kept alive."""
+        self._release_nodes([node])
+
+    def _release_nodes(self, stack:list, limit:int=None) -> list:
+        """Drop one reference to each node in ``stack``, and so on down.
+
+        With ``limit`` at most that many nodes are visited; the rest of
+        ``stack`` is returned so the caller can carry on later.
+        """
+        visited = 0
+        while stack and visited != limit:
+            node = stack.pop()
+            visited += 1
+            node.refs -= 1
+            if node.refs:
+                continue
+            if isinstance(node, _Dir):
+                if self.names is not None:
+                    self.names.discard_dir(node)
+                stack.extend(node.children.values())
+            elif isinstance(node, _File):
+                if self.index is not None:
+                    self.index.discard(node)
+                if self.blobs is not None:
+                    self.blobs.discard(node)
+        return stack
+
+    def _paths(self, directory):
+        """Yield the canonical parts of every live path to ``directory``.
+
+        A directory shared by copy-on-write has one path per parent link;
+        links that do not lead back to ``self.root`` (e.g. from a released
+        clone) yield nothing.
+        """
+        if directory is self.root:
+            yield []
+            return
+        for parent, name in directory.parents or ():
+            for prefix in self._paths(parent):
+                yield prefix + [name]
+
+    # ==================== CONTENT INDEX ====================
+
+    def index_stats(self) -> dict:
+        """Report the size of the trigram index, or ``None`` when it is off."""
+        if self.index is None:
+            return None
+        with self._guarded():
+            return self.index.stats()
+
+    # ==================== TRACING ====================
+
+    def set_tracer(self, tracer) -> bool:
+        """Install ``tracer``, or remove tracing with ``None``.
+
+        Tracing shadows each operation in ``_TRACED`` with a timing wrapper
+        stored on the instance; removing it deletes the wrappers so calls
+        go straight to the class methods again.
+        """
+        self.tracer = tracer
+        self._instrument()
+        return True
+
+    def _instrument(self):
+        traced = self.tracer is not None or self.metrics is not None
+        for op in _WRAPPED:
+            self.__dict__.pop(op, None)
+            method = wrapped = getattr(self, op)
+            if self.journal is not None and op in _JOURNALED:
+                wrapped = self._journaled(op, wrapped)
+            if self._lock is not None and op in _LOCKS:
+                wrapped = self._locked(op, wrapped)
+            if traced and op in _TRACED:
+                wrapped = self._traced(op, wrapped)
+            if wrapped is not method:
+                setattr(self, op, wrapped)
+
+    def _locked(self, op:str, method):
+        lock = self._lock
+        spec = _LOCKS[op]
+        mutates = _X in spec if isinstance(spec, tuple) else spec == _X
+        # ``method`` may already be the journaling wrapper
+        code = getattr(type(self), op).__code__
+        names = code.co_varnames[1:code.co_argcount]
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Operations implemented with other operations take the locks once
+            if lock.held():
+                return method(*args, **kwargs)
+            # Only the paths: contents would be kept alive by the plan cache,
+            # and buffers are not hashable
+            paths = ()
+            if isinstance(spec, tuple):
+                paths = args[:len(spec)] + tuple(
+                    kwargs.get(name) for name in names[len(args):len(spec)])
+            request = self._acquire(op, paths)
+            try:
+                if not mutates:
+                    return method(*args, **kwargs)
+                with lock.mutex:
+                    self._unpin()
+                    result = method(*args, **kwargs)
+                # The records are written while the paths are still locked,
+                # so they are durable before anyone sees the change they log
+                journal = self.journal
+                if journal is not None and journal.due:
+                    journal.flush()
+                return result
+            finally:
+                lock.release(request)
+        return wrapper
+
+    def _acquire(self, op:str, paths:tuple) -> dict:
+        """Take the locks ``op`` needs for ``paths`` and return them for ``release``.
+
+        Each path is locked as written, with the matching intention mode on
+        every ancestor.  That covers everything its lookup passes unless a
+        symlink is on the way, which only shows once the locks keep it from
+        changing; then, as for ``..``, the whole tree is locked instead.
+        """
+        lock = self._lock
+        spec = _LOCKS[op]
+        if not isinstance(spec, tuple):
+            request = {(): spec}
+            lock.acquire(request)
+            return request
+        cwd = self.cwd
+        try:
+            targets, request = _plan(spec, paths, tuple(cwd))
+        except TypeError:
+            # An unhashable argument is no path; the method rejects it
+            targets = None
+        if targets is not None:
+            lock.acquire(request)
+            follow_last = op not in _NOFOLLOW
+            # cd replaces the working directory, so an unchanged one is the same object
+            plain = self.cwd is cwd
+            for parts, _ in targets:
+                plain = plain and not self._crosses_link(parts, follow_last)
+            if plain:
+                return request
+            lock.release(request)
+        request = {(): _X if _X in spec else _S}
+        lock.acquire(request)
+        return request
+
+    def _crosses_link(self, parts:tuple, follow_last:bool) -> bool:
+        node = self.root
+        for depth, name in enumerate(parts, 1):
+            if not isinstance(node, _Dir):
+                return False
+            node = node.children.get(name)
+            if isinstance(node, _Link) and (follow_last or depth < len(parts)):
+                return True
+        return False
+
+    def _guarded(self):
+        """Return the mutex mutations hold, or a no-op outside thread-safe mode."""
+        return contextlib.nullcontext() if self._lock is None else self._lock.mutex
+
+    def _unpin(self):
+        """Drop the references finished walks left behind; needs the mutex."""
+        unpinned = self._lock.unpinned
+        while unpinned:
+            self._release(unpinned.pop())
+
+    def _traced(self, op:str, method):
+        local = self._trace_local
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            # Operations implemented with other operations report only once
+            if getattr(local, 'busy', False):
+                return method(*args, **kwargs)
+            local.busy = True
+            result = None
+            failed = True
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+                failed = (result is None or result is False) and op not in _PREDICATES
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                local.busy = False
+                nbytes = 0 if failed else _nbytes(op, args, result)
+                path = args[0] if args and isinstance(args[0], str) else None
+                self._observe(op, path, elapsed, nbytes, failed)
+        return wrapper
+
+    def _observe(self, op:str, path:str, elapsed:float, nbytes:int, failed:bool):
+        if self.metrics is not None:
+            self.metrics.record(op, elapsed, nbytes, failed)
+        if self.tracer is not None:
+            self.tracer(op, path, elapsed, nbytes)
+
+    # ==================== METRICS ====================
+
+    def enable_metrics(self, enabled:bool=True) -> bool:
+        """Start collecting operation metrics, or stop and discard them."""
+        if enabled and self.metrics is None:
+            self.metrics = _Metrics()
+        elif not enabled:
+            self.metrics = None
+        self._instrument()
+        return True
+
+    def stats(self) -> dict:
+        """Snapshot the metrics per operation, or ``None`` when they are off.
+
+        Each operation that has been called maps to its ``calls``,
+        ``errors`` (exceptions plus ``False``/``None`` results),
+        ``bytes_read``, ``bytes_written``, ``seconds`` spent in total and
+        the ``p50``/``p99`` latencies in seconds.  Percentiles come from
+        power-of-two histogram buckets, so they are upper bounds within 2x.
+        """
+        if self.metrics is None:
+            return None
+        return self.metrics.snapshot()
+
+    def reset_stats(self) -> bool:
+        """Zero every counter and histogram."""
+        if self.metrics is None:
+            return False
+        self.metrics.reset()
         return True
 
+    def export_metrics(self, file_path:str) -> bool:
+        """Write the metrics to the host file ``file_path`` in Prometheus text format."""
+        if self.metrics is None:
+            return False
+        with open(file_path, 'w', encoding='utf-8') as out:
+            out.write(self.metrics.prometheus())
+        return True
+
+
+# Symlink hops allowed while resolving a single path, as in Linux's MAXSYMLINKS
+_MAX_HOPS = 40
+
+# Resolved paths memoized per instance
+_RESOLVE_CACHE_SIZE = 4096
+
+# Files searched, and nodes freed, between checks of an async time slice
+_ASYNC_BATCH = 64
+_RELEASE_STEP = 1024
+
+# Methods apply_ops can batch
+_BATCH_OPS = frozenset({'mkdir', 'mkdir_p', 'create_file', 'write_file', 'append'})
+
+# Public operations reported to the tracer; walk and find_iter are lazy
+# generators, so they are measured through tree and find instead
+_TRACED = (
+    'create_file', 'read_file', 'read_file_bytes', 'write_file', 'write_file_bytes',
+    'append', 'truncate', 'delete', 'mkdir', 'mkdir_p', 'ls', 'delete_recursive',
+    'tree', 'exists', 'is_file', 'is_directory', 'cd', 'move', 'copy', 'find',
+    'grep', 'get_size', 'disk_usage', 'chmod', 'symlink', 'apply_ops', 'save', 'load',
+    'checkpoint',
+)
+_WRITES = frozenset({'create_file', 'write_file', 'write_file_bytes', 'append'})
+_READS = frozenset({'read_file', 'read_file_bytes'})
+
+# _TreeLock modes: intention to read or change below a path, read it, change it
+_IS, _IX, _S, _X = range(4)
+# Modes each mode waits for, and the single mode that covers two modes
+_CONFLICTS = ((_X,), (_S, _X), (_IX, _X), (_IS, _IX, _S, _X))
+_COMBINED = ((_IS, _IX, _S, _X), (_IX, _IX, _X, _X), (_S, _X, _S, _X), (_X, _X, _X, _X))
+# A path's grants are one int holding a 32-bit count per mode: _GRANT adds
+# one grant of a mode, _CONFLICTING masks the counts of its conflicts
+_GRANT = tuple(1 << 32 * mode for mode in range(4))
+# Seconds a thread waits for _TreeLock.guard before asking for it again
+_GUARD_SLICE = 0.005
+_CONFLICTING = tuple(sum((2 ** 32 - 1) << 32 * other for other in others)
+                     for others in _CONFLICTS)
+
+# Locks of the public operations in thread-safe mode: a tuple holds the
+# mode for each path argument in order (None for one that is not a path),
+# a single mode locks the whole tree.  Operations that change something
+# also hold the mutex.  walk and find_iter handle the locks themselves.
+_LOCKS = {
+    **dict.fromkeys((
+        'read_file', 'read_file_bytes', 'getfilefromlink', 'ls', 'tree', 'exists',
+        'is_file', 'is_directory', 'find', 'grep', 'get_size', 'is_symlink',
+        'readlink'), (_S,)),
+    **dict.fromkeys((
+        'create_file', 'write_file', 'write_file_bytes', 'append', 'truncate', 'delete',
+        'mkdir', 'mkdir_p', 'delete_recursive', 'chmod'), (_X,)),
+    'move': (_X, _X),
+    'copy': (_S, _X),
+    'symlink': (None, _X),
+    **dict.fromkeys((
+        'get_parent', 'get_absolute_path', 'pwd', 'disk_usage', 'index_stats', 'save',
+        'flush_journal'), _IS),
+    **dict.fromkeys((
+        'cd', 'set_quota', 'apply_ops', 'snapshot', 'begin', 'commit', 'rollback',
+        'close', 'load', 'open_journal', 'checkpoint', 'close_journal'), _X),
+}
+# Operations that act on a symlink itself rather than on its target
+_NOFOLLOW = frozenset({'delete', 'mkdir', 'delete_recursive', 'move', 'symlink',
+                       'is_symlink', 'readlink'})
+
+# Mutations recorded in the journal, with the positions of their path
+# arguments; load is followed by a checkpoint instead
+_JOURNALED = {
+    'create_file': (0,), 'write_file': (0,), 'write_file_bytes': (0,), 'append': (0,),
+    'truncate': (0,), 'delete': (0,), 'mkdir': (0,), 'mkdir_p': (0,),
+    'delete_recursive': (0,), 'move': (0, 1), 'copy': (0, 1), 'chmod': (0,),
+    'symlink': (1,), 'set_quota': (), 'apply_ops': (), 'begin': (), 'commit': (),
+    'rollback': (), 'close': (), 'load': (),
+}
+_JOURNAL_OPS = tuple(_JOURNALED)
+_JOURNAL_CODES = {op: code for code, op in enumerate(_JOURNAL_OPS)}
+_FSYNC_POLICIES = ('always', 'group', 'never')
+_WRAPPED = tuple(dict.fromkeys(_TRACED + tuple(_LOCKS) + _JOURNAL_OPS))
+
+# Operations whose ``False`` result is an answer rather than a failure
+_PREDICATES = frozenset({'exists', 'is_file', 'is_directory'})
+
+
+def _nbytes(op:str, args:tuple, result) -> int:
+    """Bytes moved by one successful call: content written, or content returned."""
+    if op in _WRITES and len(args) > 1:
+        return len(args[1])
+    if op in _READS and result is not None:
+        return len(result)
+    return 0
+
+
+def logging_tracer(logger:logging.Logger=None, level:int=logging.DEBUG):
+    """Return a tracer that logs every operation to ``logger``."""
+    logger = logger or logging.getLogger(__name__)
+
+    def tracer(op, path, seconds, nbytes):
+        logger.log(level, '%s %s %.6fs %d bytes', op, path, seconds, nbytes)
+    return tracer
+
+
+class AsyncVirtualFileSystem:
+    """An asyncio front end for a ``VirtualFileSystem``.
+
+    Every call runs on the event loop's thread.  Short operations run
+    straight through; ``grep``, ``find``, ``walk`` and ``delete_recursive``
+    work in time slices of at most ``slice_seconds`` and yield to the
+    loop in between, so one huge scan does not stall other requests.
+    Scans read a snapshot taken when they start, so writes made while
+    they are paused never show up halfway through.
+
+    Writers take a per-path ``asyncio`` lock; ``lock(path)`` holds the
+    same lock around a read-modify-write sequence.  The lock is
+    re-entrant for the task holding it.  The wrapped filesystem should
+    not be used from other threads at the same time.
+    """
+
+    def __init__(self, fs:VirtualFileSystem=None, slice_seconds:float=0.005, **kwargs):
+        self.fs = fs if fs is not None else VirtualFileSystem(**kwargs)
+        self.slice_seconds = slice_seconds
+        self._locks = {}
+
+    @contextlib.asynccontextmanager
+    async def lock(self, path:str):
+        """Hold the writer lock of ``path`` for the body of an ``async with``."""
+        key = self.fs.get_absolute_path(path)
+        task = asyncio.current_task()
+        entry = self._locks.get(key)
+        if entry is not None and entry.owner is task:
+            yield
+            return
+
+        if entry is None:
+            entry = self._locks[key] = _PathLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                entry.owner = task
+                try:
+                    yield
+                finally:
+                    entry.owner = None
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._locks[key]
+
+    async def read_file(self, file_path:str, offset:int=0, length:int=None):
+        return self.fs.read_file(file_path, offset, length)
+
+    async def create_file(self, file_path:str, content) -> bool:
+        async with self.lock(file_path):
+            return self.fs.create_file(file_path, content)
+
+    async def write_file(self, file_path:str, content) -> bool:
+        async with self.lock(file_path):
+            return self.fs.write_file(file_path, content)
+
+    async def append(self, file_path:str, content) -> bool:
+        async with self.lock(file_path):
+            return self.fs.append(file_path, content)
+
+    async def delete_recursive(self, dir:str) -> bool:
+        """Unlink ``dir`` at once, then free its nodes a slice at a time."""
+        async with self.lock(dir):
+            fs = self.fs
+            node = fs._node(dir, follow_last=False)
+            if node is None:
+                return False
+            # Held across the delete, so freeing the subtree is left to us
+            node.refs += 1
+            deleted = fs.delete_recursive(dir)
+            pause = _Slicer(self.slice_seconds)
+            stack = [node]
+            while stack:
+                stack = fs._release_nodes(stack, _RELEASE_STEP)
+                await pause()
+            return deleted
+
+    async def grep(self, dest:str, cont:str, regex:bool=False, max_results:int=None) -> list:
+        _check_limit(max_results)
+        snap = self.fs.snapshot()
+        try:
+            found = snap._lookup(dest)
+            if found is None or found[1] is None:
+                return []
+            cont = snap._encode(cont)
+            candidates = None
+            if snap.index is not None and not regex:
+                candidates = snap.index.candidates(cont)
+
+            pause = _Slicer(self.slice_seconds)
+            matches = []
+            batch = []
+            for path, f in _files(found[1], _prefix(found[0])):
+                if candidates is not None and f not in candidates:
+                    continue
+                batch.append((path, f.content))
+                if len(batch) == _ASYNC_BATCH:
+                    matches += _grep_batch(batch, cont, regex, max_results)
+                    batch = []
+                    if max_results is not None and len(matches) >= max_results:
+                        break
+                    await pause()
+            matches += _grep_batch(batch, cont, regex, max_results)
+            return matches[:max_results]
+        finally:
+            snap.close()
+
+    async def find(self, start:str, pattern:str) -> list:
+        snap = self.fs.snapshot()
+        try:
+            found = snap._lookup(start)
+            # The name index answers in time proportional to the matches
+            if snap.names is not None or found is None or not isinstance(found[1], _Dir):
+                return snap.find(start, pattern)
+            pause = _Slicer(self.slice_seconds)
+            matches = []
+            for prefix, _, dirnames, filenames in _walk(found[1], _prefix(found[0])):
+                matches += [f'{prefix}/{name}' for name in dirnames + filenames
+                            if fnmatch.fnmatchcase(name, pattern)]
+                await pause()
+            return matches
+        finally:
+            snap.close()
+
+    async def walk(self, path:str='/', topdown:bool=True):
+        """Asynchronously yield ``(dirpath, dirnames, filenames)`` like ``walk``."""
+        snap = self.fs.snapshot()
+        try:
+            pause = _Slicer(self.slice_seconds)
+            for entry in snap.walk(path, topdown):
+                yield entry
+                await pause()
+        finally:
+            snap.close()
+
+
+class _PathLock:
+    __slots__ = ('lock', 'owner', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner = None
+        self.users = 0
+
+
+class _Slicer:
+    """Awaitable that yields to the event loop once a time slice is used up."""
+
+    def __init__(self, seconds:float):
+        self.seconds = seconds
+        self.start = time.perf_counter()
+
+    async def __call__(self):
+        if time.perf_counter() - self.start >= self.seconds:
+            await asyncio.sleep(0)
+            self.start = time.perf_counter()
+
+
+class _TreeLock:
+    """Locks paths of a tree in the modes of multiple-granularity locking.
+
+    A request maps paths, as tuples of names, to modes: ``_S`` to read
+    the subtree at a path, ``_X`` to change it, and ``_IS`` or ``_IX`` on
+    every ancestor to announce that.  Requests wait for each other only
+    where their modes conflict, i.e. where one could see or change part of
+    a subtree the other uses.  All paths of a request are granted at once,
+    so requests never deadlock, and a request also waits behind the queued
+    requests it conflicts with, so a waiting writer is not starved.
+
+    ``held`` tells whether the calling thread holds a request, so
+    operations built on other operations do not lock again.  ``mutex`` is
+    held by code that changes what all paths share.
+    """
+
+    def __init__(self):
+        self.guard = threading.Lock()
+        self.cond = threading.Condition(self.guard)
+        # Path -> its grants, counted per mode in the fields of _GRANT
+        self.granted = {}
+        self.waiting = []
+        self.local = threading.local()
+        self.mutex = threading.RLock()
+        # Directories walks no longer reference, released by the next writer
+        self.unpinned = []
+
+    def held(self) -> bool:
+        return getattr(self.local, 'held', False)
+
+    def acquire(self, request:dict):
+        self._enter()
+        try:
+            if self.waiting or not self._grant(request):
+                # Requests may be shared, so each waiter queues a ticket of its own
+                ticket = [request]
+                self.waiting.append(ticket)
+                while not self._first(ticket) or not self._grant(request):
+                    self.cond.wait()
+                self._dequeue(ticket)
+        finally:
+            self.guard.release()
+        self.local.held = True
+
+    def release(self, request:dict):
+        self.local.held = False
+        self._enter()
+        try:
+            self._revoke(request)
+            if self.waiting:
+                self.cond.notify_all()
+        finally:
+            self.guard.release()
+
+    def _enter(self):
+        # A thread blocked on a lock does not ask for the GIL, so the thread
+        # holding the GIL can keep taking the guard back before a woken
+        # waiter runs; waiting in slices makes it ask now and then
+        if self.guard.acquire(False):
+            return
+        while not self.guard.acquire(timeout=_GUARD_SLICE):
+            pass
+
+    def _grant(self, request:dict) -> bool:
+        """Grant ``request`` if nothing granted conflicts with it, in one pass."""
+        granted = self.granted
+        for path, mode in request.items():
+            held = granted.get(path, 0)
+            if held & _CONFLICTING[mode]:
+                self._revoke(request, path)
+                return False
+            granted[path] = held + _GRANT[mode]
+        return True
+
+    def _revoke(self, request:dict, stop=None):
+        """Take back the grants of ``request``, or only those before path ``stop``."""
+        granted = self.granted
+        for path, mode in request.items():
+            if path == stop:
+                return
+            left = granted[path] - _GRANT[mode]
+            if left:
+                granted[path] = left
+            else:
+                del granted[path]
+
+    def _first(self, ticket:list) -> bool:
+        """Whether no request queued before ``ticket`` conflicts with its own."""
+        request, = ticket
+        for queued in self.waiting:
+            if queued is ticket:
+                return True
+            for path, mode in request.items():
+                other = queued[0].get(path)
+                if other is not None and other in _CONFLICTS[mode]:
+                    return False
+        return True
+
+    def _dequeue(self, ticket:list):
+        for i, queued in enumerate(self.waiting):
+            if queued is ticket:
+                del self.waiting[i]
+                return
+
+
+@functools.lru_cache(maxsize=_RESOLVE_CACHE_SIZE)
+def _plan(spec:tuple, paths:tuple, cwd:tuple):
+    """Return ``(targets, request)`` for locking ``paths`` as ``spec`` says.
+
+    ``targets`` pairs the absolute parts of each locked path with its mode;
+    it is ``None``, and so is the request, when a path cannot be locked as
+    written.  Memoized, so the request is shared and must not be changed.
+    """
+    targets = []
+    for path, mode in zip(paths, spec):
+        if mode is None:
+            continue
+        if not isinstance(path, str):
+            return None, None
+        names = _split(path)
+        if '..' in names:
+            return None, None
+        parts = tuple(name for name in names if name != '.')
+        targets.append((parts if path.startswith('/') else cwd + parts, mode))
+    return targets, _request(targets)
+
+
+def _request(targets:list) -> dict:
+    """Build a ``_TreeLock`` request from ``(parts, mode)`` pairs: each path in
+    its mode and every ancestor in the matching intention mode."""
+    if len(targets) == 1:
+        (parts, mode), = targets
+        intent = _IX if mode == _X else _IS
+        request = {parts[:depth]: intent for depth in range(len(parts))}
+        request[parts] = mode
+        return request
+    request = {}
+    for parts, mode in targets:
+        intent = _IX if mode == _X else _IS
+        for depth in range(len(parts) + 1):
+            wanted = mode if depth == len(parts) else intent
+            held = request.get(parts[:depth])
+            request[parts[:depth]] = wanted if held is None else _COMBINED[held][wanted]
+    return request
+
+
+class _Batch:
+    """Operations recorded inside ``VirtualFileSystem.batch()``."""
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.ops = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.results = self.fs.apply_ops(self.ops)
+        return False
+
+    def mkdir(self, path:str):
+        self.ops.append(('mkdir', path))
+
+    def mkdir_p(self, dir_path:str):
+        self.ops.append(('mkdir_p', dir_path))
+
+    def create_file(self, file_path:str, content):
+        self.ops.append(('create_file', file_path, content))
+
+    def write_file(self, file_path:str, content):
+        self.ops.append(('write_file', file_path, content))
+
+    def append(self, file_path:str, content):
+        self.ops.append(('append', file_path, content))
+
+
+# Marks a directory a batch creates
+_PENDING_DIR = object()
+
+
+class _BatchPlan:
+    """Validate a batch against an overlay, then apply it in one pass.
+
+    The methods mirror ``VirtualFileSystem``'s but only record their
+    effect in ``added``, an overlay of children maps: parent parts ->
+    ``{name: entry}``, each entry ``_PENDING_DIR`` or the unlinked
+    ``_File`` that will be stored there (a new file, or a private clone
+    of the one being changed).  Paths resolve through the tree and the
+    overlay together.  Resolved directories are memoized in ``dirs`` by
+    path string; since a batch only adds entries, a directory that
+    resolved once keeps resolving the same way.
+    """
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.added = {}
+        self.new_dirs = []
+        self.dirs = {}
+        self.delta = 0
+
+    def run(self, ops:list) -> list:
+        """Plan every op in order and return their results."""
+        fs = self.fs
+        methods = {name: getattr(self, name) for name in _BATCH_OPS}
+        dirs = self.dirs
+        added = self.added
+        results = []
+        for op in ops:
+            name = op[0]
+            # Inline the common cases: a directory that already resolved,
+            # and a new text file in one with room left in the quota
+            if name == 'mkdir_p' and op[1] in dirs:
+                results.append(True)
+                continue
+            if name == 'create_file' and len(op) == 3 and type(op[2]) is str and not fs.binary:
+                head, _, leaf = op[1].rpartition('/')
+                directory = dirs.get(head)
+                size = len(op[2])
+                if (directory is not None and leaf and leaf != '.' and leaf != '..'
+                        and fs.root.size + self.delta + size <= fs.quota):
+                    parts, node = directory
+                    siblings = added.get(parts)
+                    if ((siblings is None or leaf not in siblings)
+                            and (node is _PENDING_DIR or leaf not in node.children)):
+                        if siblings is None:
+                            siblings = added[parts] = {}
+                        siblings[leaf] = _File(op[2])
+                        self.delta += size
+                        results.append(True)
+                        continue
+            method = methods.get(name)
+            if method is None:
+                raise ValueError(f'unsupported batch operation: {name!r}')
+            results.append(method(*op[1:]))
+        return results
+
+    def _pending(self, parent:tuple, name:str):
+        siblings = self.added.get(parent)
+        return None if siblings is None else siblings.get(name)
+
+    def _add(self, parts:tuple, entry):
+        siblings = self.added.get(parts[:-1])
+        if siblings is None:
+            siblings = self.added[parts[:-1]] = {}
+        siblings[parts[-1]] = entry
+
+    def _entry(self, path:str, follow_last:bool=True):
+        """Return ``(parts, node, pending)`` for ``path`` like ``_lookup``.
+
+        ``node`` is the existing entry, if any, and ``pending`` what the
+        batch has recorded at ``parts`` so far.  Plain names below a
+        directory seen before take the memoized fast path.
+        """
+        if not path.startswith('/'):
+            path = f'{_prefix(self.fs.cwd)}/{path}'
+        head, _, name = path.rpartition('/')
+        if name and name != '.' and name != '..':
+            directory = self.dirs.get(head) or self._dir(head or '/')
+            if directory is None:
+                return None
+            parts, node = directory
+            child = None if node is _PENDING_DIR else node.children.get(name)
+            if not (follow_last and isinstance(child, _Link)):
+                return parts + (name,), child, self._pending(parts, name)
+
+        resolved = self._resolve(path, follow_last)
+        if resolved is None:
+            return None
+        parts, node = resolved
+        pending = self._pending(parts[:-1], parts[-1]) if parts else None
+        if node is pending:
+            node = None
+        return parts, node, pending
+
+    def _resolve(self, path:str, follow_last:bool):
+        """``VirtualFileSystem._resolve_path`` over the tree plus the overlay."""
+        todo = _split(path)[::-1]
+        parts = []
+        nodes = [self.fs.root]
+        hops = 0
+
+        while todo:
+            name = todo.pop()
+            node = nodes[-1]
+            if not isinstance(node, _Dir) and node is not _PENDING_DIR:
+                return None
+            if name == '.':
+                continue
+            if name == '..':
+                if parts:
+                    parts.pop()
+                    nodes.pop()
+                continue
+            child = None if node is _PENDING_DIR else node.children.get(name)
+            if child is None:
+                child = self._pending(tuple(parts), name)
+            if child is None:
+                if todo:
+                    return None
+                return tuple(parts) + (name,), None
+            if isinstance(child, _Link) and (todo or follow_last):
+                hops += 1
+                if hops > _MAX_HOPS:
+                    return None
+                if child.target.startswith('/'):
+                    parts, nodes = [], [self.fs.root]
+                todo.extend(_split(child.target)[::-1])
+                continue
+            parts.append(name)
+            nodes.append(child)
+
+        return tuple(parts), nodes[-1]
+
+    def _dir(self, path:str):
+        """Return ``(parts, node)`` for a directory; ``node`` is ``_PENDING_DIR`` if new."""
+        directory = self.dirs.get(path)
+        if directory is None:
+            entry = self._entry(path)
+            if entry is None:
+                return None
+            parts, node, pending = entry
+            if isinstance(node, _Dir):
+                directory = parts, node
+            elif node is None and pending is _PENDING_DIR:
+                directory = parts, _PENDING_DIR
+            else:
+                return None
+            self.dirs[path] = directory
+        return directory
+
+    def _fits(self, delta:int) -> bool:
+        return self.fs.root.size + self.delta + delta <= self.fs.quota
+
+    def _file(self, file_path:str):
+        """Return the pending ``_File`` for a writable file, or ``None``."""
+        entry = self._entry(file_path)
+        if entry is None:
+            return None
+        parts, node, pending = entry
+        if isinstance(pending, _File):
+            return pending
+        if not isinstance(node, _File) or 'w' not in node.permission:
+            return None
+        pending = node.clone()
+        self._add(parts, pending)
+        return pending
+
+    def mkdir(self, path:str) -> bool:
+        entry = self._entry(path, follow_last=False)
+        if entry is None or entry[1] is not None or entry[2] is not None:
+            return False
+        parts = entry[0]
+        self._add(parts, _PENDING_DIR)
+        self.new_dirs.append(parts)
+        self.dirs[_join(parts)] = parts, _PENDING_DIR
+        return True
+
+    def mkdir_p(self, dir_path:str) -> bool:
+        if not dir_path.startswith('/'):
+            dir_path = f'{_prefix(self.fs.cwd)}/{dir_path}'
+        if dir_path in self.dirs:
+            return True
+
+        entry = self._entry(dir_path)
+        if entry is not None and (entry[1] is not None or entry[2] is not None):
+            return isinstance(entry[1], _Dir) or entry[2] is _PENDING_DIR
+
+        if entry is None:
+            parent,_,_ = dir_path.rstrip('/').rpartition('/')
+            if not self.mkdir_p(parent or '/'):
+                return False
+
+        return self.mkdir(dir_path)
+
+    def create_file(self, file_path:str, content) -> bool:
+        content = self.fs._encode(content)
+        if not self._fits(len(content)):
+            return False
+        entry = self._entry(file_path)
+        if entry is None or entry[1] is not None or entry[2] is not None:
+            return False
+        self._add(entry[0], _File(content))
+        self.delta += len(content)
+        return True
+
+    def write_file(self, file_path:str, content) -> bool:
+        content = self.fs._encode(content)
+        node = self._file(file_path)
+        if node is None or not self._fits(len(content) - node.data.size):
+            return False
+        self.delta += len(content) - node.data.size
+        node.content = content
+        return True
+
+    def append(self, file_path:str, content) -> bool:
+        content = self.fs._encode(content)
+        node = self._file(file_path)
+        if node is None or not self._fits(len(content)):
+            return False
+        self.delta += len(content)
+        node.data.append(content)
+        return True
+
+    def apply(self):
+        fs = self.fs
+        owned = {}
+
+        def own(parts:tuple):
+            directory = owned.get(parts)
+            if directory is None:
+                chain = fs._own(list(parts) + [None])
+                for depth, directory in enumerate(chain):
+                    owned[parts[:depth]] = directory
+            return directory
+
+        for parts in self.new_dirs:
+            directory = _Dir()
+            fs._link(own(parts[:-1]), parts[-1], directory)
+            owned[parts] = directory
+
+        for parts, entries in self.added.items():
+            parent = own(parts)
+            delta = 0
+            for name, node in entries.items():
+                if node is _PENDING_DIR:
+                    continue
+                old = parent.children.get(name)
+                if old is not None:
+                    delta -= old.data.size
+                    fs._release(fs._unlink(parent, name))
+                fs._link(parent, name, node)
+                delta += node.data.size
+                if fs.index is not None:
+                    fs.index.add(node)
+                if fs.blobs is not None:
+                    fs.blobs.add(node)
+            for depth in range(len(parts) + 1):
+                owned[parts[:depth]].size += delta
+
+        if self.new_dirs:
+            fs._invalidate()
+
+
+class _Metrics:
+    """Counters and a latency histogram for every traced operation.
+
+    Latencies land in power-of-two buckets from one microsecond up, so
+    recording is a ``bisect`` and an increment and memory stays fixed.
+    """
+
+    def __init__(self):
+        self.ops = {}
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.ops.clear()
+
+    def record(self, op:str, elapsed:float, nbytes:int, failed:bool):
+        with self.lock:
+            self._record(op, elapsed, nbytes, failed)
+
+    def _record(self, op:str, elapsed:float, nbytes:int, failed:bool):
+        entry = self.ops.get(op)
+        if entry is None:
+            entry = self.ops[op] = _OpMetrics()
+        entry.calls += 1
+        entry.seconds += elapsed
+        entry.buckets[bisect.bisect_left(_BUCKETS, elapsed)] += 1
+        if failed:
+            entry.errors += 1
+        if op in _READS:
+            entry.bytes_read += nbytes
+        elif op in _WRITES:
+            entry.bytes_written += nbytes
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> dict:
+        return {op: {'calls': entry.calls, 'errors': entry.errors,
+                     'bytes_read': entry.bytes_read, 'bytes_written': entry.bytes_written,
+                     'seconds': entry.seconds,
+                     'p50': entry.percentile(0.50), 'p99': entry.percentile(0.99)}
+                for op, entry in sorted(self.ops.items())}
+
+    def prometheus(self) -> str:
+        with self.lock:
+            return self._prometheus()
+
+    def _prometheus(self) -> str:
+        lines = []
+        counters = [('vfs_operations_total', 'Operations called.', 'calls'),
+                    ('vfs_operation_errors_total', 'Operations that raised or failed.', 'errors'),
+                    ('vfs_read_bytes_total', 'Content bytes returned by reads.', 'bytes_read'),
+                    ('vfs_written_bytes_total', 'Content bytes passed to writes.', 'bytes_written')]
+        for metric, help_text, field in counters:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for op, entry in sorted(self.ops.items()):
+                lines.append(f'{metric}{{op="{op}"}} {getattr(entry, field)}')
+
+        metric = 'vfs_operation_duration_seconds'
+        lines += [f'# HELP {metric} Operation latency.', f'# TYPE {metric} histogram']
+        for op, entry in sorted(self.ops.items()):
+            total = 0
+            for bound, count in zip(_BUCKETS, entry.buckets):
+                total += count
+                lines.append(f'{metric}_bucket{{op="{op}",le="{bound:g}"}} {total}')
+            lines.append(f'{metric}_bucket{{op="{op}",le="+Inf"}} {entry.calls}')
+            lines.append(f'{metric}_sum{{op="{op}"}} {entry.seconds:.9f}')
+            lines.append(f'{metric}_count{{op="{op}"}} {entry.calls}')
+        return '\n'.join(lines) + '\n'
+
+
+class _OpMetrics:
+    __slots__ = ('calls', 'errors', 'bytes_read', 'bytes_written', 'seconds', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.seconds = 0.0
+        # One slot per bound in _BUCKETS plus the overflow slot
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+
+    def percentile(self, fraction:float) -> float:
+        """Upper bound of the bucket holding the ``fraction`` quantile."""
+        if not self.calls:
+            return None
+        rank = max(1, -(-self.calls * fraction // 1))
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return _BUCKETS[i] if i < len(_BUCKETS) else float('inf')
+        return float('inf')
+
+
+# Histogram bucket upper bounds in seconds: 1us, 2us, 4us ... about 17 minutes
+_BUCKETS = tuple(1e-6 * 2 ** i for i in range(31))
+
+
+class _Dir:
+    __slots__ = ('children', 'size', 'refs', 'parents')
+
+    def __init__(self):
+        self.children = {}
+        self.size = 0
+        self.refs = 1
+        # (parent, name) pairs, only maintained when names are indexed
+        self.parents = None
+
+    def clone(self):
+        copied = _Dir()
+        copied.children = dict(self.children)
+        copied.size = self.size
+        for child in copied.children.values():
+            child.refs += 1
+        return copied
+
+
+class _File:
+    __slots__ = ('data', 'permission', 'refs', 'blob')
+
+    def __init__(self, content, permission:str='rw'):
+        self.data = content if isinstance(content, _Rope) else _Rope(content)
+        self.permission = permission
+        self.refs = 1
+        # The content shared through the blob store, when it holds this file
+        self.blob = None
+
+    @property
+    def content(self):
+        return self.data.text()
+
+    @content.setter
+    def content(self, content):
+        self.data = _Rope(content)
+
+    def clone(self):
+        return _File(self.data.copy(), self.permission)
+
+
+class _Rope:
+    """File content kept as a list of immutable chunks.
+
+    ``append`` adds a chunk instead of copying the body, and a trailing run
+    of small chunks is joined once it reaches ``_CHUNK`` characters, so
+    every character is copied at most once more and the chunk count stays
+    bounded.  ``starts`` holds each chunk's offset so ranged reads and
+    truncation find their chunk by bisection.
+    """
+    __slots__ = ('chunks', 'starts', 'size', 'run', 'empty')
+
+    def __init__(self, content):
+        self.chunks = [content] if content else []
+        self.starts = [0] if content else []
+        self.size = len(content)
+        # Index of the first chunk in the trailing run of small appends
+        self.run = len(self.chunks)
+        self.empty = content[:0]
+
+    def copy(self):
+        copied = _Rope(self.empty)
+        copied.chunks = self.chunks[:]
+        copied.starts = self.starts[:]
+        copied.size = self.size
+        copied.run = self.run
+        return copied
+
+    def text(self):
+        """Return the whole content, joining the chunks into one first."""
+        if len(self.chunks) > 1:
+            self.chunks = [self.empty.join(self.chunks)]
+            self.starts = [0]
+            self.run = 1
+        return self.chunks[0] if self.chunks else self.empty
+
+    def read(self, offset:int, length:int=None):
+        end = self.size if length is None else min(self.size, offset + length)
+        if offset >= end:
+            return self.empty
+        i = bisect.bisect_right(self.starts, offset) - 1
+        pieces = []
+        while i < len(self.chunks) and self.starts[i] < end:
+            start = self.starts[i]
+            pieces.append(self.chunks[i][max(offset - start, 0):end - start])
+            i += 1
+        return pieces[0] if len(pieces) == 1 else self.empty.join(pieces)
+
+    def view(self, offset:int, length:int=None, join:bool=True) -> memoryview:
+        """Return a ``memoryview`` of a range of ``bytes`` content.
+
+        A range spanning chunks joins them in place, or with ``join=False``
+        is copied out and leaves the rope untouched.
+        """
+        end = self.size if length is None else min(self.size, offset + length)
+        if offset >= end:
+            return memoryview(self.empty)
+        i = bisect.bisect_right(self.starts, offset) - 1
+        if end > self.starts[i] + len(self.chunks[i]):
+            if not join:
+                return memoryview(self.read(offset, length))
+            self.text()
+            i = 0
+        start = self.starts[i]
+        return memoryview(self.chunks[i])[offset - start:end - start]
+
+    def append(self, content):
+        if not content:
+            return
+        self.chunks.append(content)
+        self.starts.append(self.size)
+        self.size += len(content)
+        if self.size - self.starts[self.run] >= _CHUNK:
+            if len(self.chunks) - self.run > 1:
+                merged = self.empty.join(self.chunks[self.run:])
+                del self.chunks[self.run:], self.starts[self.run + 1:]
+                self.chunks.append(merged)
+            self.run = len(self.chunks)
+
+    def truncate(self, length:int):
+        if length >= self.size:
+            return
+        i = bisect.bisect_right(self.starts, length) - 1
+        cut = length - self.starts[i]
+        del self.chunks[i + 1:], self.starts[i + 1:]
+        if cut:
+            self.chunks[i] = self.chunks[i][:cut]
+        else:
+            del self.chunks[i], self.starts[i]
+        self.size = length
+        self.run = min(self.run, len(self.chunks))
+
+
+# Appended text is gathered into chunks of about this many characters
+_CHUNK = 64 * 1024
+
+
+class _MappedRope(_Rope):
+    """A rope whose content still lies in a loaded ``_Image``.
+
+    Only ``size`` is known up front.  The first call that needs the
+    content reads it from the mapping and from then on this is an ordinary
+    rope; copies taken before that share the mapped range instead.
+    """
+    __slots__ = ('image', 'start', 'stop')
+
+    def __init__(self, image, start:int, stop:int, size:int):
+        self.image = image
+        self.start = start
+        self.stop = stop
+        self.size = size
+        self.empty = image.empty
+
+    def fault(self):
+        # Readers may fault the same rope together in thread-safe mode, so
+        # the chunks are complete before ``image`` marks them as read
+        image = self.image
+        if image is None:
+            return
+        content = image.read(self.start, self.stop)
+        self.starts = [0]
+        self.run = 1
+        self.chunks = [content]
+        self.image = None
+
+    def copy(self):
+        image = self.image
+        if image is None:
+            return super().copy()
+        return _MappedRope(image, self.start, self.stop, self.size)
+
+    def text(self):
+        self.fault()
+        return super().text()
+
+    def read(self, offset:int, length:int=None):
+        self.fault()
+        return super().read(offset, length)
+
+    def view(self, offset:int, length:int=None, join:bool=True) -> memoryview:
+        self.fault()
+        return super().view(offset, length, join)
+
+    def append(self, content):
+        self.fault()
+        super().append(content)
+
+    def truncate(self, length:int):
+        self.fault()
+        super().truncate(length)
+
+
+class _Image:
+    """An image written by ``save``, mapped read-only into memory.
+
+    Layout: a ``_HEADER``, the file contents back to back, the entry
+    table with one ``_ENTRY`` per node in preorder, and the heap holding
+    names, permissions and symlink targets as UTF-8.  Ropes from ``tree``
+    keep the image alive until they have read their content.
+    """
+    __slots__ = ('map', 'binary', 'empty', 'quota', 'count', 'heap', 'table', 'sequence')
+
+    def __init__(self, file_path:str):
+        with open(file_path, 'rb') as source:
+            if os.fstat(source.fileno()).st_size < _HEADER.size:
+                raise ValueError(f'{file_path} is not a VirtualFileSystem image')
+            self.map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, self.quota, self.count, self.heap, self.table, self.sequence = \
+            _HEADER.unpack_from(self.map)
+        if magic != _IMAGE_MAGIC or version != _IMAGE_VERSION:
+            raise ValueError(f'{file_path} is not a VirtualFileSystem image')
+        if self.table + self.count * _ENTRY.size + self.heap > len(self.map):
+            raise ValueError(f'{file_path} is truncated')
+        self.binary = bool(flags & _IMAGE_BINARY)
+        self.empty = b'' if self.binary else ''
+
+    def read(self, start:int, stop:int):
+        data = self.map[start:stop]
+        return data if self.binary else data.decode()
+
+    def tree(self, fs) -> _Dir:
+        """Build the saved tree, linked through ``fs`` to keep its indexes current."""
+        end = self.table + self.count * _ENTRY.size
+        heap = self.map[end:end + self.heap]
+        nodes = []
+        for kind, name_length, extra_length, parent, start, offset, length, size in \
+                _ENTRY.iter_unpack(self.map[self.table:end]):
+            extra = heap[start + name_length:start + name_length + extra_length].decode()
+            if kind == _IMAGE_DIR:
+                node = _Dir()
+                node.size = size
+            elif kind == _IMAGE_FILE:
+                start_of_content = _HEADER.size + offset
+                data = (_MappedRope(self, start_of_content, start_of_content + length, size)
+                        if length else _Rope(self.empty))
+                node = _File(data, extra)
+                if fs.index is not None:
+                    fs.index.add(node)
+                if fs.blobs is not None:
+                    fs.blobs.add(node)
+            elif kind == _IMAGE_LINK:
+                node = _Link(extra)
+            else:
+                node = nodes[offset]
+                node.refs += 1
+            if nodes:
+                fs._link(nodes[parent], heap[start:start + name_length].decode(), node)
+            nodes.append(node)
+        return nodes[0]
+
+
+def _write_image(out, root:_Dir, quota:int, binary:bool, sequence:int=0):
+    """Write ``root`` to the binary file ``out`` in the layout ``_Image`` reads."""
+    out.write(bytes(_HEADER.size))
+    entries, heap, offset = [], bytearray(), 0
+    # Entry of the first place each shared node was written
+    shared = {}
+    stack = [(0, '', root)]
+    while stack:
+        parent, name, node = stack.pop()
+        name = name.encode()
+        start = len(heap)
+        heap += name
+        if node.refs > 1:
+            first = shared.setdefault(id(node), len(entries))
+            if first != len(entries):
+                entries.append(_ENTRY.pack(_IMAGE_SHARED, len(name), 0, parent, start, first, 0, 0))
+                continue
+        if isinstance(node, _Dir):
+            stack.extend((len(entries), child_name, child)
+                         for child_name, child in reversed(node.children.items()))
+            entries.append(_ENTRY.pack(_IMAGE_DIR, len(name), 0, parent, start, 0, 0, node.size))
+            continue
+        extra = (node.permission if isinstance(node, _File) else node.target).encode()
+        heap += extra
+        if isinstance(node, _File):
+            length = _write_content(out, node.data, binary)
+            entries.append(_ENTRY.pack(_IMAGE_FILE, len(name), len(extra), parent, start,
+                                       offset, length, node.data.size))
+            offset += length
+        else:
+            entries.append(_ENTRY.pack(_IMAGE_LINK, len(name), len(extra), parent, start, 0, 0, 0))
+    out.write(b''.join(entries))
+    out.write(heap)
+    out.seek(0)
+    out.write(_HEADER.pack(_IMAGE_MAGIC, _IMAGE_VERSION, _IMAGE_BINARY if binary else 0,
+                           quota, len(entries), len(heap), _HEADER.size + offset, sequence))
+
+
+def _write_content(out, data:_Rope, binary:bool) -> int:
+    """Write one file's content to ``out`` and return its length in bytes."""
+    image = getattr(data, 'image', None)
+    if image is not None:
+        # Still unread: copy the encoded bytes straight from the old image
+        with memoryview(image.map) as mapped:
+            return out.write(mapped[data.start:data.stop])
+    length = 0
+    for chunk in data.chunks:
+        length += out.write(chunk if binary else chunk.encode())
+    return length
+
+
+_IMAGE_MAGIC = b'VFSIMAGE'
+_IMAGE_VERSION = 1
+_IMAGE_BINARY = 1
+# magic, version, flags, quota, entry count, heap bytes, table offset, and
+# the last journal record included (0 outside a journal)
+_HEADER = struct.Struct('<8sHH4xqQQQQ')
+# kind, name bytes, extra bytes, parent entry, heap offset, content offset
+# (or the first entry of a shared node), content bytes, size
+_ENTRY = struct.Struct('<BxHIQQQQQ')
+_IMAGE_DIR, _IMAGE_FILE, _IMAGE_LINK, _IMAGE_SHARED = range(4)
+
+
+def _umask() -> int:
+    """Return the process umask, which can only be read by setting it."""
+    # The stricter mask meanwhile can only make files of other threads less
+    # accessible, never more
+    umask = os.umask(0o077)
+    os.umask(umask)
+    return umask
+
+
+class _Journal:
+    """The append-only log behind ``open_journal``.
+
+    A record is a ``_RECORD`` header (payload bytes, CRC-32 of everything
+    after the CRC, sequence number) followed by the payload: the op's index
+    in ``_JOURNAL_OPS`` and its arguments packed by ``_pack``.  Records
+    gather in ``pending`` and are written as one group once ``due``, or
+    by ``timer`` once the first of them is ``group_seconds`` old.
+    ``finalizer``, set by ``open_journal``, closes the journal once, when
+    called or when its filesystem goes away.
+    ``depth`` counts the journaled calls in progress, so nested ones are
+    not recorded twice.
+
+    In thread-safe mode records are made under the filesystem's mutex and
+    flushed after it is released: ``lock`` guards ``pending`` and ``io``
+    keeps the groups in order, so a slow fsync holds up only the flushes.
+    """
+
+    def __init__(self, file_path:str, sequence:int, fsync:str, group_size:int,
+                 group_seconds:float, max_bytes:int):
+        self.path = file_path
+        self.file = open(file_path, 'ab')
+        self.size = self.file.tell()
+        self.sequence = sequence
+        self.fsync = fsync
+        self.group_size = group_size
+        self.group_seconds = group_seconds
+        self.max_bytes = max_bytes
+        self.pending = bytearray()
+        self.count = 0
+        self.started = 0.0
+        self.due = False
+        self.timer = None
+        self.depth = 0
+        self.lock = threading.Lock()
+        self.io = threading.RLock()
+
+    @staticmethod
+    def encode(op:str, args:tuple) -> bytearray:
+        """Pack a record for ``op`` called with ``args``, leaving its header for ``record``."""
+        record = bytearray(_RECORD.size)
+        record.append(_JOURNAL_CODES[op])
+        _pack(args, record)
+        return record
+
+    def record(self, record:bytearray):
+        """Number, checksum and queue a record made by ``encode``."""
+        self.sequence += 1
+        _RECORD.pack_into(record, 0, len(record) - _RECORD.size, 0, self.sequence)
+        _RECORD.pack_into(record, 0, len(record) - _RECORD.size,
+                          zlib.crc32(memoryview(record)[8:]), self.sequence)
+        self.size += len(record)
+        now = time.monotonic()
+        with self.lock:
+            self.pending += record
+            self.count += 1
+            if self.count == 1:
+                self.started = now
+            self.due = (self.fsync == 'always' or self.count >= self.group_size
+                        or now - self.started >= self.group_seconds)
+            if self.count == 1 and not self.due and self.timer is None:
+                # Without a timer a lone record would wait for the next one;
+                # one still running flushes this group early instead
+                self.timer = threading.Timer(self.group_seconds, self._expire)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.io:
+            with self.lock:
+                pending, self.pending = self.pending, bytearray()
+                self.count = 0
+                self.due = False
+            if pending:
+                self.file.write(pending)
+                self.file.flush()
+                if self.fsync != 'never':
+                    os.fsync(self.file.fileno())
+
+    def _expire(self):
+        with self.lock:
+            self.timer = None
+        self.flush()
+
+    def reset(self):
+        """Empty the journal once a checkpoint holds everything in it."""
+        with self.io:
+            self.flush()
+            self.file.truncate(0)
+            if self.fsync != 'never':
+                os.fsync(self.file.fileno())
+            self.size = 0
+
+    def close(self):
+        with self.io:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.flush()
+            self.file.close()
+
+
+def _records(data:bytes):
+    """Yield ``(sequence, op, args, end)`` for each intact record in ``data``.
+
+    Stops at the first record that is cut short or fails its CRC, as the
+    last one does when a crash tore its write.
+    """
+    view = memoryview(data)
+    position = 0
+    while position + _RECORD.size < len(data):
+        length, crc, sequence = _RECORD.unpack_from(data, position)
+        end = position + _RECORD.size + length
+        if end > len(data) or zlib.crc32(view[position + 8:end]) != crc:
+            return
+        args, _ = _unpack(data, position + _RECORD.size + 1)
+        yield sequence, _JOURNAL_OPS[data[position + _RECORD.size]], args, end
+        position = end
+
+
+def _pack(value, out:bytearray):
+    """Append ``value``, an int, float, str, buffer or a list or tuple of them, to ``out``."""
+    if isinstance(value, int):
+        out += _PACKED_INT.pack(_TAG_INT, value)
+    elif isinstance(value, float):
+        out += _PACKED_FLOAT.pack(_TAG_FLOAT, value)
+    elif isinstance(value, (list, tuple)):
+        out += _PACKED_LENGTH.pack(_TAG_SEQUENCE, len(value))
+        for item in value:
+            _pack(item, out)
+    else:
+        tag = _TAG_STR if isinstance(value, str) else _TAG_BYTES
+        data = value.encode() if tag == _TAG_STR else memoryview(value).cast('B')
+        out += _PACKED_LENGTH.pack(tag, len(data))
+        out += data
+
+
+def _unpack(data:bytes, position:int):
+    """Read one value written by ``_pack``; lists come back as tuples."""
+    tag = data[position]
+    if tag == _TAG_INT:
+        return _PACKED_INT.unpack_from(data, position)[1], position + _PACKED_INT.size
+    if tag == _TAG_FLOAT:
+        return _PACKED_FLOAT.unpack_from(data, position)[1], position + _PACKED_FLOAT.size
+    length = _PACKED_LENGTH.unpack_from(data, position)[1]
+    position += _PACKED_LENGTH.size
+    if tag == _TAG_SEQUENCE:
+        items = []
+        for _ in range(length):
+            item, position = _unpack(data, position)
+            items.append(item)
+        return tuple(items), position
+    value = data[position:position + length]
+    return (value.decode() if tag == _TAG_STR else value), position + length
+
+
+def _absolute(cwd:list, path:str) -> str:
+    """Return ``path`` as ``_lookup`` would resolve it from working directory ``cwd``."""
+    return path if path.startswith('/') else f'{_prefix(cwd)}/{path}'
+
+
+# payload bytes, CRC-32, sequence number
+_RECORD = struct.Struct('<IIQ')
+_PACKED_INT = struct.Struct('<Bq')
+_PACKED_FLOAT = struct.Struct('<Bd')
+_PACKED_LENGTH = struct.Struct('<BI')
+_TAG_INT, _TAG_STR, _TAG_BYTES, _TAG_SEQUENCE, _TAG_FLOAT = range(5)
+
+
+class _Link:
+    __slots__ = ('target', 'refs')
+
+    def __init__(self, target:str):
+        self.target = target
+        self.refs = 1
+
+    def clone(self):
+        return _Link(self.target)
+
+
+def _size(node) -> int:
+    if isinstance(node, _File):
+        return node.data.size
+    if isinstance(node, _Dir):
+        return node.size
+    return 0
+
+
+def _grow(chain:list, delta:int):
+    """Add ``delta`` bytes to the running total of every directory in ``chain``."""
+    for directory in chain:
+        directory.size += delta
+
+
+class _TrigramIndex:
+    """Maps every three-character substring to the files containing it.
+
+    A pattern of three or more characters can only occur in files that hold
+    all of its trigrams, so intersecting their postings gives a superset of
+    the matches that ``grep`` then confirms with a substring test.
+    """
+
+    def __init__(self):
+        self.postings = {}
+
+    def add(self, node:_File, text:str=None):
+        """Index ``node`` under the trigrams of ``text`` (default: its content)."""
+        for gram in _trigrams(node.content if text is None else text):
+            self.postings.setdefault(gram, set()).add(node)
+
+    def discard(self, node:_File):
+        for gram in _trigrams(node.content):
+            files = self.postings.get(gram)
+            if files is not None:
+                files.discard(node)
+                if not files:
+                    del self.postings[gram]
+
+    def candidates(self, pattern:str):
+        """Return the files that may contain ``pattern``, or ``None`` for all."""
+        grams = _trigrams(pattern)
+        if not grams:
+            return None
+        postings = sorted((self.postings.get(gram, _EMPTY) for gram in grams), key=len)
+        return postings[0].intersection(*postings[1:])
+
+    def stats(self) -> dict:
+        entries = sum(len(files) for files in self.postings.values())
+        memory = sys.getsizeof(self.postings) + sum(
+            sys.getsizeof(gram) + sys.getsizeof(files)
+            for gram, files in self.postings.items())
+        return {'trigrams': len(self.postings), 'entries': entries, 'bytes': memory}
+
+
+_EMPTY = frozenset()
+
+
+class _BlobStore:
+    """Keeps each distinct file content once, shared by every file holding it.
+
+    ``blobs`` maps a content to ``[content, refs]``, with ``refs`` counting
+    the file nodes that hold it; the dict is keyed by the content's hash
+    and compares contents on a match, so unequal contents never share.  A
+    file whose content is one chunk, as after ``create_file`` or
+    ``write_file``, holds a blob: its chunk is swapped for the stored
+    object and ``_File.blob`` records it.  Appends and truncation build
+    new chunks, so the file is kept apart, at its own size in ``private``,
+    until its next whole write; so are loaded files not read yet.  Nodes
+    shared by copy-on-write are a single file here, so ``copy`` costs
+    nothing until one side changes.
+    """
+
+    def __init__(self):
+        self.blobs = {}
+        # Bytes in distinct blobs, and in files kept apart
+        self.shared = 0
+        self.private = 0
+
+    def add(self, node:_File):
+        data = node.data
+        if getattr(data, 'image', None) is not None or len(data.chunks) != 1:
+            self.private += data.size
+            return
+        content = data.chunks[0]
+        entry = self.blobs.get(content)
+        if entry is None:
+            entry = self.blobs[content] = [content, 0]
+            self.shared += len(content)
+        entry[1] += 1
+        data.chunks[0] = node.blob = entry[0]
+
+    def discard(self, node:_File):
+        blob = node.blob
+        if blob is None:
+            self.private -= node.data.size
+            return
+        node.blob = None
+        entry = self.blobs[blob]
+        entry[1] -= 1
+        if not entry[1]:
+            del self.blobs[blob]
+            self.shared -= len(blob)
+
+
+class _NameIndex:
+    """Maps every entry name to the set of directories holding it.
+
+    Together with each directory's ``parents`` this answers "where is
+    ``name``?" in time proportional to the number of matches.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+
+    def add(self, parent:_Dir, name:str, node):
+        self.dirs.setdefault(name, set()).add(parent)
+        if isinstance(node, _Dir):
+            if node.parents is None:
+                node.parents = set()
+            node.parents.add((parent, name))
+
+    def discard(self, parent:_Dir, name:str, node):
+        dirs = self.dirs.get(name)
+        if dirs is not None:
+            dirs.discard(parent)
+            if not dirs:
+                del self.dirs[name]
+        if isinstance(node, _Dir) and node.parents is not None:
+            node.parents.discard((parent, name))
+
+    def add_dir(self, directory:_Dir):
+        for name, child in directory.children.items():
+            self.add(directory, name, child)
+
+    def discard_dir(self, directory:_Dir):
+        for name, child in directory.children.items():
+            self.discard(directory, name, child)
+
+    def match(self, pattern:str) -> list:
+        """Return ``(directory, name)`` for every entry matching ``pattern``."""
+        if not _GLOB_CHARS.intersection(pattern):
+            return [(parent, pattern) for parent in self.dirs.get(pattern, ())]
+        return [(parent, name)
+                for name in self.dirs if fnmatch.fnmatchcase(name, pattern)
+                for parent in self.dirs[name]]
+
+
+_GLOB_CHARS = frozenset('*?[')
+
+
+def _trigrams(text:str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _grep_batch(files, pattern:str, regex:bool, limit:int=None) -> list:
+    """Return the paths of the ``(path, content)`` pairs that match.
+
+    Module-level so that process pool workers can unpickle it.
+    """
+    search = re.compile(pattern).search if regex else None
+    matches = []
+    for path, content in files:
+        if search(content) if regex else pattern in content:
+            matches.append(path)
+            if len(matches) == limit:
+                break
+    return matches
+
+
+def _check_limit(limit:int):
+    """Refuse a ``max_results`` that is neither ``None`` nor positive."""
+    if limit is not None and limit < 1:
+        raise ValueError(f'max_results must be None or at least 1, got {limit}')
+
+
+def _batches(files:list, count:int) -> list:
+    """Split ``files`` into at most about ``count`` runs of similar byte size."""
+    target = max(sum(len(content) for _, content in files) / count, 1)
+    batches, batch, size = [], [], 0
+    for item in files:
+        batch.append(item)
+        size += len(item[1])
+        if size >= target:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _split(path:str) -> list:
+    return [name for name in path.split('/') if name]
+
+
+def _prefix(parts:list) -> str:
+    return ''.join(['/' + name for name in parts])
+
+
+def _join(parts:list) -> str:
+    return _prefix(parts) or '/'
+
+
+def _walk(node:_Dir, prefix:str, topdown:bool=True):
+    """Yield ``(prefix, directory, dirnames, filenames)`` for ``node`` and
+    every directory below it, where ``prefix`` is ``''`` for the root.
+
+    Iterative, so deep trees do not hit the recursion limit, and only the
+    directories still waiting to be visited are held in memory.
+    """
+    stack = [(prefix, node, None)]
+    while stack:
+        prefix, directory, names = stack.pop()
+        if names is None:
+            dirnames, filenames = [], []
+            for name, child in directory.children.items():
+                (dirnames if isinstance(child, _Dir) else filenames).append(name)
+            if topdown:
+                yield prefix, directory, dirnames, filenames
+            else:
+                stack.append((prefix, directory, (dirnames, filenames)))
+            for name in reversed(dirnames):
+                child = directory.children.get(name)
+                if isinstance(child, _Dir):
+                    stack.append((f'{prefix}/{name}', child, None))
+        else:
+            yield (prefix, directory) + names
+
+
+def _files(node, path:str):
+    """Yield ``(path, file)`` for every file at or below ``node``."""
+    if isinstance(node, _File):
+        yield path, node
+    elif isinstance(node, _Dir):
+        for prefix, directory, _, filenames in _walk(node, path):
+            for name in filenames:
+                child = directory.children.get(name)
+                if isinstance(child, _File):
+                    yield f'{prefix}/{name}', child
 
 
+def _leaf(name:str, node) -> dict:
+    if isinstance(node, _Link):
+        return {'name': name, 'type': 'symlink', 'target': node.target}
+    return {'name': name, 'type': 'file'}
@@ -1,5 +1,16 @@
+import asyncio
+import fractions
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from solution import VirtualFileSystem
+import unittest.mock
+from solution import AsyncVirtualFileSystem, VirtualFileSystem, logging_tracer
 
 
 class TestVirtualFileSystem(unittest.TestCase):
@@ -236,6 +247,11 @@ class TestVirtualFileSystem(unittest.TestCase):
     def test_set_quota(self):
         self.assertTrue(self.fs.set_quota(100))
 
+    def test_fractional_quota(self):
+        self.fs.set_quota(10.5)
+        self.assertFalse(self.fs.create_file("/big.txt", "x" * 11))
+        self.assertTrue(self.fs.create_file("/file.txt", "x" * 10))
+
     def test_create_file_within_quota(self):
         self.fs.set_quota(100)
         self.assertTrue(self.fs.create_file("/file.txt", "x" * 50))
@@ -449,7 +465,1622 @@ class TestVirtualFileSystem(unittest.TestCase):
 
     def test_pwd_initial(self):
         self.assertEqual(self.fs.pwd(), "/")
-    
+
+    # ==================== TREE STORAGE ====================
+
+    def test_list_empty_directory(self):
+        self.fs.mkdir("/empty")
+        self.assertEqual(self.fs.ls("/empty"), [])
+
+    def test_list_only_direct_children(self):
+        self.fs.mkdir_p("/docs/sub")
+        self.fs.create_file("/docs/sub/deep.txt", "")
+        self.fs.create_file("/docs-old.txt", "")
+        self.assertEqual(self.fs.ls("/docs"), ["sub"])
+
+    def test_create_file_without_parent_fails(self):
+        self.assertFalse(self.fs.create_file("/missing/file.txt", "data"))
+        self.assertFalse(self.fs.exists("/missing"))
+
+    def test_delete_recursive_keeps_siblings_with_shared_prefix(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.mkdir("/ab")
+        self.fs.create_file("/ab/file.txt", "keep")
+        self.assertTrue(self.fs.delete_recursive("/a"))
+        self.assertEqual(self.fs.read_file("/ab/file.txt"), "keep")
+
+    def test_delete_recursive_nonexistent(self):
+        self.assertFalse(self.fs.delete_recursive("/nonexistent"))
+
+    def test_move_keeps_permissions(self):
+        self.fs.create_file("/file.txt", "data")
+        self.fs.chmod("/file.txt", "r")
+        self.assertTrue(self.fs.move("/file.txt", "/moved.txt"))
+        self.assertFalse(self.fs.write_file("/moved.txt", "new"))
+
+    def test_list_through_symlinked_directory(self):
+        self.fs.mkdir("/realdir")
+        self.fs.create_file("/realdir/file.txt", "")
+        self.fs.symlink("/realdir", "/linkdir")
+        self.assertEqual(self.fs.ls("/linkdir"), ["file.txt"])
+
+    def test_move_directory_relinks_subtree(self):
+        self.fs.mkdir_p("/src/a/b")
+        self.fs.create_file("/src/a/b/file.txt", "deep")
+        self.fs.chmod("/src/a/b/file.txt", "r")
+        self.assertTrue(self.fs.move("/src", "/renamed"))
+        self.assertEqual(self.fs.read_file("/renamed/a/b/file.txt"), "deep")
+        self.assertFalse(self.fs.write_file("/renamed/a/b/file.txt", "new"))
+        self.assertIsNone(self.fs.ls("/src"))
+
+    def test_move_onto_existing_path_fails(self):
+        self.fs.mkdir("/a")
+        self.fs.mkdir("/b")
+        self.assertFalse(self.fs.move("/a", "/b"))
+        self.assertTrue(self.fs.exists("/a"))
+
+    def test_move_into_symlinked_directory(self):
+        self.fs.mkdir("/realdir")
+        self.fs.symlink("/realdir", "/linkdir")
+        self.fs.create_file("/file.txt", "data")
+        self.assertTrue(self.fs.move("/file.txt", "/linkdir/file.txt"))
+        self.assertEqual(self.fs.read_file("/realdir/file.txt"), "data")
+
+    def test_move_into_self_through_symlink_fails(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.symlink("/a/b", "/shortcut")
+        self.assertFalse(self.fs.move("/a", "/shortcut/a"))
+
+    # ==================== COPY-ON-WRITE ====================
+
+    def test_copy_directory_shares_nodes(self):
+        self.fs.mkdir_p("/src/a")
+        self.fs.create_file("/src/a/file.txt", "data")
+        self.fs.copy("/src", "/dest")
+        self.assertIs(self.fs._node("/src"), self.fs._node("/dest"))
+
+    def test_write_to_copied_tree_leaves_original(self):
+        self.fs.mkdir_p("/src/a")
+        self.fs.create_file("/src/a/file.txt", "original")
+        self.fs.copy("/src", "/dest")
+        self.assertTrue(self.fs.write_file("/dest/a/file.txt", "changed"))
+        self.assertEqual(self.fs.read_file("/src/a/file.txt"), "original")
+        self.assertEqual(self.fs.read_file("/dest/a/file.txt"), "changed")
+
+    def test_write_to_original_leaves_copy(self):
+        self.fs.mkdir_p("/src/a")
+        self.fs.create_file("/src/a/file.txt", "original")
+        self.fs.copy("/src", "/dest")
+        self.fs.write_file("/src/a/file.txt", "changed")
+        self.assertEqual(self.fs.read_file("/dest/a/file.txt"), "original")
+
+    def test_chmod_copy_leaves_original(self):
+        self.fs.create_file("/original.txt", "data")
+        self.fs.copy("/original.txt", "/copy.txt")
+        self.fs.chmod("/copy.txt", "r")
+        self.assertTrue(self.fs.write_file("/original.txt", "new"))
+
+    def test_structure_changes_in_copy_leave_original(self):
+        self.fs.mkdir_p("/src/a")
+        self.fs.create_file("/src/a/file.txt", "data")
+        self.fs.copy("/src", "/dest")
+        self.fs.delete("/dest/a/file.txt")
+        self.fs.mkdir("/dest/a/new")
+        self.assertEqual(self.fs.ls("/src/a"), ["file.txt"])
+        self.assertEqual(self.fs.ls("/dest/a"), ["new"])
+
+    def test_copy_charges_quota_once(self):
+        self.fs.set_quota(25)
+        self.fs.create_file("/file.txt", "x" * 10)
+        self.assertTrue(self.fs.copy("/file.txt", "/copy1.txt"))
+        self.assertFalse(self.fs.copy("/file.txt", "/copy2.txt"))
+        self.assertEqual(self.fs.disk_usage(), 20)
+
+    # ==================== SIZE COUNTERS ====================
+
+    def test_directory_size_follows_writes(self):
+        self.fs.mkdir_p("/dir/sub")
+        self.fs.create_file("/dir/sub/file.txt", "abc")
+        self.fs.write_file("/dir/sub/file.txt", "abcdef")
+        self.assertEqual(self.fs.get_size("/dir"), 6)
+        self.assertEqual(self.fs.get_size("/dir/sub"), 6)
+
+    def test_directory_size_follows_move(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.mkdir("/c")
+        self.fs.create_file("/a/b/file.txt", "hello")
+        self.fs.move("/a/b", "/c/b")
+        self.assertEqual(self.fs.get_size("/a"), 0)
+        self.assertEqual(self.fs.get_size("/c"), 5)
+        self.assertEqual(self.fs.disk_usage(), 5)
+
+    def test_directory_size_follows_delete_recursive(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/b/file.txt", "hello")
+        self.fs.create_file("/keep.txt", "xy")
+        self.fs.delete_recursive("/a/b")
+        self.assertEqual(self.fs.get_size("/a"), 0)
+        self.assertEqual(self.fs.disk_usage(), 2)
+
+    def test_copied_directory_counts_toward_usage(self):
+        self.fs.mkdir("/src")
+        self.fs.create_file("/src/file.txt", "hello")
+        self.fs.copy("/src", "/dest")
+        self.fs.write_file("/dest/file.txt", "hi")
+        self.assertEqual(self.fs.get_size("/src"), 5)
+        self.assertEqual(self.fs.get_size("/dest"), 2)
+        self.assertEqual(self.fs.disk_usage(), 7)
+
+    def test_quota_counts_existing_files(self):
+        self.fs.set_quota(20)
+        self.assertTrue(self.fs.create_file("/a.txt", "x" * 15))
+        self.assertFalse(self.fs.create_file("/b.txt", "x" * 10))
+        self.assertFalse(self.fs.write_file("/a.txt", "x" * 21))
+        self.assertTrue(self.fs.write_file("/a.txt", "x" * 20))
+
+    # ==================== CONTENT INDEX ====================
+
+    def test_index_off_by_default(self):
+        self.assertIsNone(self.fs.index_stats())
+
+    def test_indexed_grep_finds_content(self):
+        fs = VirtualFileSystem(index_content=True)
+        fs.mkdir("/docs")
+        fs.create_file("/docs/a.txt", "hello world")
+        fs.create_file("/docs/b.txt", "goodbye world")
+        fs.create_file("/c.txt", "hello there")
+        self.assertEqual(sorted(fs.grep("/", "hello")), ["/c.txt", "/docs/a.txt"])
+        self.assertEqual(fs.grep("/docs", "hello"), ["/docs/a.txt"])
+        self.assertEqual(sorted(fs.grep("/docs", "lo")), ["/docs/a.txt"])
+
+    def test_indexed_grep_follows_writes(self):
+        fs = VirtualFileSystem(index_content=True)
+        fs.create_file("/file.txt", "old text")
+        fs.write_file("/file.txt", "new text")
+        self.assertEqual(fs.grep("/", "old"), [])
+        self.assertEqual(fs.grep("/", "new"), ["/file.txt"])
+
+    def test_indexed_grep_sees_copy_on_write_clones(self):
+        fs = VirtualFileSystem(index_content=True)
+        fs.create_file("/file.txt", "shared text")
+        fs.copy("/file.txt", "/copy.txt")
+        fs.chmod("/copy.txt", "r")
+        self.assertEqual(sorted(fs.grep("/", "shared")), ["/copy.txt", "/file.txt"])
+
+    def test_index_drops_deleted_files(self):
+        fs = VirtualFileSystem(index_content=True)
+        fs.mkdir("/dir")
+        fs.create_file("/dir/file.txt", "some text")
+        self.assertGreater(fs.index_stats()["entries"], 0)
+        fs.delete_recursive("/dir")
+        stats = fs.index_stats()
+        self.assertEqual((stats["trigrams"], stats["entries"]), (0, 0))
+
+    # ==================== NAME INDEX ====================
+
+    def test_find_matches_directories(self):
+        self.fs.mkdir_p("/a/logs/b/logs")
+        self.assertEqual(sorted(self.fs.find("/", "logs")), ["/a/logs", "/a/logs/b/logs"])
+
+    def test_find_glob(self):
+        self.fs.mkdir("/reports")
+        self.fs.create_file("/reports/report-01.csv", "")
+        self.fs.create_file("/reports/report-2.csv", "")
+        self.fs.create_file("/reports/app.log", "")
+        self.assertEqual(self.fs.find("/", "report-??.csv"), ["/reports/report-01.csv"])
+        self.assertEqual(self.fs.find("/reports", "*.log"), ["/reports/app.log"])
+
+    def test_find_iter_is_lazy(self):
+        self.fs.create_file("/a.txt", "")
+        result = self.fs.find_iter("/", "a.txt")
+        self.assertEqual(next(result), "/a.txt")
+        self.assertIsNone(next(result, None))
+
+    def test_indexed_find_by_name(self):
+        fs = VirtualFileSystem(index_names=True)
+        fs.mkdir_p("/a/b/c")
+        fs.create_file("/a/target.txt", "")
+        fs.create_file("/a/b/target.txt", "")
+        fs.create_file("/target.txt", "")
+        self.assertEqual(sorted(fs.find("/a", "target.txt")), ["/a/b/target.txt", "/a/target.txt"])
+        self.assertEqual(sorted(fs.find("/a", "*.txt")), ["/a/b/target.txt", "/a/target.txt"])
+
+    def test_indexed_find_follows_move_and_copy(self):
+        fs = VirtualFileSystem(index_names=True)
+        fs.mkdir_p("/src/sub")
+        fs.create_file("/src/sub/needle.txt", "")
+        fs.move("/src", "/moved")
+        fs.copy("/moved", "/copied")
+        fs.delete("/moved/sub/needle.txt")
+        self.assertEqual(fs.find("/", "needle.txt"), ["/copied/sub/needle.txt"])
+
+    def test_indexed_find_after_delete_recursive(self):
+        fs = VirtualFileSystem(index_names=True)
+        fs.mkdir_p("/a/b")
+        fs.create_file("/a/b/needle.txt", "")
+        fs.delete_recursive("/a")
+        self.assertEqual(fs.find("/", "needle.txt"), [])
+
+    # ==================== PARALLEL GREP ====================
+
+    def _grep_corpus(self):
+        self.fs.set_quota(10_000)
+        self.fs.mkdir_p("/logs/old")
+        for i in range(40):
+            folder = "/logs/old" if i % 3 else "/logs"
+            self.fs.create_file(f"{folder}/{i}.log", f"line {i}\n" + ("error 42" if i % 4 == 0 else "ok"))
+
+    def test_grep_regex(self):
+        self.fs.create_file("/a.txt", "error 404")
+        self.fs.create_file("/b.txt", "error four")
+        self.assertEqual(self.fs.grep("/", r"error \d+", regex=True), ["/a.txt"])
+
+    def test_grep_max_results(self):
+        self._grep_corpus()
+        serial = self.fs.grep("/logs", "error")
+        self.assertEqual(self.fs.grep("/logs", "error", max_results=3), serial[:3])
+
+    def test_grep_process_pool_matches_serial_order(self):
+        self._grep_corpus()
+        serial = self.fs.grep("/logs", "error")
+        self.assertEqual(self.fs.grep("/logs", "error", workers=2), serial)
+
+    def test_grep_thread_pool_with_cutoff(self):
+        self._grep_corpus()
+        serial = self.fs.grep("/", r"error \d", regex=True)
+        self.assertEqual(self.fs.grep("/", r"error \d", regex=True, workers=3, threads=True, max_results=4),
+                         serial[:4])
+
+    def test_grep_limits_agree_across_paths(self):
+        self._grep_corpus()
+        serial = self.fs.grep("/logs", "error")
+        for limit in (1, 2, len(serial), len(serial) + 1):
+            self.assertEqual(self.fs.grep("/logs", "error", max_results=limit), serial[:limit])
+            self.assertEqual(self.fs.grep("/logs", "error", workers=3, threads=True, max_results=limit),
+                             serial[:limit])
+        for limit in (0, -1):
+            with self.assertRaises(ValueError):
+                self.fs.grep("/logs", "error", max_results=limit)
+            with self.assertRaises(ValueError):
+                self.fs.grep("/logs", "error", workers=3, threads=True, max_results=limit)
+
+    # ==================== WALK ====================
+
+    def _walk_tree(self):
+        self.fs.mkdir_p("/a/b/c")
+        self.fs.mkdir("/a/d")
+        self.fs.create_file("/a/file1.txt", "")
+        self.fs.create_file("/a/b/file2.txt", "")
+
+    def test_walk_top_down(self):
+        self._walk_tree()
+        result = [(path, sorted(dirs), files) for path, dirs, files in self.fs.walk("/a")]
+        self.assertEqual(result[0], ("/a", ["b", "d"], ["file1.txt"]))
+        self.assertEqual(sorted(result), [
+            ("/a", ["b", "d"], ["file1.txt"]),
+            ("/a/b", ["c"], ["file2.txt"]),
+            ("/a/b/c", [], []),
+            ("/a/d", [], []),
+        ])
+
+    def test_walk_bottom_up_yields_children_first(self):
+        self._walk_tree()
+        paths = [path for path, _, _ in self.fs.walk("/a", topdown=False)]
+        self.assertLess(paths.index("/a/b/c"), paths.index("/a/b"))
+        self.assertEqual(paths[-1], "/a")
+
+    def test_walk_prunes_dirnames(self):
+        self._walk_tree()
+        paths = []
+        for path, dirs, _ in self.fs.walk("/"):
+            paths.append(path)
+            if "b" in dirs:
+                dirs.remove("b")
+        self.assertEqual(sorted(paths), ["/", "/a", "/a/d"])
+
+    def test_walk_does_not_follow_symlinks(self):
+        self.fs.mkdir("/real")
+        self.fs.symlink("/real", "/real/loop")
+        self.assertEqual(list(self.fs.walk("/")), [("/", ["real"], []), ("/real", [], ["loop"])])
+
+    def test_tree_of_file_and_symlink(self):
+        self.fs.create_file("/file.txt", "")
+        self.fs.symlink("/file.txt", "/link.txt")
+        self.assertEqual(self.fs.tree("/"), {
+            "name": "/",
+            "type": "directory",
+            "children": [
+                {"name": "file.txt", "type": "file"},
+                {"name": "link.txt", "type": "symlink", "target": "/file.txt"},
+            ],
+        })
+        self.assertIsNone(self.fs.tree("/missing"))
+
+    # ==================== CHUNKED CONTENT ====================
+
+    def test_append_many_times(self):
+        self.fs.set_quota(10_000)
+        self.fs.create_file("/log.txt", "")
+        for i in range(100):
+            self.assertTrue(self.fs.append("/log.txt", f"{i},"))
+        self.assertEqual(self.fs.read_file("/log.txt"), "".join(f"{i}," for i in range(100)))
+        self.assertEqual(self.fs.get_size("/log.txt"), self.fs.disk_usage())
+
+    def test_append_respects_quota_and_permissions(self):
+        self.fs.set_quota(10)
+        self.fs.create_file("/file.txt", "hello")
+        self.assertFalse(self.fs.append("/file.txt", "x" * 6))
+        self.fs.chmod("/file.txt", "r")
+        self.assertFalse(self.fs.append("/file.txt", "x"))
+        self.assertEqual(self.fs.read_file("/file.txt"), "hello")
+
+    def test_append_to_copy_leaves_original(self):
+        self.fs.create_file("/file.txt", "hello")
+        self.fs.copy("/file.txt", "/copy.txt")
+        self.fs.append("/copy.txt", " world")
+        self.assertEqual(self.fs.read_file("/file.txt"), "hello")
+        self.assertEqual(self.fs.read_file("/copy.txt"), "hello world")
+
+    def test_truncate_updates_sizes(self):
+        self.fs.mkdir("/dir")
+        self.fs.create_file("/dir/file.txt", "hello world")
+        self.fs.append("/dir/file.txt", "!!")
+        self.assertTrue(self.fs.truncate("/dir/file.txt", 8))
+        self.assertEqual(self.fs.read_file("/dir/file.txt"), "hello wo")
+        self.assertEqual(self.fs.get_size("/dir"), 8)
+        self.assertFalse(self.fs.truncate("/dir/file.txt", -1))
+
+    def test_ranged_read(self):
+        self.fs.create_file("/file.txt", "hello")
+        self.fs.append("/file.txt", " big")
+        self.fs.append("/file.txt", " world")
+        self.assertEqual(self.fs.read_file("/file.txt", 3, 6), "lo big")
+        self.assertEqual(self.fs.read_file("/file.txt", 10), "world")
+        self.assertEqual(self.fs.read_file("/file.txt", 20, 5), "")
+        self.assertIsNone(self.fs.read_file("/file.txt", -1))
+
+    def test_indexed_grep_after_append_and_truncate(self):
+        fs = VirtualFileSystem(index_content=True)
+        fs.create_file("/log.txt", "start ab")
+        fs.append("/log.txt", "cd end")
+        self.assertEqual(fs.grep("/", "abcd"), ["/log.txt"])
+        fs.truncate("/log.txt", 5)
+        self.assertEqual(fs.grep("/", "abcd"), [])
+        self.assertEqual(fs.grep("/", "start"), ["/log.txt"])
+
+    # ==================== BINARY MODE ====================
+
+    def test_binary_round_trip(self):
+        fs = VirtualFileSystem(binary=True)
+        payload = bytes(range(256)) * 2
+        fs.set_quota(len(payload))
+        self.assertTrue(fs.create_file("/blob.bin", b""))
+        self.assertTrue(fs.write_file_bytes("/blob.bin", bytearray(payload)))
+        self.assertEqual(fs.read_file("/blob.bin"), payload)
+        self.assertEqual(fs.get_size("/blob.bin"), 512)
+        self.assertFalse(fs.append("/blob.bin", b"x"))
+
+    def test_binary_sizes_count_bytes(self):
+        fs = VirtualFileSystem(binary=True)
+        fs.create_file("/text.txt", "héllo")
+        self.assertEqual(fs.read_file("/text.txt"), "héllo".encode())
+        self.assertEqual(fs.disk_usage(), 6)
+
+    def test_read_file_bytes_is_zero_copy_view(self):
+        fs = VirtualFileSystem(binary=True)
+        fs.create_file("/blob.bin", b"0123456789")
+        view = fs.read_file_bytes("/blob.bin", 2, 4)
+        self.assertIsInstance(view, memoryview)
+        self.assertTrue(view.readonly)
+        self.assertEqual(view.tobytes(), b"2345")
+        self.assertIs(view.obj, fs.read_file("/blob.bin"))
+
+    def test_read_file_bytes_across_chunks(self):
+        fs = VirtualFileSystem(binary=True)
+        fs.create_file("/log.bin", b"abc")
+        fs.append("/log.bin", memoryview(b"def"))
+        self.assertEqual(fs.read_file_bytes("/log.bin", 1, 4).tobytes(), b"bcde")
+        self.assertEqual(fs.read_file_bytes("/log.bin").tobytes(), b"abcdef")
+
+    def test_write_file_bytes_copies_mutable_buffers(self):
+        fs = VirtualFileSystem(binary=True)
+        fs.create_file("/blob.bin", b"")
+        buffer = bytearray(b"data")
+        fs.write_file_bytes("/blob.bin", buffer)
+        buffer[0] = ord("X")
+        self.assertEqual(fs.read_file("/blob.bin"), b"data")
+
+    def test_binary_grep(self):
+        fs = VirtualFileSystem(binary=True, index_content=True)
+        fs.create_file("/a.bin", b"\x00\x01magic\x02")
+        fs.create_file("/b.bin", b"\x00\x01other")
+        self.assertEqual(fs.grep("/", "magic"), ["/a.bin"])
+        self.assertEqual(fs.grep("/", b"\x00\x01"), ["/a.bin", "/b.bin"])
+
+    def test_byte_methods_need_binary_mode(self):
+        self.fs.create_file("/file.txt", "text")
+        self.assertIsNone(self.fs.read_file_bytes("/file.txt"))
+        self.assertFalse(self.fs.write_file_bytes("/file.txt", b"data"))
+
+    # ==================== PATH RESOLVER ====================
+
+    def test_dot_and_dotdot_components(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/file.txt", "data")
+        self.assertEqual(self.fs.read_file("/a/b/../file.txt"), "data")
+        self.assertEqual(self.fs.read_file("/a/./b/./../file.txt"), "data")
+        self.assertEqual(self.fs.read_file("/../a/file.txt"), "data")
+
+    def test_dotdot_after_file_fails(self):
+        self.fs.create_file("/file.txt", "data")
+        self.assertIsNone(self.fs.read_file("/file.txt/../file.txt"))
+
+    def test_relative_symlink_target(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/target.txt", "data")
+        self.fs.symlink("../target.txt", "/a/b/link.txt")
+        self.assertEqual(self.fs.read_file("/a/b/link.txt"), "data")
+
+    def test_symlink_loop_is_detected(self):
+        self.fs.symlink("/loop2", "/loop1")
+        self.fs.symlink("/loop1", "/loop2")
+        self.assertIsNone(self.fs.read_file("/loop1"))
+        self.assertEqual(self.fs.getfilefromlink("/loop1"), "")
+        self.assertFalse(self.fs.exists("/loop1"))
+        self.assertTrue(self.fs.is_symlink("/loop1"))
+
+    def test_cache_sees_replaced_symlink(self):
+        self.fs.mkdir("/one")
+        self.fs.mkdir("/two")
+        self.fs.create_file("/one/file.txt", "one")
+        self.fs.create_file("/two/file.txt", "two")
+        self.fs.symlink("/one", "/current")
+        self.assertEqual(self.fs.read_file("/current/file.txt"), "one")
+        self.fs.delete("/current")
+        self.fs.symlink("/two", "/current")
+        self.assertEqual(self.fs.read_file("/current/file.txt"), "two")
+
+    def test_cache_sees_new_directory(self):
+        self.assertIsNone(self.fs.ls("/later/sub"))
+        self.fs.mkdir_p("/later/sub")
+        self.assertEqual(self.fs.ls("/later/sub"), [])
+
+    def test_cd_into_file_fails(self):
+        self.fs.create_file("/file.txt", "")
+        self.assertFalse(self.fs.cd("/file.txt"))
+        self.assertEqual(self.fs.pwd(), "/")
+
+    def test_cd_through_symlink_uses_target(self):
+        self.fs.mkdir_p("/real/dir")
+        self.fs.symlink("/real/dir", "/shortcut")
+        self.assertTrue(self.fs.cd("/shortcut"))
+        self.assertEqual(self.fs.pwd(), "/real/dir")
+        self.assertTrue(self.fs.mkdir_p("new/sub"))
+        self.assertTrue(self.fs.is_directory("/real/dir/new/sub"))
+
+    def test_get_parent_of_relative_path(self):
+        self.fs.mkdir_p("/home/user")
+        self.fs.cd("/home/user")
+        self.assertEqual(self.fs.get_parent("notes.txt"), "/home/user")
+        self.assertEqual(self.fs.get_parent("/top"), "/")
+
+    # ==================== TRACING ====================
+
+    def _record(self):
+        events = []
+        self.fs.set_tracer(lambda op, path, seconds, nbytes: events.append((op, path, nbytes)))
+        return events
+
+    def test_tracer_receives_op_path_and_bytes(self):
+        events = self._record()
+        self.fs.create_file("/a.txt", "hello")
+        self.fs.read_file("/a.txt")
+        self.fs.append("/a.txt", "!!")
+        self.assertEqual(events, [
+            ("create_file", "/a.txt", 5),
+            ("read_file", "/a.txt", 5),
+            ("append", "/a.txt", 2),
+        ])
+
+    def test_tracer_reports_duration(self):
+        durations = []
+        self.fs.set_tracer(lambda op, path, seconds, nbytes: durations.append(seconds))
+        self.fs.mkdir("/dir")
+        self.assertEqual(len(durations), 1)
+        self.assertGreaterEqual(durations[0], 0)
+
+    def test_nested_operations_traced_once(self):
+        events = self._record()
+        self.fs.mkdir_p("/a/b/c")
+        self.assertEqual(events, [("mkdir_p", "/a/b/c", 0)])
+
+    def test_failed_read_reports_zero_bytes(self):
+        events = self._record()
+        self.assertIsNone(self.fs.read_file("/missing.txt"))
+        self.assertEqual(events, [("read_file", "/missing.txt", 0)])
+
+    def test_removing_tracer_restores_methods(self):
+        events = self._record()
+        self.fs.set_tracer(None)
+        self.fs.mkdir("/dir")
+        self.assertEqual(events, [])
+        self.assertNotIn("mkdir", vars(self.fs))
+
+    def test_tracer_in_constructor(self):
+        events = []
+        fs = VirtualFileSystem(tracer=lambda *event: events.append(event[0]))
+        fs.mkdir("/dir")
+        self.assertEqual(events, ["mkdir"])
+
+    def test_logging_tracer(self):
+        fs = VirtualFileSystem(tracer=logging_tracer(logging.getLogger("vfs.test")))
+        with self.assertLogs("vfs.test", level="DEBUG") as logs:
+            fs.create_file("/a.txt", "abc")
+        self.assertIn("create_file /a.txt", logs.output[0])
+        self.assertIn("3 bytes", logs.output[0])
+
+    # ==================== METRICS ====================
+
+    def test_stats_off_by_default(self):
+        self.assertIsNone(self.fs.stats())
+        self.assertFalse(self.fs.reset_stats())
+
+    def test_stats_count_calls_and_bytes(self):
+        fs = VirtualFileSystem(metrics=True)
+        fs.create_file("/a.txt", "hello")
+        fs.read_file("/a.txt")
+        fs.read_file("/a.txt", 1, 2)
+        fs.append("/a.txt", "!!")
+        stats = fs.stats()
+        self.assertEqual(stats["read_file"]["calls"], 2)
+        self.assertEqual(stats["read_file"]["bytes_read"], 7)
+        self.assertEqual(stats["create_file"]["bytes_written"], 5)
+        self.assertEqual(stats["append"]["bytes_written"], 2)
+        self.assertEqual(stats["read_file"]["errors"], 0)
+
+    def test_stats_count_failures(self):
+        fs = VirtualFileSystem(metrics=True)
+        fs.read_file("/missing.txt")
+        fs.mkdir("/missing/dir")
+        fs.exists("/missing.txt")
+        with self.assertRaises(TypeError):
+            fs.create_file("/a.txt", None)
+        stats = fs.stats()
+        self.assertEqual(stats["read_file"]["errors"], 1)
+        self.assertEqual(stats["mkdir"]["errors"], 1)
+        self.assertEqual(stats["exists"]["errors"], 0)
+        self.assertEqual(stats["create_file"]["errors"], 1)
+
+    def test_stats_percentiles(self):
+        fs = VirtualFileSystem(metrics=True)
+        for i in range(100):
+            fs.mkdir(f"/d{i}")
+        mkdir = fs.stats()["mkdir"]
+        self.assertGreater(mkdir["p50"], 0)
+        self.assertLessEqual(mkdir["p50"], mkdir["p99"])
+        self.assertGreaterEqual(mkdir["p99"] * 100, mkdir["seconds"] / 2)
+
+    def test_reset_stats(self):
+        fs = VirtualFileSystem(metrics=True)
+        fs.mkdir("/dir")
+        self.assertTrue(fs.reset_stats())
+        self.assertEqual(fs.stats(), {})
+
+    def test_disable_metrics_unwraps_methods(self):
+        self.fs.enable_metrics()
+        self.fs.mkdir("/dir")
+        self.assertEqual(self.fs.stats()["mkdir"]["calls"], 1)
+        self.fs.enable_metrics(False)
+        self.assertIsNone(self.fs.stats())
+        self.assertNotIn("mkdir", vars(self.fs))
+
+    def test_metrics_and_tracer_together(self):
+        events = []
+        fs = VirtualFileSystem(metrics=True, tracer=lambda *event: events.append(event[0]))
+        fs.mkdir("/dir")
+        fs.set_tracer(None)
+        fs.mkdir("/other")
+        self.assertEqual(events, ["mkdir"])
+        self.assertEqual(fs.stats()["mkdir"]["calls"], 2)
+
+    def test_export_metrics_prometheus(self):
+        fs = VirtualFileSystem(metrics=True)
+        fs.create_file("/a.txt", "abc")
+        fs.read_file("/a.txt")
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "vfs.prom")
+            self.assertTrue(fs.export_metrics(out))
+            with open(out, encoding="utf-8") as f:
+                text = f.read()
+        self.assertIn('vfs_operations_total{op="read_file"} 1', text)
+        self.assertIn('vfs_written_bytes_total{op="create_file"} 3', text)
+        self.assertIn('vfs_operation_duration_seconds_bucket{op="read_file",le="+Inf"} 1', text)
+        self.assertIn("# TYPE vfs_operation_duration_seconds histogram", text)
+
+    def test_export_metrics_waits_for_recording(self):
+        fs = VirtualFileSystem(metrics=True, threadsafe=True)
+        fs.mkdir("/dir")
+        with tempfile.TemporaryDirectory() as tmp:
+            out = os.path.join(tmp, "vfs.prom")
+            # Held the way a concurrent record holds it
+            with fs.metrics.lock:
+                exporter = threading.Thread(target=fs.export_metrics, args=(out,), daemon=True)
+                exporter.start()
+                exporter.join(timeout=0.1)
+                self.assertTrue(exporter.is_alive())
+            exporter.join(timeout=5)
+            self.assertFalse(exporter.is_alive())
+            with open(out, encoding="utf-8") as f:
+                self.assertIn('vfs_operations_total{op="mkdir"} 1', f.read())
+
+
+    # ==================== BATCH ====================
+
+    def test_apply_ops_creates_parents_and_files(self):
+        results = self.fs.apply_ops([
+            ("mkdir_p", "/data/a/b"),
+            ("create_file", "/data/a/b/one.txt", "1"),
+            ("create_file", "/data/a/b/two.txt", "22"),
+            ("mkdir", "/data/c"),
+            ("mkdir_p", "/data/a/b"),
+        ])
+        self.assertEqual(results, [True, True, True, True, True])
+        self.assertEqual(self.fs.read_file("/data/a/b/two.txt"), "22")
+        self.assertEqual(self.fs.get_size("/data"), 3)
+        self.assertEqual(self.fs.disk_usage(), 3)
+        self.assertTrue(self.fs.is_directory("/data/c"))
+
+    def test_apply_ops_is_all_or_nothing(self):
+        self.fs.create_file("/existing.txt", "old")
+        results = self.fs.apply_ops([
+            ("mkdir", "/new"),
+            ("write_file", "/existing.txt", "new"),
+            ("create_file", "/existing.txt", "again"),
+        ])
+        self.assertEqual(results, [True, True, False])
+        self.assertFalse(self.fs.exists("/new"))
+        self.assertEqual(self.fs.read_file("/existing.txt"), "old")
+
+    def test_apply_ops_checks_quota_on_running_total(self):
+        self.fs.set_quota(10)
+        results = self.fs.apply_ops([
+            ("create_file", "/a.txt", "12345"),
+            ("create_file", "/b.txt", "123456"),
+        ])
+        self.assertEqual(results, [True, False])
+        self.assertEqual(self.fs.disk_usage(), 0)
+
+    def test_apply_ops_checks_permissions(self):
+        self.fs.create_file("/locked.txt", "x")
+        self.fs.chmod("/locked.txt", "r")
+        self.assertEqual(self.fs.apply_ops([("append", "/locked.txt", "y")]), [False])
+
+    def test_apply_ops_sees_its_own_changes(self):
+        self.fs.create_file("/log.txt", "a")
+        results = self.fs.apply_ops([
+            ("append", "/log.txt", "b"),
+            ("create_file", "/new.txt", "x"),
+            ("append", "/new.txt", "y"),
+            ("write_file", "/log.txt", "c"),
+            ("append", "/log.txt", "d"),
+        ])
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(self.fs.read_file("/log.txt"), "cd")
+        self.assertEqual(self.fs.read_file("/new.txt"), "xy")
+        self.assertEqual(self.fs.disk_usage(), 4)
+
+    def test_apply_ops_through_symlink_to_new_directory(self):
+        self.fs.symlink("/target", "/link")
+        results = self.fs.apply_ops([
+            ("mkdir", "/target"),
+            ("create_file", "/link/file.txt", "x"),
+        ])
+        self.assertEqual(results, [True, True])
+        self.assertEqual(self.fs.read_file("/target/file.txt"), "x")
+
+    def test_apply_ops_relative_to_cwd(self):
+        self.fs.mkdir("/home")
+        self.fs.cd("/home")
+        self.assertEqual(self.fs.apply_ops([("mkdir_p", "a/b"), ("create_file", "a/b/f.txt", "x")]),
+                         [True, True])
+        self.assertTrue(self.fs.is_file("/home/a/b/f.txt"))
+
+    def test_apply_ops_leaves_copies_untouched(self):
+        self.fs.mkdir_p("/src/dir")
+        self.fs.create_file("/src/dir/a.txt", "a")
+        self.fs.copy("/src", "/dst")
+        self.fs.apply_ops([("append", "/dst/dir/a.txt", "b"), ("create_file", "/dst/dir/b.txt", "")])
+        self.assertEqual(self.fs.read_file("/src/dir/a.txt"), "a")
+        self.assertEqual(self.fs.ls("/src/dir"), ["a.txt"])
+        self.assertEqual(self.fs.read_file("/dst/dir/a.txt"), "ab")
+
+    def test_apply_ops_updates_indexes(self):
+        fs = VirtualFileSystem(index_content=True, index_names=True)
+        fs.apply_ops([("mkdir_p", "/logs/app"), ("create_file", "/logs/app/a.log", "error 42")])
+        self.assertEqual(fs.grep("/", "error 42"), ["/logs/app/a.log"])
+        self.assertEqual(fs.find("/", "a.log"), ["/logs/app/a.log"])
+
+    def test_apply_ops_rejects_unknown_operation(self):
+        with self.assertRaises(ValueError):
+            self.fs.apply_ops([("mkdir", "/a"), ("delete", "/a")])
+        self.assertFalse(self.fs.exists("/a"))
+
+    def test_apply_ops_leaves_collector_on_when_threadsafe(self):
+        with unittest.mock.patch("gc.disable") as disable:
+            VirtualFileSystem(threadsafe=True).apply_ops([("mkdir", "/a")])
+            disable.assert_not_called()
+            VirtualFileSystem().apply_ops([("mkdir", "/a")])
+            disable.assert_called_once()
+
+    def test_batch_context_manager(self):
+        with self.fs.batch() as batch:
+            batch.mkdir_p("/a/b")
+            batch.create_file("/a/b/c.txt", "abc")
+            self.assertFalse(self.fs.exists("/a"))
+        self.assertEqual(batch.results, [True, True])
+        self.assertEqual(self.fs.read_file("/a/b/c.txt"), "abc")
+
+    def test_batch_discarded_on_exception(self):
+        with self.assertRaises(RuntimeError):
+            with self.fs.batch() as batch:
+                batch.mkdir("/a")
+                raise RuntimeError
+        self.assertFalse(self.fs.exists("/a"))
+        self.assertIsNone(batch.results)
+
+
+    # ==================== SNAPSHOTS ====================
+
+    def test_snapshot_is_isolated_from_later_writes(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/b/f.txt", "old")
+        snap = self.fs.snapshot()
+        self.fs.write_file("/a/b/f.txt", "new")
+        self.fs.create_file("/a/g.txt", "g")
+        self.fs.delete_recursive("/a/b")
+        self.assertEqual(snap.read_file("/a/b/f.txt"), "old")
+        self.assertEqual(snap.ls("/a"), ["b"])
+        self.assertEqual(snap.disk_usage(), 3)
+        self.assertFalse(self.fs.exists("/a/b"))
+
+    def test_snapshot_writes_do_not_reach_origin(self):
+        self.fs.create_file("/f.txt", "abc")
+        snap = self.fs.snapshot()
+        snap.append("/f.txt", "def")
+        self.assertEqual(self.fs.read_file("/f.txt"), "abc")
+        self.assertEqual(snap.read_file("/f.txt"), "abcdef")
+
+    def test_snapshot_walk_is_consistent_during_writes(self):
+        self.fs.mkdir("/d")
+        for i in range(5):
+            self.fs.create_file(f"/d/{i}.txt", "x")
+        snap = self.fs.snapshot()
+        seen = []
+        for dirpath, dirnames, filenames in snap.walk("/"):
+            self.fs.delete_recursive("/d")
+            seen.extend(filenames)
+        self.assertEqual(sorted(seen), [f"{i}.txt" for i in range(5)])
+
+    def test_snapshot_searches_with_shared_indexes(self):
+        fs = VirtualFileSystem(index_content=True, index_names=True)
+        fs.mkdir("/logs")
+        fs.create_file("/logs/a.log", "error 1")
+        snap = fs.snapshot()
+        fs.write_file("/logs/a.log", "fine")
+        fs.create_file("/logs/b.log", "error 2")
+        self.assertEqual(snap.grep("/", "error"), ["/logs/a.log"])
+        self.assertEqual(fs.grep("/", "error"), ["/logs/b.log"])
+        self.assertEqual(snap.find("/", "*.log"), ["/logs/a.log"])
+        self.assertEqual(sorted(fs.find("/", "*.log")), ["/logs/a.log", "/logs/b.log"])
+
+    def test_close_frees_index_entries(self):
+        fs = VirtualFileSystem(index_content=True)
+        fs.create_file("/f.txt", "abc")
+        snap = fs.snapshot()
+        fs.write_file("/f.txt", "xyz")
+        self.assertEqual(fs.index_stats()["entries"], 2)
+        snap.close()
+        self.assertEqual(fs.index_stats()["entries"], 1)
+        self.assertEqual(snap.ls("/"), [])
+
+    def test_rollback_restores_tree(self):
+        self.fs.mkdir("/keep")
+        self.fs.create_file("/keep/f.txt", "v1")
+        self.assertTrue(self.fs.begin())
+        self.fs.write_file("/keep/f.txt", "v2")
+        self.fs.mkdir_p("/new/dir")
+        self.fs.move("/keep", "/moved")
+        self.assertTrue(self.fs.rollback())
+        self.assertEqual(self.fs.read_file("/keep/f.txt"), "v1")
+        self.assertFalse(self.fs.exists("/new"))
+        self.assertFalse(self.fs.exists("/moved"))
+        self.assertEqual(self.fs.disk_usage(), 2)
+
+    def test_commit_keeps_changes(self):
+        self.fs.begin()
+        self.fs.create_file("/f.txt", "x")
+        self.assertTrue(self.fs.commit())
+        self.assertFalse(self.fs.rollback())
+        self.assertEqual(self.fs.read_file("/f.txt"), "x")
+
+    def test_nested_transactions(self):
+        self.fs.begin()
+        self.fs.create_file("/outer.txt", "o")
+        self.fs.begin()
+        self.fs.create_file("/inner.txt", "i")
+        self.fs.rollback()
+        self.assertTrue(self.fs.exists("/outer.txt"))
+        self.assertFalse(self.fs.exists("/inner.txt"))
+        self.fs.rollback()
+        self.assertFalse(self.fs.exists("/outer.txt"))
+
+    def test_rollback_without_changes(self):
+        self.fs.create_file("/f.txt", "x")
+        self.fs.begin()
+        self.assertTrue(self.fs.rollback())
+        self.fs.write_file("/f.txt", "y")
+        self.assertEqual(self.fs.read_file("/f.txt"), "y")
+
+    def test_commit_without_begin_fails(self):
+        self.assertFalse(self.fs.commit())
+
+
+    # ==================== THREAD SAFETY ====================
+
+    def test_threadsafe_stress(self):
+        fs = VirtualFileSystem(threadsafe=True, index_content=True, index_names=True)
+        fs.set_quota(10 ** 6)
+        fs.mkdir("/shared")
+        failures = []
+
+        def worker(t):
+            rng = random.Random(t)
+            mine = f"/t{t}"
+            fs.mkdir(mine)
+            expected = {}
+            for i in range(300):
+                choice = rng.random()
+                path = f"{mine}/f{rng.randrange(10)}"
+                if choice < 0.3:
+                    content = str(i)
+                    if fs.create_file(path, content) or fs.write_file(path, content):
+                        expected[path] = content
+                elif choice < 0.5:
+                    if path in expected and fs.read_file(path) != expected[path]:
+                        failures.append(path)
+                elif choice < 0.6:
+                    fs.mkdir_p(f"/shared/{rng.randrange(3)}/{t}")
+                    fs.create_file(f"/shared/{rng.randrange(3)}/{t}/{i}", "data")
+                elif choice < 0.7:
+                    fs.move(f"/shared/{rng.randrange(3)}", f"/shared/{rng.randrange(3)}")
+                elif choice < 0.8:
+                    fs.copy(f"/shared/{rng.randrange(3)}", f"/shared/{rng.randrange(3)}")
+                elif choice < 0.85:
+                    fs.delete_recursive(f"/shared/{rng.randrange(3)}")
+                elif choice < 0.95:
+                    for _ in fs.walk("/shared"):
+                        pass
+                else:
+                    fs.grep("/shared", "data")
+                    fs.find("/", "f*")
+            for path, content in expected.items():
+                if fs.read_file(path) != content:
+                    failures.append(path)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        total = 0
+        for dirpath, dirnames, filenames in fs.walk("/"):
+            total += sum(fs.get_size(f"{dirpath.rstrip('/')}/{name}") for name in filenames)
+        self.assertEqual(fs.disk_usage(), total)
+
+    def test_threadsafe_nested_operations(self):
+        fs = VirtualFileSystem(threadsafe=True, binary=True)
+        self.assertTrue(fs.mkdir_p("/a/b/c"))
+        self.assertTrue(fs.create_file("/a/b/c/f", b"x"))
+        self.assertTrue(fs.write_file_bytes("/a/b/c/f", b"yz"))
+        self.assertEqual(fs.apply_ops([("mkdir_p", "/d/e")]), [True])
+        self.assertEqual(next(fs.find_iter("/", "f")), "/a/b/c/f")
+
+    def test_threadsafe_walk_does_not_block_writers(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.mkdir_p("/a/b")
+        walker = fs.walk("/")
+        next(walker)
+        writer = threading.Thread(target=fs.create_file, args=("/a/b/new.txt", "x"))
+        writer.start()
+        writer.join(timeout=5)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual([filenames for _, _, filenames in walker], [[], []])
+        self.assertTrue(fs.exists("/a/b/new.txt"))
+
+    def test_threadsafe_snapshot(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.create_file("/f.txt", "x")
+        snap = fs.snapshot()
+        writer = threading.Thread(target=snap.append, args=("/f.txt", "y"))
+        writer.start()
+        writer.join(timeout=5)
+        self.assertEqual(snap.read_file("/f.txt"), "xy")
+        self.assertEqual(fs.read_file("/f.txt"), "x")
+        self.assertTrue(snap.close())
+
+    def test_threadsafe_reads_of_appended_file(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.set_quota(10 ** 6)
+        fs.create_file("/log", "a")
+        for _ in range(100):
+            fs.append("/log", "b")
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(fs.read_file("/log")))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["a" + "b" * 100] * 4)
+
+    def test_threadsafe_disjoint_subtrees_do_not_wait(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.mkdir_p("/a/x")
+        fs.mkdir_p("/b/x")
+        fs.create_file("/b/x/f", "b")
+        # Hold /a the way a long grep of it would
+        request = fs._acquire("grep", ("/a",))
+        writer = threading.Thread(target=fs.create_file, args=("/b/x/new", "x"))
+        writer.start()
+        writer.join(timeout=5)
+        self.assertFalse(writer.is_alive())
+        blocked = threading.Thread(target=fs.create_file, args=("/a/x/new", "x"))
+        blocked.start()
+        blocked.join(timeout=0.1)
+        self.assertTrue(blocked.is_alive())
+        self.assertEqual(fs.read_file("/b/x/f"), "b")
+        fs._lock.release(request)
+        blocked.join(timeout=5)
+        self.assertFalse(blocked.is_alive())
+        self.assertEqual(fs.read_file("/a/x/new"), "x")
+
+    def test_threadsafe_writer_blocks_only_its_subtree(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.mkdir_p("/a/x")
+        fs.create_file("/a/x/f", "a")
+        fs.create_file("/b", "b")
+        request = fs._acquire("delete_recursive", ("/a/x",))
+        results = []
+        reader = threading.Thread(target=lambda: results.append(fs.read_file("/b")))
+        reader.start()
+        reader.join(timeout=5)
+        self.assertEqual(results, ["b"])
+        for target in (lambda: fs.ls("/a"), lambda: fs.read_file("/a/x/f")):
+            blocked = threading.Thread(target=target)
+            blocked.start()
+            blocked.join(timeout=0.1)
+            self.assertTrue(blocked.is_alive())
+            fs._lock.release(request)
+            blocked.join(timeout=5)
+            self.assertFalse(blocked.is_alive())
+            request = fs._acquire("delete_recursive", ("/a/x",))
+        fs._lock.release(request)
+
+    def test_threadsafe_symlink_locks_whole_tree(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.mkdir("/a")
+        fs.symlink("/a", "/link")
+        fs.mkdir("/up")
+        request = fs._acquire("ls", ("/a",))
+        # Written through the link, or through "..", the path names /a only
+        # once resolved
+        for path in ("/link/new", "/up/../a/new"):
+            blocked = threading.Thread(target=fs.create_file, args=(path, "x"))
+            blocked.start()
+            blocked.join(timeout=0.1)
+            self.assertTrue(blocked.is_alive())
+            fs._lock.release(request)
+            blocked.join(timeout=5)
+            self.assertFalse(blocked.is_alive())
+            request = fs._acquire("ls", ("/a",))
+        fs._lock.release(request)
+        self.assertEqual(fs.ls("/a"), ["new"])
+        self.assertTrue(fs.is_symlink("/link"))
+
+    def test_threadsafe_buffer_writes_lock_only_their_path(self):
+        fs = VirtualFileSystem(binary=True, threadsafe=True)
+        fs.mkdir("/a")
+        fs.create_file("/b", b"")
+        request = fs._acquire("ls", ("/a",))
+        writes = (lambda: fs.write_file_bytes("/b", bytearray(b"data")),
+                  lambda: fs.append("/b", memoryview(b"!")))
+        for write in writes:
+            writer = threading.Thread(target=write, daemon=True)
+            writer.start()
+            writer.join(timeout=5)
+            self.assertFalse(writer.is_alive())
+        fs._lock.release(request)
+        self.assertEqual(fs.read_file("/b"), b"data!")
+
+    def test_threadsafe_does_not_keep_contents(self):
+        content = "x" * 1000 + "unique"
+        before = sys.getrefcount(content)
+        fs = VirtualFileSystem(threadsafe=True)
+        for i in range(10):
+            fs.create_file(f"/f{i}", content)
+            fs.write_file(f"/f{i}", content)
+            fs.append(f"/f{i}", content)
+            fs.delete(f"/f{i}")
+        del fs
+        self.assertEqual(sys.getrefcount(content), before)
+
+    def test_threadsafe_journal(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = os.path.join(tmp, "journal")
+            fs = VirtualFileSystem(threadsafe=True)
+            fs.set_quota(10 ** 6)
+            self.assertTrue(fs.open_journal(journal, fsync="always"))
+
+            def worker(t):
+                fs.mkdir(f"/t{t}")
+                for i in range(50):
+                    fs.create_file(f"/t{t}/f{i}", str(i))
+                    fs.append(f"/t{t}/f{i}", "!")
+
+            threads = [threading.Thread(target=worker, args=(t,)) for t in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertTrue(fs.close_journal())
+            recovered = VirtualFileSystem()
+            self.assertTrue(recovered.open_journal(journal))
+            self.assertEqual(recovered.tree("/"), fs.tree("/"))
+            self.assertEqual(recovered.read_file("/t3/f49"), "49!")
+            recovered.close_journal()
+
+
+    # ==================== ASYNC ====================
+
+    def test_async_read_and_write(self):
+        async def scenario():
+            afs = AsyncVirtualFileSystem()
+            self.assertTrue(await afs.create_file("/f.txt", "abc"))
+            self.assertTrue(await afs.append("/f.txt", "d"))
+            self.assertEqual(await afs.read_file("/f.txt"), "abcd")
+            self.assertTrue(await afs.write_file("/f.txt", "x"))
+            return await afs.read_file("/f.txt", 0, 1)
+        self.assertEqual(asyncio.run(scenario()), "x")
+
+    def test_async_wraps_existing_filesystem(self):
+        self.fs.mkdir("/dir")
+        afs = AsyncVirtualFileSystem(self.fs)
+        asyncio.run(afs.create_file("/dir/f.txt", "x"))
+        self.assertEqual(self.fs.read_file("/dir/f.txt"), "x")
+
+    def test_async_walk_matches_walk(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/f.txt", "")
+        self.fs.create_file("/a/b/g.txt", "")
+        afs = AsyncVirtualFileSystem(self.fs)
+
+        async def collect():
+            return [entry async for entry in afs.walk("/")]
+        self.assertEqual(asyncio.run(collect()), list(self.fs.walk("/")))
+
+    def test_async_grep_yields_to_other_tasks(self):
+        fs = VirtualFileSystem()
+        fs.set_quota(10 ** 6)
+        fs.mkdir("/logs")
+        for i in range(1000):
+            fs.create_file(f"/logs/{i}.log", "error" if i % 100 == 0 else "ok")
+        afs = AsyncVirtualFileSystem(fs, slice_seconds=0)
+        ticks = []
+
+        async def ticker(done):
+            while not done.is_set():
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def scenario():
+            done = asyncio.Event()
+            task = asyncio.create_task(ticker(done))
+            await asyncio.sleep(0)
+            ticks.clear()
+            found = await afs.grep("/logs", "error")
+            done.set()
+            await task
+            return found
+
+        found = asyncio.run(scenario())
+        self.assertEqual(found, fs.grep("/logs", "error"))
+        self.assertGreater(len(ticks), 1)
+
+    def test_async_grep_sees_state_at_start(self):
+        fs = VirtualFileSystem()
+        fs.set_quota(10 ** 6)
+        for i in range(500):
+            fs.create_file(f"/{i:03}.txt", "needle")
+        afs = AsyncVirtualFileSystem(fs, slice_seconds=0)
+
+        async def writer():
+            for i in range(500):
+                await afs.write_file(f"/{i:03}.txt", "hay")
+                await asyncio.sleep(0)
+
+        async def scenario():
+            task = asyncio.create_task(writer())
+            found = await afs.grep("/", "needle", max_results=1000)
+            await task
+            return found
+
+        self.assertEqual(len(asyncio.run(scenario())), 500)
+        self.assertEqual(fs.grep("/", "needle"), [])
+
+    def test_async_grep_max_results_and_regex(self):
+        for i in range(200):
+            self.fs.set_quota(10 ** 6)
+            self.fs.create_file(f"/{i}.log", f"code {i}")
+        afs = AsyncVirtualFileSystem(self.fs)
+        self.assertEqual(len(asyncio.run(afs.grep("/", "code", max_results=70))), 70)
+        self.assertEqual(asyncio.run(afs.grep("/", r"code 1\d\d", regex=True)),
+                         self.fs.grep("/", r"code 1\d\d", regex=True))
+        with self.assertRaises(ValueError):
+            asyncio.run(afs.grep("/", "code", max_results=0))
+
+    def test_async_find(self):
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/b/x.log", "")
+        self.fs.create_file("/a/y.log", "")
+        afs = AsyncVirtualFileSystem(self.fs)
+        self.assertEqual(sorted(asyncio.run(afs.find("/", "*.log"))), ["/a/b/x.log", "/a/y.log"])
+        indexed = AsyncVirtualFileSystem(index_names=True)
+        asyncio.run(indexed.create_file("/z.log", ""))
+        self.assertEqual(asyncio.run(indexed.find("/", "*.log")), ["/z.log"])
+
+    def test_async_delete_recursive_frees_index(self):
+        afs = AsyncVirtualFileSystem(index_content=True, slice_seconds=0)
+        afs.fs.set_quota(10 ** 6)
+        afs.fs.mkdir_p("/big/dir")
+        for i in range(3000):
+            afs.fs.create_file(f"/big/dir/{i}", f"text {i}")
+        self.assertTrue(asyncio.run(afs.delete_recursive("/big")))
+        self.assertFalse(afs.fs.exists("/big"))
+        self.assertEqual(afs.fs.index_stats()["entries"], 0)
+        self.assertFalse(asyncio.run(afs.delete_recursive("/big")))
+
+    def test_async_lock_serializes_read_modify_write(self):
+        afs = AsyncVirtualFileSystem()
+
+        async def increment():
+            async with afs.lock("/counter"):
+                value = int(await afs.read_file("/counter"))
+                await asyncio.sleep(0)
+                await afs.write_file("/counter", str(value + 1))
+
+        async def scenario():
+            await afs.create_file("/counter", "0")
+            await asyncio.gather(*(increment() for _ in range(20)))
+            return await afs.read_file("/counter")
+
+        self.assertEqual(asyncio.run(scenario()), "20")
+        self.assertEqual(afs._locks, {})
+
+
+    # ==================== PERSISTENCE ====================
+
+    def _reload(self, fs, **kwargs):
+        """Save ``fs`` to a temporary image and load it into a new instance."""
+        loaded = VirtualFileSystem(binary=fs.binary, **kwargs)
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "vfs.img")
+            self.assertTrue(fs.save(image))
+            self.assertTrue(loaded.load(image))
+        return loaded
+
+    def test_save_load_round_trip(self):
+        self.fs.set_quota(1000)
+        self.fs.mkdir_p("/a/b")
+        self.fs.create_file("/a/b/x.txt", "héllo")
+        self.fs.append("/a/b/x.txt", " world")
+        self.fs.create_file("/a/empty", "")
+        self.fs.chmod("/a/empty", "r")
+        self.fs.symlink("/a/b", "/link")
+        self.fs.symlink("/nowhere", "/dangling")
+        loaded = self._reload(self.fs)
+        self.assertEqual(loaded.tree("/"), self.fs.tree("/"))
+        self.assertEqual(loaded.read_file("/link/x.txt"), "héllo world")
+        self.assertEqual(loaded.readlink("/dangling"), "/nowhere")
+        self.assertFalse(loaded.write_file("/a/empty", "x"))
+        self.assertEqual(loaded.get_size("/a"), self.fs.get_size("/a"))
+        self.assertEqual(loaded.disk_usage(), 11)
+        self.assertEqual(loaded.quota, 1000)
+        self.assertEqual(loaded.ls("/a"), ["b", "empty"])
+
+    def test_save_load_float_quota(self):
+        self.fs.set_quota(1e6)
+        self.fs.create_file("/a.txt", "x")
+        loaded = self._reload(self.fs)
+        self.assertEqual(loaded.quota, 10 ** 6)
+        self.assertIsInstance(loaded.quota, int)
+
+    def test_load_reads_content_lazily(self):
+        self.fs.create_file("/a.txt", "lazy")
+        loaded = self._reload(self.fs)
+        rope = loaded._node("/a.txt").data
+        self.assertIsNotNone(rope.image)
+        self.assertEqual(loaded.get_size("/a.txt"), 4)
+        self.assertIsNotNone(rope.image)
+        self.assertEqual(loaded.read_file("/a.txt", 1, 2), "az")
+        self.assertIsNone(rope.image)
+
+    def test_loaded_files_are_writable(self):
+        self.fs.set_quota(1000)
+        self.fs.create_file("/a.txt", "abc")
+        self.fs.create_file("/b.txt", "abc")
+        loaded = self._reload(self.fs)
+        loaded.set_quota(1000)
+        self.assertTrue(loaded.append("/a.txt", "def"))
+        self.assertTrue(loaded.truncate("/b.txt", 1))
+        self.assertEqual(loaded.read_file("/a.txt"), "abcdef")
+        self.assertEqual(loaded.read_file("/b.txt"), "a")
+        self.assertEqual(loaded.disk_usage(), 7)
+
+    def test_save_keeps_copies_shared(self):
+        self.fs.mkdir_p("/src/sub")
+        self.fs.create_file("/src/sub/f.txt", "data")
+        self.fs.copy("/src", "/dst")
+        loaded = self._reload(self.fs)
+        self.assertIs(loaded._node("/src"), loaded._node("/dst"))
+        self.assertTrue(loaded.write_file("/dst/sub/f.txt", "new"))
+        self.assertEqual(loaded.read_file("/src/sub/f.txt"), "data")
+        self.assertEqual(loaded.disk_usage(), 7)
+
+    def test_save_load_binary(self):
+        fs = VirtualFileSystem(binary=True)
+        fs.create_file("/blob", bytes(range(10)))
+        loaded = self._reload(fs)
+        self.assertEqual(loaded.read_file("/blob"), bytes(range(10)))
+        self.assertEqual(bytes(loaded.read_file_bytes("/blob", 8)), b"\x08\x09")
+
+    def test_load_rejects_other_mode_and_non_images(self):
+        self.fs.create_file("/a.txt", "x")
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "vfs.img")
+            self.fs.save(image)
+            self.assertFalse(VirtualFileSystem(binary=True).load(image))
+            other = os.path.join(tmp, "other")
+            with open(other, "wb") as f:
+                f.write(b"not an image" * 10)
+            with self.assertRaises(ValueError):
+                self.fs.load(other)
+        self.assertEqual(self.fs.read_file("/a.txt"), "x")
+
+    def test_load_replaces_tree_and_rebuilds_indexes(self):
+        self.fs.mkdir("/logs")
+        self.fs.create_file("/logs/app.log", "error 42")
+        loaded = self._reload(self.fs, index_content=True, index_names=True)
+        self.assertEqual(loaded.grep("/", "error 42"), ["/logs/app.log"])
+        self.assertEqual(loaded.find("/", "app.log"), ["/logs/app.log"])
+        loaded.mkdir("/tmp")
+        loaded.cd("/tmp")
+        loaded.begin()
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "vfs.img")
+            VirtualFileSystem().save(image)
+            self.assertTrue(loaded.load(image))
+        self.assertEqual(loaded.ls("/"), [])
+        self.assertEqual(loaded.pwd(), "/")
+        self.assertFalse(loaded.rollback())
+        self.assertEqual(loaded.index_stats()["entries"], 0)
+
+    def test_save_over_loaded_image(self):
+        self.fs.create_file("/a.txt", "one")
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "vfs.img")
+            self.fs.save(image)
+            loaded = VirtualFileSystem()
+            loaded.load(image)
+            loaded.create_file("/b.txt", "two")
+            self.assertTrue(loaded.save(image))
+            self.assertEqual(loaded.read_file("/a.txt"), "one")
+            again = VirtualFileSystem()
+            again.load(image)
+            self.assertEqual(again.read_file("/a.txt") + again.read_file("/b.txt"), "onetwo")
+
+    @unittest.skipUnless(hasattr(os, "fchmod"), "POSIX permissions")
+    def test_save_applies_umask(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "vfs.img")
+            for umask, mode in ((0o022, 0o644), (0o027, 0o640)):
+                previous = os.umask(umask)
+                try:
+                    self.assertTrue(self.fs.save(image))
+                finally:
+                    os.umask(previous)
+                self.assertEqual(os.stat(image).st_mode & 0o777, mode)
+
+    def test_concurrent_saves_to_one_path(self):
+        fs = VirtualFileSystem(threadsafe=True)
+        fs.set_quota(10 ** 6)
+        for i in range(50):
+            fs.create_file(f"/f{i}.txt", "x" * 1000)
+        errors = []
+
+        def saver():
+            try:
+                for _ in range(10):
+                    fs.save(image)
+            except Exception as error:
+                errors.append(error)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            image = os.path.join(tmp, "vfs.img")
+            threads = [threading.Thread(target=saver) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(tmp), ["vfs.img"])
+            loaded = VirtualFileSystem()
+            self.assertTrue(loaded.load(image))
+            self.assertEqual(loaded.disk_usage(), 50_000)
+
+
+    # ==================== JOURNAL ====================
+
+    def _journal_path(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        return os.path.join(tmp.name, "vfs.journal")
+
+    def test_journal_recovers_mutations(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        self.assertTrue(fs.open_journal(path, fsync="always"))
+        fs.set_quota(1000)
+        fs.mkdir_p("/a/b")
+        fs.create_file("/a/b/x.txt", "hello")
+        fs.append("/a/b/x.txt", "!")
+        fs.copy("/a", "/c")
+        fs.move("/c", "/d")
+        fs.chmod("/d/b/x.txt", "r")
+        fs.symlink("/a/b", "/link")
+        fs.delete("/a/b/x.txt")
+        # No close_journal: recover as after a crash
+        recovered = VirtualFileSystem()
+        self.assertTrue(recovered.open_journal(path))
+        self.assertEqual(recovered.tree("/"), fs.tree("/"))
+        self.assertEqual(recovered.read_file("/link/../../d/b/x.txt"), "hello!")
+        self.assertFalse(recovered.write_file("/d/b/x.txt", "x"))
+        self.assertEqual(recovered.quota, 1000)
+
+    def test_journal_records_only_successes_and_absolute_paths(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="always")
+        fs.mkdir("/home")
+        size = os.path.getsize(path)
+        self.assertFalse(fs.mkdir("/home"))
+        self.assertFalse(fs.write_file("/missing", "x"))
+        self.assertEqual(os.path.getsize(path), size)
+        fs.cd("/home")
+        fs.create_file("notes.txt", "x")
+        fs.cd("/")
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path)
+        self.assertEqual(recovered.read_file("/home/notes.txt"), "x")
+
+    def test_journal_refuses_unloggable_arguments_before_mutating(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="always")
+        with self.assertRaises(TypeError):
+            fs.set_quota(fractions.Fraction(10 ** 6))
+        self.assertEqual(fs.quota, 100)
+        self.assertTrue(fs.set_quota(1e6))
+        fs.create_file("/a.txt", "x" * 1000)
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path)
+        self.assertEqual(recovered.quota, 10 ** 6)
+        self.assertEqual(recovered.read_file("/a.txt"), "x" * 1000)
+
+    def test_journal_group_commit(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="group", group_size=3, group_seconds=60)
+        fs.create_file("/a", "")
+        fs.create_file("/b", "")
+        self.assertEqual(os.path.getsize(path), 0)
+        fs.create_file("/c", "")
+        grouped = os.path.getsize(path)
+        self.assertGreater(grouped, 0)
+        fs.create_file("/d", "")
+        self.assertEqual(os.path.getsize(path), grouped)
+        self.assertTrue(fs.flush_journal())
+        self.assertGreater(os.path.getsize(path), grouped)
+        with self.assertRaises(ValueError):
+            VirtualFileSystem().open_journal(self._journal_path(), fsync="sometimes")
+
+    def test_journal_writes_lone_record_after_group_seconds(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="group", group_size=64, group_seconds=0.05)
+        fs.create_file("/a", "x")
+        self.assertEqual(os.path.getsize(path), 0)
+        deadline = time.monotonic() + 5
+        while os.path.getsize(path) == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path)
+        self.assertEqual(recovered.read_file("/a"), "x")
+        recovered.close_journal()
+        fs.close_journal()
+
+    def test_journal_flushed_at_exit(self):
+        path = self._journal_path()
+        script = ("import sys; from solution import VirtualFileSystem; "
+                  "fs = VirtualFileSystem(); "
+                  "fs.open_journal(sys.argv[1], group_seconds=60); "
+                  "fs.create_file('/a', 'x')")
+        subprocess.run([sys.executable, "-c", script, path], check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path)
+        self.assertEqual(recovered.read_file("/a"), "x")
+        recovered.close_journal()
+
+    def test_journal_ignores_torn_tail(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="always")
+        fs.create_file("/a.txt", "kept")
+        intact = os.path.getsize(path)
+        with open(path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00torn")
+        recovered = VirtualFileSystem()
+        self.assertTrue(recovered.open_journal(path, fsync="always"))
+        self.assertEqual(os.path.getsize(path), intact)
+        recovered.create_file("/b.txt", "after")
+        again = VirtualFileSystem()
+        again.open_journal(path)
+        self.assertEqual(again.ls("/"), ["a.txt", "b.txt"])
+
+    def test_journal_batches_and_transactions(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="always")
+        fs.apply_ops([("mkdir_p", "/logs"), ("create_file", "/logs/a.log", "x")])
+        fs.begin()
+        fs.create_file("/undone", "")
+        fs.rollback()
+        fs.begin()
+        fs.create_file("/open", "")
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path, fsync="always")
+        self.assertEqual(recovered.ls("/"), ["logs"])
+        self.assertEqual(recovered.read_file("/logs/a.log"), "x")
+        # The open transaction stays rolled back on the next recovery too
+        recovered.create_file("/later", "")
+        again = VirtualFileSystem()
+        again.open_journal(path)
+        self.assertEqual(again.ls("/"), ["logs", "later"])
+
+    def test_journal_compaction_bounds_log(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="always", max_bytes=200)
+        fs.set_quota(10 ** 6)
+        for i in range(100):
+            fs.create_file(f"/f{i}", "x" * i)
+            self.assertLessEqual(os.path.getsize(path), 300)
+        self.assertTrue(os.path.exists(path + ".img"))
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path)
+        self.assertEqual(recovered.disk_usage(), fs.disk_usage())
+        self.assertEqual(recovered.read_file("/f99"), "x" * 99)
+
+    def test_journal_skips_records_already_checkpointed(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem()
+        fs.open_journal(path, fsync="always")
+        fs.create_file("/a.txt", "a")
+        fs.append("/a.txt", "b")
+        with open(path, "rb") as f:
+            journal = f.read()
+        self.assertTrue(fs.checkpoint())
+        self.assertEqual(os.path.getsize(path), 0)
+        # A crash before the journal was emptied leaves the old records
+        with open(path, "wb") as f:
+            f.write(journal)
+        recovered = VirtualFileSystem()
+        recovered.open_journal(path)
+        self.assertEqual(recovered.read_file("/a.txt"), "ab")
+
+    def test_journal_close_and_load(self):
+        path = self._journal_path()
+        fs = VirtualFileSystem(binary=True)
+        fs.open_journal(path)
+        self.assertFalse(fs.open_journal(path))
+        fs.create_file("/blob", b"\x00\x01")
+        self.assertTrue(fs.close_journal())
+        self.assertFalse(fs.close_journal())
+        fs.create_file("/unlogged", b"")
+        self.assertFalse(VirtualFileSystem().open_journal(path))
+        recovered = VirtualFileSystem(binary=True)
+        recovered.open_journal(path)
+        self.assertEqual(recovered.ls("/"), ["blob"])
+        image = path + ".other"
+        fs.save(image)
+        recovered.load(image)
+        again = VirtualFileSystem(binary=True)
+        again.open_journal(path)
+        self.assertEqual(again.ls("/"), ["blob", "unlogged"])
+
+
+    # ==================== DEDUPE ====================
+
+    def test_dedupe_shares_identical_contents(self):
+        fs = VirtualFileSystem(dedupe=True)
+        fs.set_quota(1000)
+        template = "config = 1\n" * 5
+        fs.create_file("/a.conf", template)
+        fs.create_file("/b.conf", "".join(list(template)))
+        self.assertIs(fs.read_file("/a.conf"), fs.read_file("/b.conf"))
+        self.assertEqual(fs.disk_usage(), 110)
+        self.assertEqual(fs.disk_usage(physical=True), 55)
+        fs.write_file("/b.conf", "other")
+        self.assertEqual(fs.disk_usage(physical=True), 60)
+        fs.delete("/a.conf")
+        fs.delete("/b.conf")
+        self.assertEqual(fs.disk_usage(physical=True), 0)
+        self.assertEqual(fs.blobs.blobs, {})
+
+    def test_dedupe_copy_costs_no_physical_bytes(self):
+        fs = VirtualFileSystem(dedupe=True)
+        fs.set_quota(1000)
+        fs.mkdir("/src")
+        fs.create_file("/src/a.txt", "x" * 100)
+        fs.copy("/src", "/dst")
+        self.assertEqual(fs.disk_usage(), 200)
+        self.assertEqual(fs.disk_usage(physical=True), 100)
+        fs.write_file("/dst/a.txt", "y" * 100)
+        self.assertEqual(fs.disk_usage(physical=True), 200)
+        fs.write_file("/dst/a.txt", "x" * 100)
+        self.assertEqual(fs.disk_usage(physical=True), 100)
+
+    def test_dedupe_appended_files_are_kept_apart(self):
+        fs = VirtualFileSystem(dedupe=True)
+        fs.create_file("/a", "abc")
+        fs.create_file("/b", "abc")
+        fs.append("/b", "d")
+        self.assertEqual(fs.disk_usage(physical=True), 7)
+        self.assertIsNone(fs._node("/b").blob)
+        fs.append("/b", "e")
+        fs.write_file("/b", "abc")
+        self.assertEqual(fs.disk_usage(physical=True), 3)
+        self.assertIs(fs._node("/b").blob, fs._node("/a").blob)
+
+    def test_dedupe_across_snapshots_and_batches(self):
+        fs = VirtualFileSystem(dedupe=True, binary=True)
+        fs.set_quota(1000)
+        fs.apply_ops([("mkdir_p", "/d"), ("create_file", "/d/a", b"blob"), ("create_file", "/d/b", b"blob")])
+        self.assertEqual(fs.disk_usage(physical=True), 4)
+        snap = fs.snapshot()
+        snap.write_file("/d/a", b"changed")
+        self.assertEqual(fs.disk_usage(physical=True), 11)
+        snap.close()
+        self.assertEqual(fs.disk_usage(physical=True), 4)
+
+    def test_physical_usage_needs_dedupe(self):
+        self.fs.create_file("/a", "abc")
+        self.assertIsNone(self.fs.disk_usage(physical=True))
+        self.assertEqual(self.fs.disk_usage(), 3)
+
+
 
 
 if __name__ == '__main__':